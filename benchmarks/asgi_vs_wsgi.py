@@ -0,0 +1,162 @@
+"""Сравнение пропускной способности WSGI- и ASGI-путей.
+
+Поднимает проект дважды — синхронные представления под WSGI-сервером
+(gunicorn с потоками, если установлен, иначе многопоточный runserver) и
+асинхронные представления (QUOTES_ASYNC_VIEWS=True) под uvicorn — и
+нагружает одни и те же адреса одинаковым числом параллельных клиентов.
+
+Запуск из корня проекта (нужны применённые миграции и хотя бы одна цитата):
+
+    pip install uvicorn gunicorn
+    python benchmarks/asgi_vs_wsgi.py --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_PATHS = ['/', '/popular/']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wsgi_command(port, workers, threads):
+    if importlib.util.find_spec('gunicorn'):
+        return [
+            sys.executable, '-m', 'gunicorn', 'quote_project.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+            '--threads', str(threads), '--log-level', 'warning',
+        ]
+    return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+
+
+def asgi_command(port, workers):
+    return [
+        sys.executable, '-m', 'uvicorn', 'quote_project.asgi:application',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+        '--log-level', 'warning', '--no-access-log',
+    ]
+
+
+def wait_for_port(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Сервер не поднялся на порту {port}')
+
+
+async def fetch(port, path):
+    """Один GET-запрос; возвращает HTTP-статус"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(
+        f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.encode()
+    )
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(data.split(b' ', 2)[1]) if data else 0
+
+
+async def drive(port, path, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                status = await fetch(port, path)
+            except OSError:
+                status = 0
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    return latencies, errors, elapsed
+
+
+def summarize(latencies, errors, elapsed):
+    if not latencies:
+        return {'rps': 0.0, 'p50_ms': None, 'p99_ms': None, 'errors': errors}
+    ordered = sorted(latencies)
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(ordered) * 1000,
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+        'errors': errors,
+    }
+
+
+def run_server(command, env, port, paths, args):
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env)
+    try:
+        wait_for_port(port)
+        results = {}
+        for path in paths:
+            results[path] = summarize(*asyncio.run(
+                drive(port, path, args.concurrency, args.duration)
+            ))
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8, help='Потоков на WSGI-воркер')
+    parser.add_argument('--path', action='append', dest='paths', help='Адрес для нагрузки')
+    args = parser.parse_args()
+    paths = args.paths or DEFAULT_PATHS
+
+    if not importlib.util.find_spec('uvicorn'):
+        parser.error('Для ASGI-прогона нужен uvicorn: pip install uvicorn')
+
+    env = dict(os.environ, DEBUG='False', ALLOWED_HOSTS='127.0.0.1')
+    port = free_port()
+    wsgi = run_server(
+        wsgi_command(port, args.workers, args.threads),
+        dict(env, QUOTES_ASYNC_VIEWS='False'), port, paths, args
+    )
+    port = free_port()
+    asgi = run_server(
+        asgi_command(port, args.workers),
+        dict(env, QUOTES_ASYNC_VIEWS='True'), port, paths, args
+    )
+
+    print(f'{"path":<16}{"server":<8}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for path in paths:
+        for name, results in (('wsgi', wsgi), ('asgi', asgi)):
+            row = results[path]
+            p50 = f'{row["p50_ms"]:.1f}' if row['p50_ms'] is not None else '-'
+            p99 = f'{row["p99_ms"]:.1f}' if row['p99_ms'] is not None else '-'
+            print(f'{path:<16}{name:<8}{row["rps"]:>10.1f}{p50:>10}{p99:>10}{row["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
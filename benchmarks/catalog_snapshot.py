@@ -0,0 +1,122 @@
+"""Память и скорость снимка каталога (quotes/catalog.py).
+
+Для каждого размера каталога создает временную базу, наполняет ее как
+benchmarks/suite.py и замеряет:
+
+- время полной загрузки снимка и память на цитату (tracemalloc: записи,
+  словарь по id, сэмплер весов и тексты);
+- выбор случайной цитаты из снимка и из базы (QuoteSampler.choice);
+- догон одного изменения цитаты по журналу версий.
+
+Запуск из корня проекта:
+
+    python benchmarks/catalog_snapshot.py --sizes 10000,100000,1000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def per_call_us(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def worker_main(args):
+    sys.path.insert(0, str(BASE_DIR))
+    sys.path.insert(0, str(BASE_DIR / 'benchmarks'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quote_project.settings')
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+
+    from quotes.catalog import catalog_snapshot
+    from quotes.models import Quote
+    from quotes.sampling import quote_sampler
+    from suite import seed
+
+    call_command('migrate', verbosity=0)
+    seed(args.size)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    catalog_snapshot.sync()
+    load_seconds = time.perf_counter() - started
+    snapshot_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    texts = Quote.objects.values_list('text', flat=True)
+    text_bytes = sum(sys.getsizeof(text) for text in texts.iterator(chunk_size=2000))
+
+    quote = Quote.objects.order_by('?').first()
+
+    def edit_and_catch_up():
+        quote.weight = quote.weight % 10 + 1
+        quote.save(update_fields=['weight'])
+        catalog_snapshot.sync()
+
+    print(json.dumps({
+        'size': args.size,
+        'load_seconds': load_seconds,
+        'bytes_per_quote': snapshot_bytes / args.size,
+        'text_bytes_per_quote': text_bytes / args.size,
+        'snapshot_choice_us': per_call_us(catalog_snapshot.choice, args.iterations),
+        'db_choice_us': per_call_us(quote_sampler.choice, args.iterations),
+        'catch_up_us': per_call_us(edit_and_catch_up, 200),
+        'reloads': catalog_snapshot.reloads,
+    }))
+
+
+def run_size(size, args):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            SQLITE_PATH=str(Path(directory) / f'snapshot_{size}.sqlite3'),
+            QUOTES_CATALOG_SNAPSHOT='True',
+        )
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker', '--size', str(size), '--iterations', str(args.iterations)],
+            cwd=BASE_DIR, env=env, check=True, stdout=subprocess.PIPE, text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    print(
+        f'{"quotes":>10}{"load s":>9}{"B/quote":>10}{"text B":>9}'
+        f'{"snap us":>10}{"db us":>10}{"catch-up us":>13}{"reloads":>9}'
+    )
+    for size in args.sizes.split(','):
+        row = run_size(int(size), args)
+        print(
+            f'{row["size"]:>10}{row["load_seconds"]:>9.2f}{row["bytes_per_quote"]:>10.0f}'
+            f'{row["text_bytes_per_quote"]:>9.0f}{row["snapshot_choice_us"]:>10.1f}'
+            f'{row["db_choice_us"]:>10.1f}{row["catch_up_us"]:>13.1f}{row["reloads"]:>9}'
+        )
+
+
+if __name__ == '__main__':
+    main()
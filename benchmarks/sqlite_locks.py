@@ -0,0 +1,139 @@
+"""Ошибки "database is locked" под параллельной записью в SQLite.
+
+Создает временную базу, запускает потоки, которые одновременно
+голосуют, сбрасывают просмотры, сохраняют сессии, добавляют, читают и
+правят цитаты, и считает ошибки блокировок. Прогон выполняется дважды, в
+отдельных процессах: с настройками SQLite по умолчанию
+(QUOTES_SQLITE_TUNING=False) и с профилем из settings.py.
+
+Запуск из корня проекта:
+
+    python benchmarks/sqlite_locks.py --threads 16 --duration 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def worker_main(args):
+    """Нагрузка внутри одного процесса с уже выбранными настройками"""
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quote_project.settings')
+    import django
+    django.setup()
+
+    import random
+
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.core.management import call_command
+    from django.db import OperationalError, connection, transaction
+
+    from quotes.counters import view_counter
+    from quotes.models import Quote, Source
+    from quotes.votes import apply_vote, ledger_entry
+
+    call_command('migrate', verbosity=0)
+    sources = [Source.objects.create(name=f'Lock source {i}', type='BOOK') for i in range(args.threads * 50)]
+    quote_ids = [
+        Quote.objects.create(text=f'Lock quote {i}', source=sources[i]).id
+        for i in range(50)
+    ]
+
+    stats = {'ok': 0, 'locked': 0, 'other_errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def edit_quote(quote_id):
+        # Чтение и запись в одной транзакции, как при правке через админку
+        with transaction.atomic():
+            quote = Quote.objects.get(pk=quote_id)
+            quote.weight = quote.weight % 10 + 1
+            quote.save()
+
+    def operations(rng, thread_id):
+        counter = 0
+        while True:
+            counter += 1
+            quote_id = rng.choice(quote_ids)
+            yield lambda: apply_vote(
+                quote_id, 1, 0, ledger=ledger_entry(f'visitor{thread_id}', quote_id, 'like')
+            )
+            yield lambda: (view_counter.record(quote_id), view_counter.flush())
+            yield lambda: SessionStore().save(must_create=True)
+            yield lambda: Quote.objects.create(
+                text=f'Lock new {thread_id} {counter}',
+                source=sources[thread_id * 50 + counter % 50],
+            ).delete()
+            yield lambda: list(Quote.objects.order_by('-likes')[:10])
+            yield lambda: edit_quote(quote_id)
+
+    def run(thread_id):
+        rng = random.Random(thread_id)
+        local = {'ok': 0, 'locked': 0, 'other_errors': 0}
+        for operation in operations(rng, thread_id):
+            if time.monotonic() >= deadline:
+                break
+            try:
+                operation()
+                local['ok'] += 1
+            except OperationalError as e:
+                local['locked' if 'locked' in str(e) else 'other_errors'] += 1
+            except Exception:
+                local['other_errors'] += 1
+        connection.close()
+        with lock:
+            for key, value in local.items():
+                stats[key] += value
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats['ops_per_second'] = round(stats['ok'] / args.duration, 1)
+    print(json.dumps(stats))
+
+
+def run_profile(tuned, args):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            SQLITE_PATH=str(Path(directory) / 'locks.sqlite3'),
+            QUOTES_SQLITE_TUNING='True' if tuned else 'False',
+            CONN_MAX_AGE='0',
+        )
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker', '--threads', str(args.threads),
+             '--duration', str(args.duration)],
+            cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    print(f'{"profile":<10}{"ok ops":>10}{"ops/s":>10}{"locked":>10}{"other":>10}')
+    for name, tuned in (('default', False), ('tuned', True)):
+        row = run_profile(tuned, args)
+        print(f'{name:<10}{row["ok"]:>10}{row["ops_per_second"]:>10}{row["locked"]:>10}{row["other_errors"]:>10}')
+
+
+if __name__ == '__main__':
+    main()
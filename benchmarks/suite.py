@@ -0,0 +1,431 @@
+"""Нагрузочный прогон всех адресов на синтетических каталогах.
+
+Для каждого размера каталога (по умолчанию 1k, 100k и 1M цитат)
+создается временная база SQLite, заполняется синтетическими цитатами, и
+каждый адрес нагружается параллельными клиентами дважды:
+
+- in-process — тестовым клиентом Django из нескольких потоков, число
+  SQL-запросов считается на каждый запрос;
+- http — настоящим сервером (gunicorn, если установлен, иначе runserver)
+  и асинхронным генератором нагрузки; число запросов берется из
+  /metrics/ с QUOTES_METRICS_SAMPLE_RATE=1.
+
+Отдельно замеряется get_random_quote: время построения индекса весов и
+одной выборки. Итог печатается таблицей и сохраняется в JSON для
+сравнения прогонов.
+
+Запуск из корня проекта:
+
+    python benchmarks/suite.py --sizes 1000,100000 --duration 3 --concurrency 8
+    python benchmarks/suite.py --compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import re
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BASE_DIR / 'benchmarks' / 'results'
+ENDPOINTS = ['random', 'popular', 'api_random', 'search', 'like', 'add']
+METRIC_VIEWS = {
+    'random': 'random_quote', 'popular': 'popular_quotes', 'api_random': 'api_random_quotes',
+    'search': 'search_quotes', 'like': 'like_quote', 'add': 'add_quote',
+}
+SEARCH_WORDS = ['мудрость', 'жизнь', 'время', 'любовь', 'свобода', 'путь', 'истина', 'мир']
+
+
+def summarize(latencies, errors, elapsed, queries=None):
+    result = {'requests': len(latencies), 'errors': errors, 'rps': len(latencies) / elapsed if elapsed else 0.0}
+    if latencies:
+        ordered = sorted(latencies)
+        result['p50_ms'] = statistics.median(ordered) * 1000
+        result['p99_ms'] = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+    else:
+        result['p50_ms'] = result['p99_ms'] = None
+    if queries:
+        result['queries_per_request'] = sum(queries) / len(queries)
+    return result
+
+
+# --- Наполнение каталога (внутри процесса-исполнителя) ---
+
+def seed(size, batch_size=10000):
+    from django.db import transaction
+
+    from quotes.models import MAX_QUOTES_PER_SOURCE, Quote, Source, text_hash
+    from quotes.search import get_backend
+
+    rng = random.Random(size)
+    started = time.perf_counter()
+    sources_needed = -(-size // MAX_QUOTES_PER_SOURCE)
+    for offset in range(0, sources_needed, batch_size):
+        with transaction.atomic():
+            Source.objects.bulk_create([
+                Source(name=f'Источник {i}', type=rng.choice(['MOV', 'BOOK', 'SONG', 'OTHER']))
+                for i in range(offset, min(offset + batch_size, sources_needed))
+            ])
+    source_ids = list(Source.objects.order_by('id').values_list('id', flat=True))
+
+    for offset in range(0, size, batch_size):
+        quotes = []
+        for i in range(offset, min(offset + batch_size, size)):
+            text = f'{rng.choice(SEARCH_WORDS).capitalize()} — это {rng.choice(SEARCH_WORDS)} номер {i}'
+            quotes.append(Quote(
+                text=text, text_hash=text_hash(text),
+                source_id=source_ids[i // MAX_QUOTES_PER_SOURCE],
+                weight=rng.randint(1, 10), likes=rng.randint(0, 1000), views=rng.randint(0, 10000),
+            ))
+        with transaction.atomic():
+            Quote.objects.bulk_create(quotes)
+    Source.objects.update(quote_count=MAX_QUOTES_PER_SOURCE)
+    get_backend().rebuild()
+    return time.perf_counter() - started
+
+
+def request_plan(rng, quote_ids, counter):
+    """(метод, путь, данные формы) для очередного запроса к адресу"""
+    return {
+        'random': lambda: ('GET', '/', None),
+        'popular': lambda: ('GET', '/popular/', None),
+        'api_random': lambda: ('GET', '/api/random/?n=5', None),
+        'search': lambda: ('GET', '/search/?' + urlencode({'q': rng.choice(SEARCH_WORDS)}), None),
+        'like': lambda: ('POST', f'/like/{rng.choice(quote_ids)}/', None),
+        'add': lambda: ('POST', '/add/', {
+            'text': f'Новая цитата {threading.get_ident()} {next(counter)} {rng.random()}',
+            'source_name': f'Новый источник {threading.get_ident()} {next(counter)}',
+            'source_type': 'OTHER', 'weight': '1',
+        }),
+    }
+
+
+def sample_quote_ids(limit=5000):
+    from quotes.models import Quote
+    return list(Quote.objects.order_by('?').values_list('id', flat=True)[:limit])
+
+
+def run_in_process(endpoint, quote_ids, concurrency, duration):
+    from itertools import count
+
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    latencies, queries = [], []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    counter = count()
+
+    def client_loop(seed_value):
+        nonlocal errors
+        rng = random.Random(seed_value)
+        client = Client()
+        plan = request_plan(rng, quote_ids, counter)[endpoint]
+        local_latencies, local_queries, local_errors = [], [], 0
+        while time.monotonic() < deadline:
+            method, path, data = plan()
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                response = client.post(path, data or {}) if method == 'POST' else client.get(path)
+            elapsed = time.perf_counter() - started
+            if response.status_code in (200, 302):
+                local_latencies.append(elapsed)
+                local_queries.append(len(context.captured_queries))
+            else:
+                local_errors += 1
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            queries.extend(local_queries)
+            errors += local_errors
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors, time.monotonic() - started, queries)
+
+
+# --- Нагрузка по HTTP ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Сервер не поднялся на порту {port}')
+
+
+def server_command(port, threads):
+    if importlib.util.find_spec('gunicorn'):
+        # Один воркер: метрики запросов хранятся в памяти процесса
+        return [
+            sys.executable, '-m', 'gunicorn', 'quote_project.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', '1', '--threads', str(threads),
+            '--log-level', 'warning',
+        ]
+    return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+
+
+async def http_request(port, method, path, body=b'', headers=None):
+    """Один запрос по HTTP/1.1; возвращает (статус, заголовки, тело)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    lines = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', 'Connection: close']
+    for name, value in (headers or {}).items():
+        lines.append(f'{name}: {value}')
+    if method == 'POST':
+        lines.append(f'Content-Length: {len(body)}')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    head, _, payload = data.partition(b'\r\n\r\n')
+    head_lines = head.decode('latin-1').split('\r\n')
+    status = int(head_lines[0].split(' ', 2)[1]) if head_lines and head_lines[0] else 0
+    return status, head_lines[1:], payload
+
+
+async def csrf_credentials(port):
+    """Cookie и токен CSRF для POST /add/"""
+    _, headers, body = await http_request(port, 'GET', '/add/')
+    cookie = next(
+        line.split(':', 1)[1].split(';', 1)[0].strip()
+        for line in headers if line.lower().startswith('set-cookie:') and 'csrftoken=' in line
+    )
+    token = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', body).group(1).decode()
+    return cookie, token
+
+
+async def drive_http(port, endpoint, quote_ids, concurrency, duration):
+    from itertools import count
+
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    counter = count()
+
+    async def client(seed_value):
+        nonlocal errors
+        rng = random.Random(seed_value)
+        plan = request_plan(rng, quote_ids, counter)[endpoint]
+        cookie = token = None
+        if endpoint == 'add':
+            cookie, token = await csrf_credentials(port)
+        while time.monotonic() < deadline:
+            method, path, data = plan()
+            headers, body = {}, b''
+            if data is not None:
+                body = urlencode({**data, 'csrfmiddlewaretoken': token}).encode()
+                headers = {'Content-Type': 'application/x-www-form-urlencoded', 'Cookie': cookie}
+            started = time.perf_counter()
+            try:
+                status, _, _ = await http_request(port, method, path, body, headers)
+            except OSError:
+                status = 0
+            if status in (200, 302):
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return latencies, errors, time.monotonic() - started
+
+
+async def scrape_queries(port, token):
+    """{представление: (сумма запросов, число замеров)} из /metrics/"""
+    _, _, body = await http_request(port, 'GET', '/metrics/', headers={'Authorization': f'Bearer {token}'})
+    totals = {}
+    for line in body.decode().splitlines():
+        match = re.match(r'quotes_request_queries_(sum|count)\{view="([^"]+)"\} (\S+)', line)
+        if match:
+            kind, view, value = match.groups()
+            totals.setdefault(view, [0.0, 0.0])[kind == 'count'] = float(value)
+    return totals
+
+
+def run_http(quote_ids, endpoints, concurrency, duration):
+    port = free_port()
+    token = secrets.token_hex(16)
+    env = dict(os.environ, QUOTES_METRICS_SAMPLE_RATE='1', QUOTES_METRICS_TOKEN=token)
+    process = subprocess.Popen(
+        server_command(port, concurrency), cwd=BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        results = {}
+        for endpoint in endpoints:
+            before = asyncio.run(scrape_queries(port, token))
+            row = summarize(*asyncio.run(drive_http(port, endpoint, quote_ids, concurrency, duration)))
+            after = asyncio.run(scrape_queries(port, token))
+            view = METRIC_VIEWS[endpoint]
+            total, samples = after.get(view, [0.0, 0.0])
+            previous_total, previous_samples = before.get(view, [0.0, 0.0])
+            if samples > previous_samples:
+                row['queries_per_request'] = (total - previous_total) / (samples - previous_samples)
+            results[endpoint] = row
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def measure_sampler(iterations=2000):
+    from quotes.sampling import quote_sampler
+    from quotes.views import get_random_quote
+
+    quote_sampler.reset()
+    started = time.perf_counter()
+    quote_sampler.index
+    build_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        get_random_quote()
+    draw_us = (time.perf_counter() - started) / iterations * 1e6
+    return {'index_build_ms': build_ms, 'get_random_quote_us': draw_us}
+
+
+def worker_main(args):
+    """Один размер каталога; база и настройки уже заданы в окружении"""
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quote_project.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    result = {'size': args.size, 'seed_seconds': seed(args.size)}
+    quote_ids = sample_quote_ids()
+    result['sampler'] = measure_sampler()
+    endpoints = args.endpoints.split(',')
+
+    result['in_process'] = {
+        endpoint: run_in_process(endpoint, quote_ids, args.concurrency, args.duration)
+        for endpoint in endpoints
+    }
+    if not args.skip_http:
+        from django.db import connections
+        connections.close_all()
+        result['http'] = run_http(quote_ids, endpoints, args.concurrency, args.duration)
+    print(json.dumps(result))
+
+
+def run_size(size, args):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            SQLITE_PATH=str(Path(directory) / f'bench_{size}.sqlite3'),
+            QUOTES_CACHE_DIR=str(Path(directory) / 'cache'),
+            DEBUG='False', ALLOWED_HOSTS='127.0.0.1,testserver',
+            QUOTES_METRICS_SAMPLE_RATE='0',
+        )
+        command = [
+            sys.executable, __file__, '--worker', '--size', str(size),
+            '--duration', str(args.duration), '--concurrency', str(args.concurrency),
+            '--endpoints', args.endpoints,
+        ]
+        if args.skip_http:
+            command.append('--skip-http')
+        output = subprocess.run(
+            command, cwd=BASE_DIR, env=env, check=True, stdout=subprocess.PIPE, text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_report(runs):
+    for run in runs:
+        sampler = run['sampler']
+        print(
+            f'\n{run["size"]} цитат: наполнение {run["seed_seconds"]:.1f} с, '
+            f'индекс весов {sampler["index_build_ms"]:.1f} мс, '
+            f'get_random_quote {sampler["get_random_quote_us"]:.1f} мкс'
+        )
+        print(f'{"mode":<12}{"endpoint":<12}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"queries":>10}{"errors":>8}')
+        for mode in ('in_process', 'http'):
+            for endpoint, row in run.get(mode, {}).items():
+                p50 = f'{row["p50_ms"]:.1f}' if row['p50_ms'] is not None else '-'
+                p99 = f'{row["p99_ms"]:.1f}' if row['p99_ms'] is not None else '-'
+                queries = row.get('queries_per_request')
+                queries = f'{queries:.1f}' if queries is not None else '-'
+                print(f'{mode:<12}{endpoint:<12}{row["rps"]:>10.1f}{p50:>10}{p99:>10}{queries:>10}{row["errors"]:>8}')
+
+
+def compare(before_path, after_path):
+    """Изменение req/s и p99 между двумя сохраненными прогонами"""
+    before = {run['size']: run for run in json.loads(Path(before_path).read_text())['runs']}
+    after = {run['size']: run for run in json.loads(Path(after_path).read_text())['runs']}
+    print(f'{"size":<10}{"mode":<12}{"endpoint":<12}{"req/s Δ%":>10}{"p99 Δ%":>10}')
+    for size in sorted(set(before) & set(after)):
+        for mode in ('in_process', 'http'):
+            for endpoint, new in after[size].get(mode, {}).items():
+                old = before[size].get(mode, {}).get(endpoint)
+                if not old or not old['rps'] or not old['p99_ms'] or new['p99_ms'] is None:
+                    continue
+                rps = (new['rps'] / old['rps'] - 1) * 100
+                p99 = (new['p99_ms'] / old['p99_ms'] - 1) * 100
+                print(f'{size:<10}{mode:<12}{endpoint:<12}{rps:>+10.1f}{p99:>+10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--duration', type=float, default=3.0, help='Секунд нагрузки на адрес')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--skip-http', action='store_true', help='Только тестовый клиент')
+    parser.add_argument('--output', help='Файл JSON; по умолчанию benchmarks/results/<время>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.worker:
+        worker_main(args)
+        return
+
+    runs = [run_size(int(size), args) for size in args.sizes.split(',')]
+    print_report(runs)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / time.strftime('%Y%m%d-%H%M%S.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'args': {k: v for k, v in vars(args).items() if k not in ('worker', 'size', 'compare')},
+        'runs': runs,
+    }, ensure_ascii=False, indent=2))
+    print(f'\nРезультаты сохранены в {output}')
+
+
+if __name__ == '__main__':
+    main()
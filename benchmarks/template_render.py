@@ -0,0 +1,126 @@
+"""Время рендера шаблонов и объем ответа на проводе.
+
+Сравнивает загрузчики шаблонов (без кэша — шаблон читается и
+компилируется на каждый рендер — и cached.Loader из настроек) и считает
+байты, которые получает клиент:
+
+- inline: HTML плюс CSS/JS, встроенные в каждую страницу (как было);
+- static: HTML со ссылками на статику; CSS/JS скачиваются один раз
+  и дальше берутся из кэша браузера.
+
+Запуск из корня проекта:
+
+    python benchmarks/template_render.py --iterations 2000
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quote_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.template import Context, Engine, engines  # noqa: E402
+from django.template.backends.django import get_installed_libraries  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ASSETS = ['quotes/css/base.css', 'quotes/js/quotes.js']
+STATIC_DIR = BASE_DIR / 'quotes' / 'static'
+
+
+def sample_context():
+    quote = SimpleNamespace(
+        id=1, text='Рукописи не горят. ' * 3, source='Мастер и Маргарита (Книга)',
+        likes=42, dislikes=3, views=1000, weight=5,
+    )
+    return {
+        'random': {
+            'quote': quote, 'user_has_liked': False, 'user_has_disliked': False,
+            'versions': {'catalog': 1, 'counters': 1}, 'fragment_timeout': 600,
+        },
+        'popular': {'quotes': [vars(quote) | {'id': i} for i in range(10)]},
+    }
+
+
+TEMPLATES = {
+    'random': 'quotes/random_quote.html',
+    'popular': 'quotes/popular_quotes.html',
+}
+
+
+def uncached_engine():
+    return Engine(
+        loaders=[
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ],
+        libraries=get_installed_libraries(),
+    )
+
+
+def time_renders(render, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def encoded_sizes(data):
+    sizes = {'raw': len(data), 'gzip': len(gzip.compress(data, compresslevel=9))}
+    if brotli is not None:
+        sizes['br'] = len(brotli.compress(data, quality=11))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--views', type=int, default=10, help='Страниц за один визит')
+    args = parser.parse_args()
+
+    contexts = sample_context()
+    cached = engines['django']
+    plain = uncached_engine()
+    assets = b''.join((STATIC_DIR / name).read_bytes() for name in ASSETS)
+
+    print(f'{"template":<10}{"uncached µs":>14}{"cached µs":>12}')
+    pages = {}
+    for name, template_name in TEMPLATES.items():
+        context = contexts[name]
+        uncached_us = time_renders(
+            lambda: plain.get_template(template_name).render(Context(context)), args.iterations
+        )
+        template = cached.get_template(template_name)
+        cached_us = time_renders(lambda: template.render(context), args.iterations)
+        pages[name] = template.render(context).encode('utf-8')
+        print(f'{name:<10}{uncached_us:>14.1f}{cached_us:>12.1f}')
+
+    encodings = list(encoded_sizes(b'').keys())
+    print()
+    print(f'Байт за визит из {args.views} страниц (первая загрузка статики + HTML)')
+    print(f'{"template":<10}{"mode":<8}' + ''.join(f'{enc:>10}' for enc in encodings))
+    for name, html in pages.items():
+        inline = encoded_sizes(html + assets)
+        linked = encoded_sizes(html)
+        assets_once = {enc: sum(encoded_sizes((STATIC_DIR / a).read_bytes())[enc] for a in ASSETS)
+                       for enc in encodings}
+        inline_row = ''.join(f'{inline[enc] * args.views:>10}' for enc in encodings)
+        static_row = ''.join(f'{linked[enc] * args.views + assets_once[enc]:>10}' for enc in encodings)
+        print(f'{name:<10}{"inline":<8}{inline_row}')
+        print(f'{name:<10}{"static":<8}{static_row}')
+
+
+if __name__ == '__main__':
+    main()
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quote_project.settings')
 
 application = get_asgi_application()
+
+# Снимок каталога (QUOTES_CATALOG_SNAPSHOT) читается до первого запроса
+from quotes.catalog import catalog_snapshot  # noqa: E402
+
+catalog_snapshot.warm_up()
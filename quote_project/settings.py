@@ -27,8 +27,90 @@ DEBUG = os.environ.get('DEBUG', 'False') == 'True'
 
 
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
-SESSION_SAVE_EVERY_REQUEST = True
+# Голоса посетителей хранятся в подписанной cookie (quotes/visitor_votes.py),
+# поэтому сессия сохраняется только при реальных изменениях
+SESSION_SAVE_EVERY_REQUEST = False
 SESSION_COOKIE_AGE = 1209600  
+QUOTES_VOTE_COOKIE_MAX = 300
+
+# Просмотры цитат копятся в памяти процесса и пишутся в базу пачками раз в
+# QUOTES_VIEW_FLUSH_INTERVAL секунд фоновым таймером (см. quotes/counters.py)
+QUOTES_VIEW_FLUSH_INTERVAL = int(os.environ.get('QUOTES_VIEW_FLUSH_INTERVAL', '10'))
+QUOTES_VIEW_FLUSH_TIMER = True
+# Сигнал, по которому процесс сразу пишет просмотры (manage.py flush_views)
+QUOTES_VIEW_FLUSH_SIGNAL = 'SIGUSR2'
+
+# Топ популярных цитат хранится в кэше (см. quotes/leaderboard.py)
+QUOTES_LEADERBOARD_SIZE = 10
+QUOTES_LEADERBOARD_TIEBREAK = ('id',)
+QUOTES_LEADERBOARD_TIMEOUT = 300
+
+# Кэш: локальная память процесса по умолчанию; при нескольких воркерах
+# задайте QUOTES_CACHE_DIR, чтобы версии, топ и страницы были общими.
+# Версии и их журнал живут в отдельном кэше: страницы и фрагменты в
+# 'default' при переполнении вытесняли бы записи журнала. Журнал — кольцо
+# из QUOTES_VERSION_JOURNAL_SIZE ключей на каждую из трех версий, поэтому
+# MAX_ENTRIES этого кэша с запасом его вмещает
+QUOTES_VERSION_CACHE = 'versions'
+QUOTES_VERSION_JOURNAL_SIZE = 1000
+if os.environ.get('QUOTES_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['QUOTES_CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(os.environ['QUOTES_CACHE_DIR'], 'versions'),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'quotes',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'quotes-versions',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+    }
+
+# Готовые страницы (/popular/) и фрагменты карточек цитат; ключи включают
+# версии каталога и счетчиков (см. quotes/versions.py, quotes/page_cache.py)
+QUOTES_PAGE_CACHE_TIMEOUT = 60
+QUOTES_FRAGMENT_CACHE_TIMEOUT = 600
+
+# /popular/ и JSON-адреса отдают ETag/Last-Modified по тем же версиям
+# (quotes/conditional.py); сколько секунд CDN и браузер могут не перепроверять
+QUOTES_HTTP_MAX_AGE = int(os.environ.get('QUOTES_HTTP_MAX_AGE', '0'))
+
+# Метрики запросов (quotes/metrics.py): какая доля запросов замеряется
+# целиком и кто может читать /metrics/ кроме персонала — сборщик с
+# заголовком Authorization: Bearer <QUOTES_METRICS_TOKEN> и адреса из
+# QUOTES_METRICS_ALLOWED_IPS (через запятую). Список адресов по умолчанию
+# пуст: за прокси REMOTE_ADDR у всех запросов — адрес самого прокси
+QUOTES_METRICS_SAMPLE_RATE = float(os.environ.get('QUOTES_METRICS_SAMPLE_RATE', '0.1'))
+QUOTES_METRICS_TOKEN = os.environ.get('QUOTES_METRICS_TOKEN', '')
+QUOTES_METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.environ.get('QUOTES_METRICS_ALLOWED_IPS', '').split(',') if ip.strip()
+]
+
+# Снимок каталога в памяти каждого процесса (quotes/catalog.py): случайные
+# цитаты отдаются без SQL, изменения догоняются по журналу версий в кэше.
+# Для нескольких процессов нужен общий кэш (QUOTES_CACHE_DIR)
+QUOTES_CATALOG_SNAPSHOT = os.environ.get('QUOTES_CATALOG_SNAPSHOT', 'False') == 'True'
+
+# Максимальный размер пачки в /api/random/?n=
+QUOTES_API_MAX_BATCH = 50
+
+# Асинхронные представления (quotes/async_views.py) для запуска под ASGI,
+# например: QUOTES_ASYNC_VIEWS=True uvicorn quote_project.asgi:application
+QUOTES_ASYNC_VIEWS = os.environ.get('QUOTES_ASYNC_VIEWS', 'False') == 'True'
 
 allowed_hosts_str = os.environ.get('ALLOWED_HOSTS', '')
 if allowed_hosts_str:
@@ -58,6 +140,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замер охватывал все остальные middleware
+    'quotes.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,17 +153,25 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'quote_project.urls'
 
+# Шаблоны компилируются один раз на процесс (cached.Loader); в режиме
+# разработки автоперезагрузка сама сбрасывает кэш при правке шаблона
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендера для /metrics/
+        'BACKEND': 'quotes.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -93,10 +185,48 @@ WSGI_APPLICATION = 'quote_project.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Соединение живет между запросами и проверяется перед повторным использованием
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
 
+# Профиль SQLite под параллельную нагрузку; QUOTES_SQLITE_TUNING=False
+# возвращает настройки по умолчанию (для сравнения, см. benchmarks/sqlite_locks.py)
+QUOTES_SQLITE_TUNING = os.environ.get('QUOTES_SQLITE_TUNING', 'True') == 'True'
+if QUOTES_SQLITE_TUNING:
+    DATABASES['default']['OPTIONS'] = {
+        # Транзакция сразу берет блокировку записи и ждет ее по timeout,
+        # а не падает при попытке повысить блокировку посреди транзакции
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    }
+    # Выполняются при каждом новом соединении (quotes/db.py)
+    QUOTES_SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 20000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+else:
+    QUOTES_SQLITE_PRAGMAS = {}
+
+# Реплика для чтения (quotes/routers.py): random_quote, popular_quotes и
+# JSON-адреса читают с нее, записи идут в default. Локально это второй
+# файл SQLite, который догоняет основной командой sync_replica
+if os.environ.get('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['SQLITE_REPLICA_PATH'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['quotes.routers.PrimaryReplicaRouter']
+# Сколько секунд после голоса посетитель читает с основной базы
+QUOTES_REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,6 +263,17 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# Продакшен-режим статики: collectstatic кладет в STATIC_ROOT файлы с
+# хешем в имени и их сжатые копии .gz/.br (quotes/storage.py). Включается
+# переменной QUOTES_PRODUCTION_ASSETS=True и требует collectstatic до запуска
+QUOTES_PRODUCTION_ASSETS = os.environ.get('QUOTES_PRODUCTION_ASSETS', 'False') == 'True'
+if QUOTES_PRODUCTION_ASSETS:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'quotes.storage.CompressedManifestStaticFilesStorage'},
+    }
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,23 +1,105 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Quote, Source
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import Quote, Source, Vote
+
+
+def estimate_table_rows(model, using):
+    """Быстрая оценка числа строк таблицы без COUNT(*) или None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # Верхняя граница: id не переиспользуются, удаленные строки оставляют дыры
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Для большой нефильтрованной таблицы берет оценку вместо COUNT(*)"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            threshold = getattr(settings, 'QUOTES_ADMIN_EXACT_COUNT_LIMIT', 10000)
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > threshold:
+                return estimate
+        return super().count
+
+
+class SourceFilter(admin.SimpleListFilter):
+    """Фильтр по источнику без загрузки всех источников в боковую панель:
+    показывает последние добавленные источники и выбранный; любой другой
+    выбирается ссылкой из колонки «Источник»"""
+    title = 'источник'
+    parameter_name = 'source__id__exact'
+
+    def lookups(self, request, model_admin):
+        limit = getattr(settings, 'QUOTES_ADMIN_SOURCE_FILTER_SIZE', 20)
+        sources = list(Source.objects.order_by('-id')[:limit])
+        selected = self.value()
+        if selected and selected.isdigit() and all(str(s.pk) != selected for s in sources):
+            sources += list(Source.objects.filter(pk=selected))
+        return [(str(source.pk), source.name) for source in sources]
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(source_id=self.value())
+        return queryset
+
 
 @admin.register(Source)
 class SourceAdmin(admin.ModelAdmin):
     list_display = ['name', 'type', 'get_quote_count']
     list_filter = ['type']
     search_fields = ['name']
-    
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     def get_quote_count(self, obj):
-        return obj.quote_set.count()
+        # Денормализованный счетчик: без запроса на каждую строку
+        return obj.quote_count
     get_quote_count.short_description = 'Количество цитат'
+    get_quote_count.admin_order_field = 'quote_count'
 
 @admin.register(Quote)
 class QuoteAdmin(admin.ModelAdmin):
-    list_display = ['text_short', 'source', 'weight', 'views', 'likes', 'dislikes', 'created_at']
-    list_filter = ['source', 'created_at']
+    list_display = ['text_short', 'source_link', 'weight', 'views', 'likes', 'dislikes', 'created_at']
+    list_filter = [SourceFilter, 'created_at']
+    list_select_related = ['source']
     search_fields = ['text', 'source__name']
+    autocomplete_fields = ['source']
     ordering = ['-created_at']
-    
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     def text_short(self, obj):
         return obj.text[:50] + '...' if len(obj.text) > 50 else obj.text
-    text_short.short_description = 'Текст цитаты'
\ No newline at end of file
+    text_short.short_description = 'Текст цитаты'
+
+    def source_link(self, obj):
+        # Клик по источнику фильтрует список по нему
+        return format_html('<a href="?{}={}">{}</a>', SourceFilter.parameter_name, obj.source_id, obj.source)
+    source_link.short_description = 'Источник'
+    source_link.admin_order_field = 'source__name'
+
+@admin.register(Vote)
+class VoteAdmin(admin.ModelAdmin):
+    list_display = ['visitor', 'quote', 'value', 'updated_at']
+    list_filter = ['value']
+    # str(quote) выводит и источник
+    list_select_related = ['quote__source']
+    raw_id_fields = ['quote']
+    search_fields = ['visitor']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
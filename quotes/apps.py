@@ -1,6 +1,24 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class QuotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quotes'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .counters import view_counter
+        from .db import configure_sqlite
+        from .metrics import instrument_connection
+
+        connection_created.connect(configure_sqlite, dispatch_uid='quotes.configure_sqlite')
+        connection_created.connect(instrument_connection, dispatch_uid='quotes.instrument_connection')
+
+        # Не теряем накопленные просмотры при остановке процесса
+        atexit.register(view_counter.shutdown)
+        # ...и сбрасываем их по сигналу (manage.py flush_views <pid>)
+        view_counter.install_signal_handler()
@@ -0,0 +1,103 @@
+"""Асинхронные (ASGI) версии представлений для чтения и голосования.
+
+Используются вместо quotes.views, когда QUOTES_ASYNC_VIEWS = True, и
+работают через асинхронный ORM и кэш Django, не занимая поток
+из пула sync_to_async на каждый запрос.
+"""
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.views.decorators.csrf import csrf_exempt
+
+from .catalog import catalog_snapshot
+from .conditional import versioned
+from .counters import view_counter
+from .leaderboard import leaderboard
+from .page_cache import page_cache
+from .routers import pin_to_primary, reads_from_replica
+from .sampling import quote_sampler
+from .versions import COUNTERS, versions
+from .visitor_votes import VisitorVotes
+from .votes import DISLIKE, LIKE, aapply_vote, ledger_entry, vote_transition
+
+
+async def get_random_quote(exclude_id=None):
+    """Вспомогательная функция для получения случайной цитаты"""
+    if catalog_snapshot.enabled:
+        return await catalog_snapshot.achoice(exclude_id=exclude_id)
+    return await quote_sampler.achoice(exclude_id=exclude_id)
+
+
+@reads_from_replica
+async def random_quote(request):
+    quote = await get_random_quote()
+
+    if quote:
+        await view_counter.arecord(quote.id)
+        quote.views += await view_counter.apending(quote.id)
+
+        current_vote = await VisitorVotes.from_request(request).aresolve(quote.id)
+
+        return render(request, 'quotes/random_quote.html', {
+            'quote': quote,
+            'user_has_liked': current_vote == LIKE,
+            'user_has_disliked': current_vote == DISLIKE,
+            **await page_cache.afragment_context()
+        })
+    else:
+        return render(request, 'quotes/random_quote.html', {'quote': None})
+
+
+async def _rate_quote(request, quote_id, action):
+    visitor_votes = VisitorVotes.from_request(request)
+    if visitor_votes.is_new:
+        await visitor_votes.aimport_session(request)
+
+    current_vote = await visitor_votes.aresolve(quote_id)
+    new_vote, likes_delta, dislikes_delta, message = vote_transition(action, current_vote)
+
+    counters = await aapply_vote(
+        quote_id, likes_delta, dislikes_delta,
+        ledger=ledger_entry(visitor_votes.visitor_id, quote_id, new_vote)
+    )
+    if counters is None:
+        raise Http404('Цитата не найдена')
+    await leaderboard.arecord_vote(quote_id, counters['likes'], counters['dislikes'])
+    await versions.abump(COUNTERS, change=(quote_id, counters['likes'], counters['dislikes']))
+    visitor_votes.set(quote_id, new_vote)
+
+    response = JsonResponse({
+        'success': True,
+        'message': message,
+        'likes': counters['likes'],
+        'dislikes': counters['dislikes'],
+        'user_has_liked': new_vote == LIKE,
+        'user_has_disliked': new_vote == DISLIKE
+    })
+    return pin_to_primary(visitor_votes.save(response))
+
+
+@csrf_exempt
+async def like_quote(request, quote_id):
+    if request.method == 'POST':
+        return await _rate_quote(request, quote_id, LIKE)
+
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+
+@csrf_exempt
+async def dislike_quote(request, quote_id):
+    if request.method == 'POST':
+        return await _rate_quote(request, quote_id, DISLIKE)
+
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+
+@versioned('popular')
+@reads_from_replica
+async def popular_quotes(request):
+    async def arender():
+        quotes = await leaderboard.atop()
+        return render_to_string('quotes/popular_quotes.html', {'quotes': quotes})
+
+    return HttpResponse(await page_cache.aget_or_render('popular', arender))
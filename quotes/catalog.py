@@ -0,0 +1,316 @@
+"""Снимок каталога цитат в памяти процесса.
+
+Включается QUOTES_CATALOG_SNAPSHOT. Тогда случайная цитата (страница и
+JSON) выбирается и отдается из снимка без обращения к базе: каждый
+запрос сверяет три версии из quotes/versions.py одним чтением кэша и,
+если они изменились, догоняет изменения по журналу версий:
+
+- catalog — сохраненные или удаленные цитаты и источники перечитываются
+  точечно (сигналы пишут в журнал их id);
+- counters — голоса приносят в журнал свежие likes/dislikes, база не
+  нужна;
+- views — сброс просмотров в базу приносит прирост по каждой цитате.
+
+Если журнал неполон (запись вытеснена или изменение сделано в обход
+сигналов, например импортом), снимок перечитывается целиком; до конца
+загрузки запросы обслуживает старый снимок. Читает снимок всегда с
+основной базы: отставшая реплика закрепила бы в нем старые строки.
+
+Записи — объекты с __slots__, источник у всех цитат один общий объект.
+Память на цитату меряет benchmarks/catalog_snapshot.py.
+"""
+import sys
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import Quote, Source
+from .routers import PRIMARY
+from .sampling import MAX_ATTEMPTS, FenwickSampler
+from .versions import CATALOG, COUNTERS, FULL, VIEWS, versions
+
+SNAPSHOT_VERSIONS = (CATALOG, COUNTERS, VIEWS)
+TYPE_DISPLAY = dict(Source.type_choices)
+# Сколько ждать запись журнала, которую другой процесс еще не успел сохранить
+JOURNAL_GRACE_SECONDS = 1.0
+# Сколько id перечитывать одним запросом
+REFRESH_BATCH_SIZE = 500
+
+
+class SourceRecord:
+    __slots__ = ('id', 'name', 'type')
+
+    def __init__(self, id, name, type):
+        self.id = id
+        self.name = name
+        self.type = sys.intern(type)
+
+    def get_type_display(self):
+        return TYPE_DISPLAY.get(self.type, self.type)
+
+    def __str__(self):
+        # Как Source.__str__
+        return f"{self.get_type_display()}: {self.name}"
+
+
+class QuoteRecord:
+    """Цитата из снимка с теми же атрибутами, что читают шаблоны и JSON"""
+    __slots__ = ('id', 'text', 'source', 'weight', 'views', 'likes', 'dislikes')
+
+    def __init__(self, id, text, source, weight, views, likes, dislikes):
+        self.id = id
+        self.text = text
+        self.source = source
+        self.weight = weight
+        self.views = views
+        self.likes = likes
+        self.dislikes = dislikes
+
+    @property
+    def pk(self):
+        return self.id
+
+    def copy(self):
+        """Копия для одного запроса: представления дописывают в нее просмотры"""
+        return QuoteRecord(
+            self.id, self.text, self.source, self.weight, self.views, self.likes, self.dislikes
+        )
+
+
+class CatalogSnapshot:
+    def __init__(self):
+        # (записи по id, сэмплер весов) меняются одним присваиванием
+        self._state = None
+        self._seen = None
+        self._sources = {}
+        self._gap_since = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # Число полных загрузок — для тестов и отладки
+        self.reloads = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'QUOTES_CATALOG_SNAPSHOT', False)
+
+    def __len__(self):
+        return len(self._state[0]) if self._state else 0
+
+    def reset(self):
+        """Сбрасывает снимок; он будет загружен при следующем обращении"""
+        with self._lock:
+            self._state = None
+            self._seen = None
+            self._sources = {}
+            self._gap_since = None
+            self.reloads = 0
+
+    def load(self):
+        """Полная загрузка снимка; версии читаются до данных, поэтому
+        изменения, сделанные во время загрузки, будут догнаны по журналу"""
+        seen = versions.current(SNAPSHOT_VERSIONS)
+        sources = {
+            pk: SourceRecord(pk, name, type)
+            for pk, name, type in Source.objects.using(PRIMARY).values_list('id', 'name', 'type').iterator(chunk_size=2000)
+        }
+        records = {}
+        orphans = []
+        rows = Quote.objects.using(PRIMARY).order_by('id').values_list(
+            'id', 'text', 'source_id', 'weight', 'views', 'likes', 'dislikes'
+        )
+        for row in rows.iterator(chunk_size=2000):
+            if row[2] not in sources:
+                orphans.append(row)
+                continue
+            records[row[0]] = QuoteRecord(*row[:2], sources[row[2]], *row[3:])
+        if orphans:
+            # Источники, добавленные уже после их чтения (загрузка идет без
+            # транзакции, чтобы не держать блокировку SQLite); если источника
+            # уже нет, его цитаты уберет журнал
+            for source in Source.objects.using(PRIMARY).filter(pk__in={row[2] for row in orphans}):
+                sources[source.pk] = SourceRecord(source.pk, source.name, source.type)
+            for row in orphans:
+                if row[2] in sources:
+                    records[row[0]] = QuoteRecord(*row[:2], sources[row[2]], *row[3:])
+            records = dict(sorted(records.items()))
+        sampler = FenwickSampler((pk, record.weight) for pk, record in records.items())
+        with self._lock:
+            self._sources = sources
+            self._state = (records, sampler)
+            self._seen = seen
+            self._gap_since = None
+            self.reloads += 1
+
+    def warm_up(self):
+        """Загрузка при старте процесса (wsgi.py/asgi.py), чтобы первый
+        запрос не ждал чтения каталога"""
+        if not self.enabled:
+            return
+        try:
+            self.sync()
+        except DatabaseError:
+            # База еще не создана или не смигрирована — загрузимся на первом запросе
+            pass
+
+    def sync(self, current=None):
+        """Догоняет изменения каталога; возвращает (записи, сэмплер)"""
+        if current is None:
+            current = versions.current(SNAPSHOT_VERSIONS)
+        seen = self._seen
+        if self._state is not None and (current == seen or self._catch_up(current)):
+            return self._state
+        # Перезагружает один поток; остальные, если снимок уже есть, не ждут
+        # его и отвечают из старого
+        if not self._load_lock.acquire(blocking=self._state is None):
+            return self._state
+        try:
+            # Пока ждали, снимок мог перезагрузить другой поток
+            if self._seen is seen:
+                self.load()
+        finally:
+            self._load_lock.release()
+        return self._state
+
+    async def async_sync(self):
+        current = await versions.acurrent(SNAPSHOT_VERSIONS)
+        if self._state is None or current != self._seen:
+            return await sync_to_async(self.sync)(current)
+        return self._state
+
+    def _catch_up(self, current):
+        """Применяет журнал; False — нужна полная загрузка"""
+        with self._lock:
+            if current == self._seen:
+                return True
+            seen = self._seen
+            journal = {}
+            for name in SNAPSHOT_VERSIONS:
+                if current[name] == seen[name]:
+                    continue
+                entries = versions.changes(name, seen[name], current[name])
+                if entries is None:
+                    # Запись могла быть еще не сохранена процессом, сделавшим
+                    # изменение; если пропуск держится дольше паузы — перечитываем
+                    if self._gap_since is None:
+                        self._gap_since = time.monotonic()
+                    return time.monotonic() - self._gap_since < JOURNAL_GRACE_SECONDS
+                if FULL in entries:
+                    return False
+                journal[name] = entries
+
+            records, sampler = self._state
+            self._apply_catalog(records, sampler, journal.get(CATALOG, ()))
+            for quote_id, likes, dislikes in journal.get(COUNTERS, ()):
+                record = records.get(quote_id)
+                if record is not None:
+                    record.likes, record.dislikes = likes, dislikes
+            for flushed in journal.get(VIEWS, ()):
+                for quote_id, count in flushed.items():
+                    record = records.get(quote_id)
+                    if record is not None:
+                        record.views += count
+            self._seen = current
+            self._gap_since = None
+            return True
+
+    def _apply_catalog(self, records, sampler, entries):
+        quote_ids = {pk for kind, pk in entries if kind == 'quote'}
+        source_ids = {pk for kind, pk in entries if kind == 'source'}
+        if not quote_ids and not source_ids:
+            return
+
+        for batch in _batches(source_ids):
+            found = Source.objects.using(PRIMARY).in_bulk(batch)
+            for pk in batch:
+                source = found.get(pk)
+                if source is None:
+                    self._sources.pop(pk, None)
+                elif pk in self._sources:
+                    # Запись источника общая для всех его цитат
+                    self._sources[pk].name = source.name
+                    self._sources[pk].type = sys.intern(source.type)
+                else:
+                    self._sources[pk] = SourceRecord(pk, source.name, source.type)
+
+        rows = Quote.objects.using(PRIMARY).values_list('id', 'text', 'source_id', 'weight', 'views', 'likes', 'dislikes')
+        found = {}
+        for batch in _batches(quote_ids):
+            found.update((row[0], row) for row in rows.filter(pk__in=batch))
+        for pk in quote_ids - found.keys():
+            records.pop(pk, None)
+            sampler.discard(pk)
+
+        missing_sources = {row[2] for row in found.values()} - self._sources.keys()
+        for batch in _batches(missing_sources):
+            for source in Source.objects.using(PRIMARY).filter(pk__in=batch):
+                self._sources[source.pk] = SourceRecord(source.pk, source.name, source.type)
+
+        for pk, text, source_id, weight, views, likes, dislikes in found.values():
+            records[pk] = QuoteRecord(pk, text, self._sources[source_id], weight, views, likes, dislikes)
+            sampler.set(pk, weight)
+
+    def get(self, quote_id):
+        records, _ = self.sync()
+        record = records.get(int(quote_id))
+        return record.copy() if record is not None else None
+
+    def choice(self, exclude_id=None):
+        """Случайная цитата с учетом весов — копия записи или None"""
+        return self._pick(self.sync(), exclude_id)
+
+    async def achoice(self, exclude_id=None):
+        return self._pick(await self.async_sync(), exclude_id)
+
+    @staticmethod
+    def _pick(state, exclude_id):
+        records, sampler = state
+        if exclude_id is not None:
+            exclude_id = int(exclude_id)
+        quote_id = sampler.sample(exclude=exclude_id)
+        record = records.get(quote_id)
+        return record.copy() if record is not None else None
+
+    def distinct_choices(self, k, exclude_ids=()):
+        """До k разных случайных цитат, пропуская exclude_ids.
+
+        Записи берутся через records.get() в момент выбора: параллельное
+        обновление снимка может удалить цитату из records.
+        """
+        records, sampler = self.sync()
+        seen = {int(quote_id) for quote_id in exclude_ids}
+        chosen = []
+
+        def take(quote_id):
+            record = records.get(quote_id)
+            seen.add(quote_id)
+            if record is not None:
+                chosen.append(record.copy())
+
+        for _ in range(MAX_ATTEMPTS * 4 * k):
+            if len(chosen) >= k:
+                break
+            quote_id = sampler.sample()
+            if quote_id is None:
+                break
+            if quote_id not in seen:
+                take(quote_id)
+        else:
+            # Каталог почти исчерпан — добираем оставшиеся цитаты по порядку
+            for quote_id, weight in sampler.items():
+                if len(chosen) >= k:
+                    break
+                if quote_id not in seen and (weight > 0 or sampler.total == 0):
+                    take(quote_id)
+        return chosen
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), REFRESH_BATCH_SIZE):
+        yield ids[start:start + REFRESH_BATCH_SIZE]
+
+
+catalog_snapshot = CatalogSnapshot()
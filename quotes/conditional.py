@@ -0,0 +1,65 @@
+"""Условные HTTP-ответы (ETag / Last-Modified) по версиям данных.
+
+Валидаторы считаются только по версиям из кэша (quotes/versions.py),
+поэтому запрос с совпавшим If-None-Match получает 304, не доходя ни до
+представления, ни до базы. Просмотры цитат в версию не входят: их
+счетчик и так обновляется в базе с задержкой.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .versions import versions
+
+
+def request_versions(request):
+    """Версии читаются из кэша один раз на запрос"""
+    if not hasattr(request, '_quote_versions'):
+        request._quote_versions = versions.current()
+    return request._quote_versions
+
+
+def versioned(scope):
+    """Декоратор: ETag/Last-Modified по версиям каталога и счетчиков,
+    плюс Cache-Control для общих кэшей (CDN, прокси).
+
+    В ETag входят scope, аргументы из URL и строка запроса.
+    """
+    def etag(request, *args, **kwargs):
+        current = request_versions(request)
+        parts = [scope, current['catalog'], current['counters'], *args, *kwargs.values()]
+        if request.GET:
+            parts.append(request.GET.urlencode())
+        digest = hashlib.blake2b(':'.join(map(str, parts)).encode('utf-8'), digest_size=12).hexdigest()
+        # Слабый ETag: тело может отличаться числом просмотров
+        return f'W/"{digest}"'
+
+    def last_modified(request, *args, **kwargs):
+        return datetime.fromtimestamp(request_versions(request)['modified'], tz=timezone.utc)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        def add_cache_control(response):
+            if response.status_code in (200, 304):
+                max_age = getattr(settings, 'QUOTES_HTTP_MAX_AGE', 0)
+                patch_cache_control(response, public=True, max_age=max_age)
+            return response
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                return add_cache_control(await conditional_view(request, *args, **kwargs))
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return add_cache_control(conditional_view(request, *args, **kwargs))
+        return wrapper
+
+    return decorator
@@ -0,0 +1,171 @@
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import F
+
+from .models import Quote
+from .versions import VIEWS, versions
+
+# Максимальное число id в одном UPDATE ... WHERE id IN (...)
+UPDATE_BATCH_SIZE = 500
+
+
+class ViewCounter:
+    """Отложенный счетчик просмотров цитат.
+
+    Просмотры накапливаются в словаре процесса и сбрасываются в базу
+    пачками UPDATE ... SET views = views + n раз в QUOTES_VIEW_FLUSH_INTERVAL
+    секунд: фоновым таймером, на запросе после истечения интервала и при
+    остановке процесса, а принудительно — по сигналу
+    QUOTES_VIEW_FLUSH_SIGNAL (команда flush_views). При сбросе буфер подменяется целиком под
+    блокировкой, поэтому каждый просмотр попадает в базу ровно один раз, а
+    при ошибке базы возвращается в буфер.
+    """
+
+    def __init__(self):
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._pid = os.getpid()
+        self._timer = None
+        self._stop = threading.Event()
+
+    @property
+    def interval(self):
+        return getattr(settings, 'QUOTES_VIEW_FLUSH_INTERVAL', 10)
+
+    @property
+    def timer_enabled(self):
+        return getattr(settings, 'QUOTES_VIEW_FLUSH_TIMER', True)
+
+    def _check_fork(self):
+        # После fork буфер и таймер принадлежат родителю: его просмотры
+        # запишет он сам, а поток таймера в дочерний процесс не переходит
+        if self._pid != os.getpid():
+            self._counts = defaultdict(int)
+            self._pid = os.getpid()
+            self._timer = None
+            self._stop = threading.Event()
+
+    def record(self, quote_id):
+        """Учитывает один просмотр; при необходимости сбрасывает буфер в базу"""
+        if self._add(quote_id):
+            self.flush()
+
+    async def arecord(self, quote_id):
+        """Асинхронный вариант record()"""
+        if self._add(quote_id):
+            await sync_to_async(self.flush)()
+
+    def _add(self, quote_id):
+        """Кладет просмотр в буфер; True — пора сбросить буфер на этом запросе"""
+        with self._lock:
+            self._check_fork()
+            self._counts[quote_id] += 1
+            if self._timer is None and self.timer_enabled:
+                self._start_timer()
+            return time.monotonic() - self._last_flush >= self.interval
+
+    def _start_timer(self):
+        self._timer = threading.Thread(target=self._run_timer, name='quotes-view-flush', daemon=True)
+        self._timer.start()
+
+    def _run_timer(self):
+        stop = self._stop
+        while not stop.wait(self.interval):
+            self._flush_in_thread()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except DatabaseError:
+            # Просмотры уже вернулись в буфер — попробуем на следующем тике
+            pass
+        finally:
+            connections.close_all()
+
+    def install_signal_handler(self):
+        """Сбрасывает буфер по сигналу QUOTES_VIEW_FLUSH_SIGNAL (None — не
+        ставить обработчик). SIGUSR1 по умолчанию не берем: им gunicorn
+        переоткрывает логи."""
+        name = getattr(settings, 'QUOTES_VIEW_FLUSH_SIGNAL', 'SIGUSR2')
+        signum = getattr(signal, name, None) if name else None
+        # Обработчик ставится только из главного потока
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return None
+        signal.signal(signum, self._handle_signal)
+        return signum
+
+    def _handle_signal(self, signum, frame):
+        # В самом обработчике в базу не ходим: прерванный код может держать
+        # блокировку буфера, поэтому сброс идет в отдельном потоке
+        threading.Thread(target=self._flush_in_thread, name='quotes-view-flush-signal', daemon=True).start()
+
+    def stop(self):
+        """Останавливает таймер сброса (следующий просмотр запустит его снова)"""
+        with self._lock:
+            timer, self._timer = self._timer, None
+            self._stop.set()
+            self._stop = threading.Event()
+        if timer is not None and timer is not threading.current_thread():
+            timer.join()
+
+    def pending(self, quote_id):
+        """Сколько просмотров цитаты этот процесс еще не записал в базу"""
+        return self._counts.get(quote_id, 0)
+
+    async def apending(self, quote_id):
+        return self.pending(quote_id)
+
+    def discard(self):
+        """Забывает несброшенные просмотры (например, тестовых цитат)"""
+        with self._lock:
+            self._counts = defaultdict(int)
+
+    def flush(self):
+        """Записывает накопленные просмотры в базу, возвращает их количество"""
+        with self._lock:
+            counts, self._counts = self._counts, defaultdict(int)
+            self._last_flush = time.monotonic()
+        if not counts:
+            return 0
+
+        # Группируем по величине прироста: один UPDATE на каждое значение n
+        by_count = defaultdict(list)
+        for quote_id, count in counts.items():
+            by_count[count].append(quote_id)
+
+        flushed = {}
+        try:
+            for count, ids in by_count.items():
+                for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                    batch = ids[start:start + UPDATE_BATCH_SIZE]
+                    Quote.objects.filter(pk__in=batch).update(views=F('views') + count)
+                    flushed.update((quote_id, count) for quote_id in batch)
+        except DatabaseError:
+            # Незаписанное возвращаем в буфер к просмотрам, пришедшим за это время
+            with self._lock:
+                for quote_id, count in counts.items():
+                    if quote_id not in flushed:
+                        self._counts[quote_id] += count
+            raise
+        finally:
+            if flushed and getattr(settings, 'QUOTES_CATALOG_SNAPSHOT', False):
+                # Снимки каталога переносят просмотры из буфера в свои записи
+                versions.bump(VIEWS, change=flushed)
+        return sum(flushed.values())
+
+    def shutdown(self):
+        """Сброс при остановке процесса (регистрируется через atexit)"""
+        self.stop()
+        self.flush()
+
+
+view_counter = ViewCounter()
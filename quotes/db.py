@@ -0,0 +1,26 @@
+"""Настройка соединений с базой.
+
+Для SQLite при каждом новом соединении выполняются PRAGMA из
+QUOTES_SQLITE_PRAGMAS: WAL позволяет читать во время записи,
+busy_timeout заставляет ждать блокировку вместо ошибки
+"database is locked", mmap_size ускоряет чтение больших файлов.
+"""
+import re
+
+from django.conf import settings
+
+PRAGMA_NAME_RE = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Обработчик сигнала connection_created"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'QUOTES_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            value = str(value)
+            if not PRAGMA_NAME_RE.match(name) or not PRAGMA_VALUE_RE.match(value):
+                raise ValueError(f'QUOTES_SQLITE_PRAGMAS: недопустимая настройка {name}={value}')
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,87 @@
+"""Поиск почти одинаковых цитат: шинглы + MinHash + LSH.
+
+Точные дубли (с точностью до регистра и пробелов) ловит уникальный
+индекс по Quote.text_hash. Здесь — пакетный поиск цитат, отличающихся
+парой слов или знаков препинания.
+"""
+import hashlib
+import random
+from array import array
+from collections import defaultdict
+from itertools import combinations
+
+from .models import normalize_text
+
+# Модуль для универсального хеширования (простое число Мерсенна 2^61 - 1)
+PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text, size=5):
+    """Множество хешей символьных k-грамм нормализованного текста"""
+    text = normalize_text(text)
+    if len(text) <= size:
+        grams = [text]
+    else:
+        grams = (text[i:i + size] for i in range(len(text) - size + 1))
+    return {
+        int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'little')
+        for gram in grams
+    }
+
+
+class MinHasher:
+    """MinHash-сигнатуры фиксированной длины для оценки сходства Жаккара"""
+
+    def __init__(self, num_perm=32, seed=1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, PRIME), rng.randrange(PRIME)) for _ in range(num_perm)]
+
+    def signature(self, hashes):
+        if not hashes:
+            return array('I', [MAX_HASH]) * len(self.params)
+        return array('I', (
+            min((a * h + b) % PRIME for h in hashes) & MAX_HASH
+            for a, b in self.params
+        ))
+
+
+def estimated_similarity(first, second):
+    """Оценка сходства Жаккара по доле совпавших позиций сигнатур"""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+def find_near_duplicates(items, threshold=0.8, num_perm=32, bands=8, shingle_size=5):
+    """Ищет пары похожих текстов среди (id, text).
+
+    В памяти держатся только сигнатуры (num_perm чисел по 4 байта на
+    текст). Сигнатуры бьются на полосы (LSH); пары, совпавшие хотя бы в
+    одной полосе, проверяются оценкой сходства по полной сигнатуре.
+    Возвращает список (id1, id2, сходство) по убыванию сходства.
+    """
+    if num_perm % bands:
+        raise ValueError('num_perm должно делиться на bands')
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+
+    buckets = defaultdict(list)
+    signatures = {}
+    for item_id, text in items:
+        signature = hasher.signature(shingles(text, shingle_size))
+        signatures[item_id] = signature
+        for band in range(bands):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            buckets[key].append(item_id)
+
+    candidates = set()
+    for ids in buckets.values():
+        if len(ids) > 1:
+            candidates.update(combinations(sorted(ids), 2))
+
+    pairs = []
+    for first, second in candidates:
+        similarity = estimated_similarity(signatures[first], signatures[second])
+        if similarity >= threshold:
+            pairs.append((first, second, similarity))
+    pairs.sort(key=lambda pair: (-pair[2], pair[0], pair[1]))
+    return pairs
@@ -0,0 +1,66 @@
+import csv
+import json
+import zlib
+
+from .models import Quote
+
+# Поля выгрузки; первые четыре совпадают с форматом import_quotes
+FIELDS = ['text', 'source_name', 'source_type', 'weight', 'id', 'views', 'likes', 'dislikes', 'created_at']
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def export_quotes(after_id=None, chunk_size=2000):
+    """Потоково отдает цитаты по возрастанию id серверным курсором"""
+    quotes = Quote.objects.select_related('source').order_by('id')
+    if after_id:
+        quotes = quotes.filter(id__gt=after_id)
+    for quote in quotes.iterator(chunk_size=chunk_size):
+        yield {
+            'text': quote.text,
+            'source_name': quote.source.name,
+            'source_type': quote.source.type,
+            'weight': quote.weight,
+            'id': quote.id,
+            'views': quote.views,
+            'likes': quote.likes,
+            'dislikes': quote.dislikes,
+            'created_at': quote.created_at.isoformat(),
+        }
+
+
+def render_lines(rows, fmt, header=True):
+    """Превращает записи в строки CSV или JSONL"""
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        if header:
+            yield writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow([row[field] for field in FIELDS])
+    else:
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def encode(lines, compress=False, flush_every=256):
+    """Кодирует строки в UTF-8 и при необходимости сжимает gzip на лету"""
+    if not compress:
+        for line in lines:
+            yield line.encode('utf-8')
+        return
+
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    buffer = []
+    for line in lines:
+        buffer.append(line.encode('utf-8'))
+        if len(buffer) >= flush_every:
+            chunk = compressor.compress(b''.join(buffer))
+            buffer = []
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
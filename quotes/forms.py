@@ -1,6 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from .models import Quote, Source
+from .models import MAX_QUOTES_PER_SOURCE, Quote, Source, text_hash
 
 class QuoteForm(forms.Form):
     text = forms.CharField(
@@ -23,9 +23,10 @@ class QuoteForm(forms.Form):
     )
 
     def clean_text(self):
-        """Проверяет, что цитата с таким текстом еще не существует"""
+        """Проверяет, что цитата с таким текстом еще не существует
+        (без учета регистра и лишних пробелов)"""
         text = self.cleaned_data.get('text')
-        if text and Quote.objects.filter(text=text).exists():
+        if text and Quote.objects.filter(text_hash=text_hash(text)).exists():
             raise ValidationError('Такая цитата уже существует в базе данных.')
         return text
 
@@ -42,8 +43,8 @@ class QuoteForm(forms.Form):
             )
             
             # Проверяем ограничение на количество цитат
-            if Quote.objects.filter(source=source).count() >= 3:
-                raise ValidationError('У одного источника не может быть больше 3 цитат.')
+            if source.quote_count >= MAX_QUOTES_PER_SOURCE:
+                raise ValidationError(f'У одного источника не может быть больше {MAX_QUOTES_PER_SOURCE} цитат.')
         
         return cleaned_data
 
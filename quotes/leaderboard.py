@@ -0,0 +1,116 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from .models import Quote
+
+# Поля, по которым можно разрешать ничьи при равном числе лайков
+TIEBREAK_FIELDS = {'id', 'dislikes', 'views', 'weight'}
+
+
+class Leaderboard:
+    """Топ-N цитат по лайкам, хранящийся в кэше.
+
+    Страница популярных цитат читает готовый список из кэша. Голос,
+    который может изменить топ, удаляет список, и он пересобирается одним
+    запросом по индексу при следующем чтении; голоса за цитаты далеко от
+    топа кэш не трогают.
+    """
+
+    cache_key = 'quotes:leaderboard'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'QUOTES_LEADERBOARD_CACHE', 'default')]
+
+    @property
+    def size(self):
+        return getattr(settings, 'QUOTES_LEADERBOARD_SIZE', 10)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'QUOTES_LEADERBOARD_TIMEOUT', 300)
+
+    @property
+    def tiebreak(self):
+        """Порядок при равных лайках, например ('-views', 'id')"""
+        fields = tuple(getattr(settings, 'QUOTES_LEADERBOARD_TIEBREAK', ('id',)))
+        for field in fields:
+            if field.lstrip('-') not in TIEBREAK_FIELDS:
+                raise ImproperlyConfigured(
+                    f'QUOTES_LEADERBOARD_TIEBREAK: неизвестное поле {field!r}'
+                )
+        return fields
+
+    @property
+    def ordering(self):
+        return ('-likes',) + self.tiebreak
+
+    def sort_key(self, entry):
+        return tuple(
+            -entry[field[1:]] if field.startswith('-') else entry[field]
+            for field in self.ordering
+        )
+
+    def top(self):
+        """Возвращает список записей топа, при промахе кэша строит его заново"""
+        entries = self.cache.get(self.cache_key)
+        if entries is None:
+            entries = self.rebuild()
+        return entries
+
+    async def atop(self):
+        """Асинхронный вариант top()"""
+        entries = await self.cache.aget(self.cache_key)
+        if entries is None:
+            entries = await sync_to_async(self.rebuild)()
+        return entries
+
+    def queryset(self):
+        return Quote.objects.select_related('source').order_by(*self.ordering)[:self.size]
+
+    def rebuild(self):
+        quotes = self.queryset()
+        entries = [self.entry(quote) for quote in quotes]
+        self.cache.set(self.cache_key, entries, self.timeout)
+        return entries
+
+    def invalidate(self):
+        self.cache.delete(self.cache_key)
+
+    @staticmethod
+    def entry(quote):
+        return {
+            'id': quote.id,
+            'text': quote.text,
+            'source': str(quote.source),
+            'likes': quote.likes,
+            'dislikes': quote.dislikes,
+            'views': quote.views,
+            'weight': quote.weight,
+        }
+
+    def affected_by_vote(self, entries, quote_id, likes):
+        """Может ли голос изменить состав или порядок топа"""
+        return (
+            len(entries) < self.size
+            or likes >= entries[-1]['likes']
+            or any(entry['id'] == quote_id for entry in entries)
+        )
+
+    def record_vote(self, quote_id, likes, dislikes):
+        """Сбрасывает топ, если голос мог его изменить; следующее чтение
+        пересоберет его одним запросом. Кэш только читается и удаляется —
+        параллельные голоса из разных процессов не затирают друг друга"""
+        entries = self.cache.get(self.cache_key)
+        if entries is not None and self.affected_by_vote(entries, quote_id, likes):
+            self.invalidate()
+
+    async def arecord_vote(self, quote_id, likes, dislikes):
+        entries = await self.cache.aget(self.cache_key)
+        if entries is not None and self.affected_by_vote(entries, quote_id, likes):
+            await self.cache.adelete(self.cache_key)
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,148 @@
+import csv
+import gzip
+import json
+import os
+import sys
+import zlib
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quotes.export import encode, export_quotes, render_lines
+
+
+class ExportScanner:
+    """Потоково проходит уже выгруженный файл и запоминает последнюю целую
+    запись: запись целая, если ее последняя строка закончилась переводом
+    строки (значения CSV могут занимать несколько строк)"""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.last_id = None
+        # Байт, на котором кончается последняя целая запись (или заголовок CSV)
+        self.end = 0
+        # Сколько байт прочитано и закончилась ли последняя строка переводом строки
+        self.size = 0
+        self.complete = True
+
+    def _lines(self, stream):
+        for raw in stream:
+            self.size += len(raw)
+            self.complete = raw.endswith(b'\n')
+            # Оборванная строка может кончаться на середине символа UTF-8
+            yield raw.decode('utf-8', errors='strict' if self.complete else 'replace')
+
+    def scan(self, stream):
+        if self.fmt == 'csv':
+            reader = csv.DictReader(self._lines(stream))
+            if reader.fieldnames is None or not self.complete:
+                return
+            self.end = self.size
+            for row in reader:
+                if not self.complete:
+                    return
+                self.last_id, self.end = int(row['id']), self.size
+        else:
+            for line in self._lines(stream):
+                if not self.complete:
+                    return
+                if line.strip():
+                    self.last_id = int(json.loads(line)['id'])
+                self.end = self.size
+
+    @property
+    def truncated(self):
+        """После последней целой записи в файле есть обрывок"""
+        return self.end != self.size
+
+
+def scan_export(path, fmt):
+    """ExportScanner по файлу path; CommandError, если файл не похож на выгрузку.
+
+    Оборванный хвост несжатого файла можно отрезать, а вот в .gz после
+    оборванного члена архива новый уже не прочитать — такой файл
+    дописывать нельзя.
+    """
+    scanner = ExportScanner(fmt)
+    try:
+        if path.suffix == '.gz':
+            with gzip.open(path, 'rb') as stream:
+                scanner.scan(stream)
+        else:
+            with open(path, 'rb') as stream:
+                scanner.scan(stream)
+    except (EOFError, zlib.error, gzip.BadGzipFile):
+        raise CommandError(
+            f'Архив {path} оборван: дописать в него нельзя, выгрузите заново без --resume'
+        )
+    except (OSError, ValueError, KeyError, csv.Error) as e:
+        if scanner.complete:
+            raise CommandError(f'Не удалось прочитать {path}: {e}')
+        # Ошибка разбора на оборванном хвосте: хвост и так будет отрезан
+        scanner.size = path.stat().st_size
+    if path.suffix == '.gz' and scanner.truncated:
+        raise CommandError(
+            f'Последняя запись в {path} оборвана: выгрузите заново без --resume'
+        )
+    return scanner
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка цитат с источниками и счетчиками в CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o', default='-',
+            help='Файл для выгрузки или «-» для stdout; .gz включает сжатие'
+        )
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='jsonl')
+        parser.add_argument('--gzip', action='store_true', help='Сжимать выгрузку gzip')
+        parser.add_argument('--after-id', type=int, help='Выгружать только цитаты с id больше указанного')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Дописать в существующий файл, начиная после его последней записи'
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        after_id = options['after_id']
+        header = True
+
+        if options['resume']:
+            if output == '-':
+                raise CommandError('--resume работает только с --output в файл')
+            path = Path(output)
+            if path.exists() and path.stat().st_size:
+                scanner = scan_export(path, fmt)
+                if scanner.truncated:
+                    # Иначе новые записи приклеились бы к обрывку последней
+                    os.truncate(path, scanner.end)
+                    self.stderr.write(f'Отрезан оборванный хвост: {scanner.size - scanner.end} байт')
+                after_id = scanner.last_id
+                header = scanner.end == 0
+
+        rows = export_quotes(after_id=after_id, chunk_size=options['chunk_size'])
+        lines = render_lines(rows, fmt, header=header)
+
+        if output == '-':
+            if not compress:
+                for line in lines:
+                    self.stdout.write(line, ending='')
+                return
+            for chunk in encode(lines, compress=True):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        chunks = encode(lines, compress=compress)
+
+        # Дописываем: для gzip это просто еще один член архива
+        mode = 'ab' if options['resume'] else 'wb'
+        with open(output, mode) as stream:
+            for chunk in chunks:
+                stream.write(chunk)
+        if after_id:
+            self.stderr.write(f'Продолжено после id {after_id}')
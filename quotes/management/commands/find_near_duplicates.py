@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from quotes.dedup import find_near_duplicates
+from quotes.models import Quote
+
+
+class Command(BaseCommand):
+    help = 'Пакетный поиск почти одинаковых цитат (шинглы + MinHash/LSH)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.8, help='Минимальное сходство Жаккара')
+        parser.add_argument('--num-perm', type=int, default=32, help='Длина MinHash-сигнатуры')
+        parser.add_argument('--bands', type=int, default=8, help='Число LSH-полос')
+        parser.add_argument('--shingle-size', type=int, default=5, help='Длина символьного шингла')
+        parser.add_argument('--limit', type=int, default=100, help='Сколько пар вывести')
+
+    def handle(self, *args, **options):
+        items = Quote.objects.order_by('id').values_list('id', 'text').iterator(chunk_size=2000)
+        pairs = find_near_duplicates(
+            items,
+            threshold=options['threshold'],
+            num_perm=options['num_perm'],
+            bands=options['bands'],
+            shingle_size=options['shingle_size'],
+        )
+        shown = pairs[:options['limit']]
+        texts = Quote.objects.in_bulk({quote_id for pair in shown for quote_id in pair[:2]})
+
+        for first, second, similarity in shown:
+            self.stdout.write(f'{similarity:.2f}  #{first} ↔ #{second}')
+            self.stdout.write(f'    {texts[first].text[:80]}')
+            self.stdout.write(f'    {texts[second].text[:80]}')
+
+        without_hash = Quote.objects.filter(text_hash=None).count()
+        if without_hash:
+            self.stdout.write(self.style.WARNING(
+                f'Цитат без text_hash (дубли, найденные при миграции): {without_hash}'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Найдено похожих пар: {len(pairs)}'))
@@ -0,0 +1,33 @@
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Принудительно записывает в базу просмотры, накопленные в памяти '
+        'рабочих процессов: посылает им сигнал QUOTES_VIEW_FLUSH_SIGNAL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('pids', nargs='+', type=int, help='PID рабочих процессов')
+
+    def handle(self, *args, **options):
+        name = getattr(settings, 'QUOTES_VIEW_FLUSH_SIGNAL', 'SIGUSR2')
+        signum = getattr(signal, name, None) if name else None
+        if signum is None:
+            raise CommandError(f'Сигнал сброса просмотров недоступен: QUOTES_VIEW_FLUSH_SIGNAL={name!r}')
+
+        failed = []
+        for pid in options['pids']:
+            try:
+                os.kill(pid, signum)
+            except OSError as e:
+                failed.append(pid)
+                self.stderr.write(f'{pid}: {e}')
+            else:
+                self.stdout.write(f'{pid}: отправлен {name}')
+        if failed:
+            raise CommandError(f'Не удалось отправить сигнал процессам: {", ".join(map(str, failed))}')
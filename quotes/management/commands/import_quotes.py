@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from quotes.leaderboard import leaderboard
+from quotes.models import MAX_QUOTES_PER_SOURCE, Quote, Source, text_hash
+from quotes.sampling import quote_sampler
+from quotes.search import get_backend
+from quotes.versions import CATALOG, versions
+
+SOURCE_TYPES = {code for code, _ in Source.type_choices}
+
+
+def read_rows(stream, fmt):
+    """Потоково читает строки CSV (с заголовком) или JSONL"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {'_error': f'строка {line_number}: {e}'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт цитат из CSV или JSONL с полями '
+        'text, source_name, source_type, weight (как в форме добавления)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или «-» для stdin')
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'],
+            help='Формат входа; по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк обрабатывать и вставлять за раз'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        self.stats = defaultdict(int)
+
+        # Одно чтение индекса хешей: 16 байт на цитату вместо всего текста
+        self.seen = {
+            bytes.fromhex(digest)
+            for digest in Quote.objects.exclude(text_hash=None)
+            .values_list('text_hash', flat=True).iterator(chunk_size=5000)
+        }
+        self.source_counts = {}
+        self.sources = {}
+
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+            self.import_stream(stream, fmt)
+        else:
+            if not Path(path).exists():
+                raise CommandError(f'Файл не найден: {path}')
+            with open(path, encoding='utf-8', newline='') as stream:
+                self.import_stream(stream, fmt)
+
+        if self.stats['created']:
+            # bulk_create не шлет сигналы — сбрасываем производные структуры
+            quote_sampler.reset()
+            leaderboard.invalidate()
+            versions.bump(CATALOG)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Добавлено: {created}, дублей: {duplicates}, '
+            'сверх лимита источника: {over_limit}, с ошибками: {invalid}'.format_map(self.stats)
+        ))
+
+    def import_stream(self, stream, fmt):
+        batch = []
+        for row in read_rows(stream, fmt):
+            parsed = self.parse(row)
+            if parsed is None:
+                continue
+            batch.append(parsed)
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+
+    def parse(self, row):
+        if '_error' in row:
+            self.report_invalid(row['_error'])
+            return None
+
+        text = (row.get('text') or '').strip()
+        source_name = (row.get('source_name') or '').strip()
+        source_type = (row.get('source_type') or 'OTHER').strip()
+        try:
+            weight = int(row.get('weight') or 1)
+        except (TypeError, ValueError):
+            weight = 0
+
+        if not text or not source_name or len(source_name) > 200:
+            self.report_invalid(f'нет текста или источника: {row!r}'[:200])
+            return None
+        if source_type not in SOURCE_TYPES or weight < 1:
+            self.report_invalid(f'неверный тип источника или вес: {row!r}'[:200])
+            return None
+
+        digest = text_hash(text)
+        key = bytes.fromhex(digest)
+        if key in self.seen:
+            self.stats['duplicates'] += 1
+            return None
+        self.seen.add(key)
+        return text, digest, source_name, source_type, weight
+
+    def report_invalid(self, message):
+        self.stats['invalid'] += 1
+        if self.verbosity > 1:
+            self.stderr.write(message)
+
+    def resolve_sources(self, batch):
+        """Находит или создает источники пачки двумя-тремя запросами"""
+        wanted = {name: source_type for _, _, name, source_type, _ in batch if name not in self.sources}
+        if not wanted:
+            return
+        for source in Source.objects.filter(name__in=wanted):
+            self.sources[source.name] = source.id
+            self.source_counts[source.id] = source.quote_count
+
+        missing = [
+            Source(name=name, type=source_type)
+            for name, source_type in wanted.items()
+            if name not in self.sources
+        ]
+        if missing:
+            Source.objects.bulk_create(missing, ignore_conflicts=True)
+            for source in Source.objects.filter(name__in=[s.name for s in missing]):
+                self.sources[source.name] = source.id
+                self.source_counts[source.id] = source.quote_count
+
+    def import_batch(self, batch):
+        with transaction.atomic():
+            self.resolve_sources(batch)
+
+            quotes = []
+            names = []
+            added = defaultdict(int)
+            for text, digest, source_name, _, weight in batch:
+                source_id = self.sources[source_name]
+                if self.source_counts[source_id] >= MAX_QUOTES_PER_SOURCE:
+                    self.stats['over_limit'] += 1
+                    continue
+                self.source_counts[source_id] += 1
+                added[source_id] += 1
+                quotes.append(Quote(text=text, text_hash=digest, source_id=source_id, weight=weight))
+                names.append(source_name)
+
+            Quote.objects.bulk_create(quotes, batch_size=self.batch_size)
+            get_backend().index_rows([
+                (quote.id, quote.text, name) for quote, name in zip(quotes, names)
+            ])
+
+            # Один UPDATE на каждое значение прироста счетчика источников
+            by_delta = defaultdict(list)
+            for source_id, delta in added.items():
+                by_delta[delta].append(source_id)
+            for delta, source_ids in by_delta.items():
+                Source.objects.filter(pk__in=source_ids).update(quote_count=F('quote_count') + delta)
+        self.stats['created'] += len(quotes)
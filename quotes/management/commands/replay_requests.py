@@ -0,0 +1,351 @@
+import http.client
+import io
+import json
+import queue
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import partial
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import Resolver404, resolve, reverse
+
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+UNSAFE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+class LogEntry:
+    __slots__ = ('ts', 'method', 'path', 'body', 'content_type', 'headers')
+
+    def __init__(self, ts, method, path, body, content_type, headers):
+        self.ts = ts
+        self.method = method
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers
+
+
+def parse_ts(value):
+    """Секунды эпохи или строка ISO 8601; None — без отметки времени"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, str):
+        raise ValueError('ts должно быть числом или строкой ISO 8601')
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def parse_entry(record):
+    """Запись журнала в LogEntry; ValueError, если это не запрос"""
+    if not isinstance(record, dict) or not str(record.get('path', '')).startswith('/'):
+        raise ValueError('нет поля path, начинающегося с «/»')
+    body = record.get('body')
+    content_type = record.get('content_type', FORM_CONTENT_TYPE)
+    if isinstance(body, dict):
+        body = urlencode(body, doseq=True).encode()
+        content_type = FORM_CONTENT_TYPE
+    elif isinstance(body, str):
+        body = body.encode()
+    elif body is not None:
+        raise ValueError('body должно быть строкой или объектом')
+    if not isinstance(content_type, str):
+        raise ValueError('content_type должно быть строкой')
+    headers = record.get('headers') or {}
+    if not isinstance(headers, dict):
+        raise ValueError('headers должно быть объектом')
+    return LogEntry(
+        ts=parse_ts(record.get('ts')),
+        method=str(record.get('method', 'GET')).upper(),
+        path=record['path'],
+        body=body or b'',
+        content_type=content_type,
+        headers={str(k): str(v) for k, v in headers.items()},
+    )
+
+
+def read_log(stream, skipped):
+    """Потоково читает журнал JSONL; непригодные строки считает в skipped"""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield parse_entry(json.loads(line))
+        except ValueError as e:
+            skipped.append(f'строка {line_number}: {e}')
+
+
+def url_pattern(path):
+    """Имя маршрута из quotes/urls.py (с пространством имен), по которому пойдет запрос"""
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return '<404>'
+    return match.view_name or match.route
+
+
+class InProcessSession:
+    """Тестовый клиент Django: у каждого потока свои cookie, как у посетителя.
+
+    Клиент шлет Host: testserver — на время прогона этот хост добавляется в
+    ALLOWED_HOSTS (см. Command.handle), иначе все ответы были бы 400.
+    """
+
+    def __init__(self):
+        self.client = Client(raise_request_exception=False)
+
+    def send(self, entry):
+        response = self.client.generic(
+            entry.method, entry.path, data=entry.body,
+            content_type=entry.content_type, headers=entry.headers,
+        )
+        return response.status_code
+
+    def close(self):
+        connections.close_all()
+
+
+class HTTPSession:
+    """Соединение keep-alive с сервером; cookie и токен CSRF — как у браузера"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise CommandError(f'Неверный адрес сервера: {base_url}')
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host, self.port = parts.hostname, parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.origin = f'{parts.scheme}://{parts.netloc}'
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, body=b'', headers=None):
+        if self.connection is None:
+            self.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        try:
+            self.connection.request(method, self.prefix + path, body=body or None, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            return 0
+        for cookie in response.headers.get_all('Set-Cookie') or ():
+            name, _, value = cookie.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value.strip()
+        return response.status
+
+    def send(self, entry):
+        headers = dict(entry.headers)
+        if entry.method in UNSAFE_METHODS:
+            if 'csrftoken' not in self.cookies:
+                # Форма добавления выставляет cookie CSRF, как перед настоящей отправкой
+                self.request('GET', reverse('add_quote'))
+            headers.setdefault('X-CSRFToken', self.cookies.get('csrftoken', ''))
+            headers.setdefault('Referer', self.origin + '/')
+            headers.setdefault('Content-Type', entry.content_type)
+        return self.request(entry.method, entry.path, entry.body, headers)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Воспроизводит журнал запросов JSONL (поля ts, method, path, body, '
+        'content_type, headers) в процессе или по HTTP и печатает задержки '
+        'по маршрутам. В процессе запросы пишут в настроенную базу — '
+        'укажите копию через SQLITE_PATH'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к журналу или «-» для stdin')
+        parser.add_argument(
+            '--target', default='inprocess',
+            help='inprocess (тестовый клиент) или адрес сервера, например http://127.0.0.1:8000'
+        )
+        parser.add_argument(
+            '--speed', type=float, default=1.0,
+            help='Множитель темпа по полю ts: 1 — как в журнале, 10 — в 10 раз быстрее, 0 — без пауз'
+        )
+        parser.add_argument('--concurrency', type=int, default=8, help='Число параллельных клиентов')
+        parser.add_argument('--limit', type=int, help='Воспроизвести не больше N запросов')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Таймаут HTTP-запроса, с')
+        parser.add_argument('--json', dest='json_path', help='Сохранить итоги в файл JSON')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency должно быть не меньше 1')
+        if options['speed'] < 0:
+            raise CommandError('--speed не может быть отрицательным')
+        target = options['target']
+        if target == 'inprocess':
+            make_session = InProcessSession
+        else:
+            HTTPSession(target, options['timeout'])  # проверка адреса до запуска потоков
+            make_session = partial(HTTPSession, target, options['timeout'])
+
+        path = options['path']
+        self.skipped = []
+        allowed_hosts = settings.ALLOWED_HOSTS
+        if target == 'inprocess':
+            allowed_hosts = [*allowed_hosts, 'testserver']
+        with override_settings(ALLOWED_HOSTS=allowed_hosts):
+            if path == '-':
+                summary = self.replay(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'), make_session, options)
+            else:
+                try:
+                    with open(path, encoding='utf-8') as stream:
+                        summary = self.replay(stream, make_session, options)
+                except FileNotFoundError:
+                    raise CommandError(f'Файл не найден: {path}')
+
+        self.report(summary)
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    def replay(self, stream, make_session, options):
+        concurrency, speed = options['concurrency'], options['speed']
+        # Короткая очередь: чтение журнала не убегает вперед воркеров
+        pending = queue.Queue(maxsize=concurrency * 2)
+        latencies = defaultdict(list)
+        statuses = defaultdict(Counter)
+        lags = []
+        lock = threading.Lock()
+
+        def worker():
+            session = make_session()
+            local_latencies, local_statuses, local_lags = defaultdict(list), defaultdict(Counter), []
+            try:
+                while (item := pending.get()) is not None:
+                    entry, due = item
+                    sent = time.monotonic()
+                    local_lags.append(max(0.0, sent - due))
+                    started = time.perf_counter()
+                    try:
+                        status = session.send(entry)
+                    except Exception:
+                        # Сбой клиента на одной записи не должен останавливать
+                        # воркер: иначе очередь некому разбирать и чтение журнала встанет
+                        status = 0
+                    elapsed = time.perf_counter() - started
+                    pattern = url_pattern(entry.path)
+                    local_latencies[pattern].append(elapsed)
+                    local_statuses[pattern][status] += 1
+            finally:
+                session.close()
+                with lock:
+                    for pattern, values in local_latencies.items():
+                        latencies[pattern].extend(values)
+                    for pattern, counts in local_statuses.items():
+                        statuses[pattern].update(counts)
+                    lags.extend(local_lags)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+
+        def put(item):
+            # Если все воркеры упали (например, не открылась сессия), очередь
+            # никто не разберет — не ждем ее вечно
+            while True:
+                try:
+                    return pending.put(item, timeout=0.5)
+                except queue.Full:
+                    if not any(thread.is_alive() for thread in threads):
+                        raise CommandError('Все воркеры завершились с ошибкой')
+
+        started = time.monotonic()
+        first_ts = None
+        try:
+            for number, entry in enumerate(read_log(stream, self.skipped)):
+                if options['limit'] is not None and number >= options['limit']:
+                    break
+                due = time.monotonic()
+                if speed and entry.ts is not None:
+                    if first_ts is None:
+                        first_ts = entry.ts
+                    due = started + (entry.ts - first_ts) / speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                put((entry, due))
+        finally:
+            for _ in threads:
+                try:
+                    put(None)
+                except CommandError:
+                    break
+            for thread in threads:
+                thread.join()
+        elapsed = time.monotonic() - started
+        return self.summarize(latencies, statuses, lags, elapsed)
+
+    @staticmethod
+    def percentiles(values):
+        ordered = sorted(values)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+        return {
+            'p50_ms': statistics.median(ordered) * 1000, 'p90_ms': pick(0.90),
+            'p99_ms': pick(0.99), 'max_ms': ordered[-1] * 1000,
+        }
+
+    def summarize(self, latencies, statuses, lags, elapsed):
+        total = sum(len(values) for values in latencies.values())
+        patterns = {}
+        for pattern in sorted(latencies):
+            counts = statuses[pattern]
+            patterns[pattern] = {
+                'requests': len(latencies[pattern]),
+                # 0 — сетевая ошибка или сбой клиента, 5xx — ошибка сервера (в том числе блокировка базы)
+                'errors': sum(n for status, n in counts.items() if status == 0 or status >= 500),
+                # 4xx — отказ приложения (неверный хост, CSRF, нет цитаты); задержки таких
+                # ответов меряют страницу ошибки, а не сам маршрут
+                'client_errors': sum(n for status, n in counts.items() if 400 <= status < 500),
+                'statuses': {str(status): n for status, n in sorted(counts.items())},
+                **self.percentiles(latencies[pattern]),
+            }
+        return {
+            'requests': total,
+            'skipped_lines': len(self.skipped),
+            'elapsed_seconds': elapsed,
+            'rps': total / elapsed if elapsed else 0.0,
+            'schedule_lag_ms': self.percentiles(lags) if lags else None,
+            'patterns': patterns,
+        }
+
+    def report(self, summary):
+        self.stdout.write(
+            f'{"pattern":<24}{"count":>8}{"errors":>8}{"4xx":>8}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}'
+        )
+        for pattern, row in summary['patterns'].items():
+            self.stdout.write(
+                f'{pattern:<24}{row["requests"]:>8}{row["errors"]:>8}{row["client_errors"]:>8}{row["p50_ms"]:>10.1f}'
+                f'{row["p90_ms"]:>10.1f}{row["p99_ms"]:>10.1f}{row["max_ms"]:>10.1f}'
+            )
+        self.stdout.write(
+            f'Запросов: {summary["requests"]} за {summary["elapsed_seconds"]:.1f} с '
+            f'({summary["rps"]:.1f} в секунду)'
+        )
+        lag = summary['schedule_lag_ms']
+        if lag:
+            # Отставание от расписания журнала: сервер не успевает за исходным темпом
+            self.stdout.write(f'Отставание от расписания: p99 {lag["p99_ms"]:.1f} мс, max {lag["max_ms"]:.1f} мс')
+        if self.skipped:
+            self.stdout.write(self.style.WARNING(f'Пропущено строк: {len(self.skipped)}'))
+            for message in self.skipped[:10]:
+                self.stdout.write(f'  {message}')
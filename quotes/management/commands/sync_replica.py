@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from quotes.routers import PRIMARY, replica_alias
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файл реплики (локальная замена '
+        'репликации для проверки чтения с реплики)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='Повторять копирование каждые N секунд, пока не прервут'
+        )
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError('Реплика не настроена: задайте SQLITE_REPLICA_PATH')
+        primary = connections[PRIMARY]
+        if primary.vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+            raise CommandError('sync_replica работает только с SQLite; настройте репликацию СУБД')
+
+        interval = options['interval']
+        while True:
+            started = time.monotonic()
+            self.sync(primary, connections[alias].settings_dict['NAME'])
+            self.stdout.write(f'Реплика обновлена за {time.monotonic() - started:.3f} с')
+            if not interval:
+                return
+            time.sleep(interval)
+
+    def sync(self, primary, replica_name):
+        # Онлайн-копия через backup API: основная база остается доступной
+        primary.ensure_connection()
+        target = sqlite3.connect(replica_name)
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
@@ -0,0 +1,173 @@
+"""Метрики запросов в памяти процесса в формате Prometheus.
+
+Для доли запросов QUOTES_METRICS_SAMPLE_RATE middleware
+(quotes/middleware.py) замеряет общее время, число SQL-запросов, время
+в базе и время рендера шаблонов и раскладывает их по гистограммам с
+меткой представления. Остальные запросы только считаются.
+
+SQL замеряется обработчиком execute_wrapper, который ставится на каждое
+соединение; шаблоны — бэкендом InstrumentedDjangoTemplates. Текущий
+замер хранится в ContextVar, поэтому работает и для асинхронных
+представлений, чей ORM выполняется в потоках sync_to_async.
+
+Гистограммы у каждого процесса свои: при нескольких воркерах Prometheus
+опрашивает каждый или суммирует их по меткам экземпляра.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+HISTOGRAMS = {
+    'quotes_request_latency_seconds': ('Полное время обработки запроса', LATENCY_BUCKETS),
+    'quotes_request_db_seconds': ('Время в SQL-запросах за запрос', LATENCY_BUCKETS),
+    'quotes_request_template_seconds': ('Время рендера шаблонов за запрос', LATENCY_BUCKETS),
+    'quotes_request_queries': ('Число SQL-запросов за запрос', QUERY_BUCKETS),
+}
+
+current_sample = ContextVar('quotes_metrics_sample', default=None)
+
+
+class Sample:
+    """Замер одного запроса"""
+    __slots__ = ('started', 'queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Пары (граница, накопленное число) включая +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.histograms = {name: {} for name in HISTOGRAMS}
+
+    def count_request(self, view):
+        with self._lock:
+            self.requests[view] = self.requests.get(view, 0) + 1
+
+    def record(self, view, sample):
+        values = {
+            'quotes_request_latency_seconds': time.perf_counter() - sample.started,
+            'quotes_request_db_seconds': sample.db_time,
+            'quotes_request_template_seconds': sample.template_time,
+            'quotes_request_queries': sample.queries,
+        }
+        with self._lock:
+            for name, value in values.items():
+                by_view = self.histograms[name]
+                if view not in by_view:
+                    by_view[view] = Histogram(HISTOGRAMS[name][1])
+                by_view[view].observe(value)
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        lines = [
+            '# HELP quotes_requests_total Все запросы, включая не попавшие в выборку',
+            '# TYPE quotes_requests_total counter',
+        ]
+        with self._lock:
+            for view, count in sorted(self.requests.items()):
+                lines.append(f'quotes_requests_total{{view="{escape_label(view)}"}} {count}')
+            for name, (help_text, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, histogram in sorted(self.histograms[name].items()):
+                    label = escape_label(view)
+                    for bound, total in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{view="{label}",le="{format_bound(bound)}"}} {total}')
+                    lines.append(f'{name}_sum{{view="{label}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{view="{label}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def time_query(execute, sql, params, many, context):
+    """execute_wrapper: учитывает запрос в текущем замере, если он есть"""
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.db_time += time.perf_counter() - started
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: вешает замер SQL на соединение"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class InstrumentedTemplate:
+    """Обертка шаблона бэкенда, замеряющая render()"""
+
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        sample = current_sample.get()
+        if sample is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            sample.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django с замером времени рендера"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
@@ -0,0 +1,66 @@
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import Sample, current_sample, metrics
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+class MetricsMiddleware:
+    """Считает запросы по представлениям и замеряет выборку из них
+    (см. quotes/metrics.py); ставится первым в MIDDLEWARE"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def sampled():
+        rate = getattr(settings, 'QUOTES_METRICS_SAMPLE_RATE', 0.1)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            response = self.get_response(request)
+            metrics.count_request(view_label(request))
+            return response
+
+        sample = Sample()
+        token = current_sample.set(sample)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        self.finish(request, sample)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            response = await self.get_response(request)
+            metrics.count_request(view_label(request))
+            return response
+
+        sample = Sample()
+        token = current_sample.set(sample)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        self.finish(request, sample)
+        return response
+
+    @staticmethod
+    def finish(request, sample):
+        view = view_label(request)
+        metrics.count_request(view)
+        metrics.record(view, sample)
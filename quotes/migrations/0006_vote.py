@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0005_remove_quote_user_votes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visitor', models.CharField(max_length=32)),
+                ('value', models.SmallIntegerField(choices=[(1, 'Лайк'), (-1, 'Дизлайк'), (0, 'Голос снят')])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='quotes.quote')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['quote', 'value'], name='vote_quote_value_idx')],
+                'constraints': [models.UniqueConstraint(fields=('visitor', 'quote'), name='unique_vote_per_visitor')],
+            },
+        ),
+    ]
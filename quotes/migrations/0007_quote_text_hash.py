@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:27
+
+import hashlib
+import unicodedata
+
+from django.db import migrations, models
+
+
+def fill_text_hash(apps, schema_editor):
+    Quote = apps.get_model('quotes', 'Quote')
+    seen = set()
+    batch = []
+    for quote in Quote.objects.order_by('id').only('id', 'text').iterator(chunk_size=2000):
+        normalized = ' '.join(unicodedata.normalize('NFKC', quote.text).casefold().split())
+        digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+        # Дубли, отличающиеся только регистром/пробелами, остаются без хеша:
+        # их покажет команда find_near_duplicates
+        if digest in seen:
+            continue
+        seen.add(digest)
+        quote.text_hash = digest
+        batch.append(quote)
+        if len(batch) >= 2000:
+            Quote.objects.bulk_update(batch, ['text_hash'])
+            batch = []
+    Quote.objects.bulk_update(batch, ['text_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0006_vote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quote',
+            name='text_hash',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.RunPython(fill_text_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='quote',
+            name='text_hash',
+            field=models.CharField(editable=False, max_length=32, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='text',
+            field=models.TextField(),
+        ),
+    ]
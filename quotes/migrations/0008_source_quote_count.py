@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:28
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_quote_count(apps, schema_editor):
+    Quote = apps.get_model('quotes', 'Quote')
+    Source = apps.get_model('quotes', 'Source')
+    counts = (
+        Quote.objects.filter(source=OuterRef('pk'))
+        .order_by()
+        .values('source')
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    Source.objects.update(
+        quote_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0007_quote_text_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='quote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_quote_count, migrations.RunPython.noop),
+    ]
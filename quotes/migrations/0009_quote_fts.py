@@ -0,0 +1,36 @@
+from django.db import migrations
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS quotes_quote_fts "
+    "USING fts5(text, source, tokenize = 'unicode61 remove_diacritics 2')"
+)
+FILL_SQL = (
+    "INSERT INTO quotes_quote_fts (rowid, text, source) "
+    "SELECT q.id, q.text, s.name FROM quotes_quote q "
+    "JOIN quotes_source s ON s.id = q.source_id"
+)
+
+
+def create_fts_table(apps, schema_editor):
+    # Индекс FTS5 нужен только на SQLite; PostgreSQL ищет по tsvector
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(FILL_SQL)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS quotes_quote_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0008_source_quote_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -1,6 +1,25 @@
-from django.db import models
+import hashlib
+import unicodedata
+
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.core.exceptions import ValidationError
 
+# Сколько цитат может быть у одного источника
+MAX_QUOTES_PER_SOURCE = 3
+
+
+def normalize_text(text):
+    """Приводит текст цитаты к каноническому виду: NFKC, без учета регистра,
+    с одиночными пробелами"""
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def text_hash(text):
+    """Ключ фиксированной длины для поиска дублей по нормализованному тексту"""
+    return hashlib.blake2b(normalize_text(text).encode('utf-8'), digest_size=16).hexdigest()
+
 class Source(models.Model):
     name = models.CharField(max_length=200, unique=True)
     type_choices = [
@@ -10,12 +29,17 @@ class Source(models.Model):
         ('OTHER', 'Другое'),
     ]
     type = models.CharField(max_length=5, choices=type_choices)
+    # Денормализованное число цитат источника; меняется только
+    # условными UPDATE в Quote.save() и при удалении цитат
+    quote_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.get_type_display()}: {self.name}"
 
 class Quote(models.Model):
-    text = models.TextField(unique=True)
+    text = models.TextField()
+    # Уникальный индекс по короткому хешу вместо индекса по всему тексту
+    text_hash = models.CharField(max_length=32, unique=True, null=True, editable=False)
     source = models.ForeignKey(Source, on_delete=models.CASCADE)
     weight = models.IntegerField(default=1)
     views = models.IntegerField(default=0)
@@ -23,16 +47,133 @@ class Quote(models.Model):
     dislikes = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Топ популярных: ORDER BY likes DESC, id ... LIMIT читает начало индекса
+            models.Index(fields=['-likes', 'id'], name='quote_likes_idx'),
+            # Индекс весов сэмплера строится из пар (id, weight) без чтения текстов
+            models.Index(fields=['id', 'weight'], name='quote_id_weight_idx'),
+            # Админка: сортировка по дате, фильтр по дате и по источнику
+            models.Index(fields=['created_at'], name='quote_created_idx'),
+            models.Index(fields=['source', 'created_at'], name='quote_source_created_idx'),
+        ]
+
+    # Поля, значения которых в базе нужны при сохранении
+    TRACKED_FIELDS = ('text', 'source_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None:
+            self._remember_loaded()
+        else:
+            names = set(fields)
+            self._remember_loaded(
+                attname for attname in self.TRACKED_FIELDS
+                if attname in names or self._meta.get_field(attname).name in names
+            )
+
+    def _remember_loaded(self, attnames=None):
+        # Отложенных полей (.only()/.defer()) в __dict__ нет — их значение неизвестно
+        loaded = self.__dict__.setdefault('_loaded', {})
+        for attname in self.TRACKED_FIELDS if attnames is None else attnames:
+            if attname in self.__dict__:
+                loaded[attname] = self.__dict__[attname]
+
+    def loaded_value(self, attname):
+        """Значение поля в базе на момент загрузки; если поле было
+        отложено, оно дочитывается из базы"""
+        loaded = self.__dict__.setdefault('_loaded', {})
+        if attname not in loaded:
+            loaded[attname] = (
+                Quote._base_manager.using(self._state.db)
+                .filter(pk=self.pk).values_list(attname, flat=True).first()
+            )
+        return loaded[attname]
+
+    @property
+    def text_changed(self):
+        return self._state.adding or self.text != self.loaded_value('text')
+
+    @property
+    def source_changed(self):
+        # Отложенный source_id не считается сменой: его значение дочитывается
+        return self._state.adding or self.source_id != self.loaded_value('source_id')
+
     def clean(self):
         if not self.source_id:
             raise ValidationError('Источник обязателен для цитаты')
-        
-        if Quote.objects.filter(source=self.source).exclude(id=self.id).count() >= 3:
-            raise ValidationError('У одного источника не может быть больше 3 цитат')
+
+        # Правка веса или источника у старого дубля без хеша не должна
+        # упираться в его же текст
+        if self.text and self.text_changed and (
+            Quote.objects.filter(text_hash=text_hash(self.text)).exclude(id=self.id).exists()
+        ):
+            raise ValidationError('Такая цитата уже существует в базе данных')
+
+        if self.source_changed:
+            quote_count = Source.objects.filter(pk=self.source_id).values_list('quote_count', flat=True).first()
+            if (quote_count or 0) >= MAX_QUOTES_PER_SOURCE:
+                raise ValidationError(f'У одного источника не может быть больше {MAX_QUOTES_PER_SOURCE} цитат')
 
     def save(self, *args, **kwargs):
+        if self.text_changed:
+            self.text_hash = text_hash(self.text)
         self.clean()
-        super().save(*args, **kwargs)
+        if not self.source_changed:
+            super().save(*args, **kwargs)
+            self._remember_loaded()
+            return
+
+        with transaction.atomic():
+            # Условный UPDATE и резервирует место, и проверяет лимит без гонок
+            reserved = Source.objects.filter(
+                pk=self.source_id, quote_count__lt=MAX_QUOTES_PER_SOURCE
+            ).update(quote_count=F('quote_count') + 1)
+            if not reserved:
+                raise ValidationError(f'У одного источника не может быть больше {MAX_QUOTES_PER_SOURCE} цитат')
+            previous = None if self._state.adding else self.loaded_value('source_id')
+            if previous:
+                Source.objects.filter(pk=previous).update(quote_count=Greatest(F('quote_count') - 1, 0))
+            super().save(*args, **kwargs)
+        self._remember_loaded()
+
+    def __str__(self):
+        return f'"{self.text[:50]}..." from {self.source}'
+
+class Vote(models.Model):
+    """Журнал голосов: одна строка на пару (посетитель, цитата).
+
+    Счетчики likes/dislikes у Quote — денормализованная сумма этого
+    журнала, и команда reconcile_votes умеет их по нему пересчитать.
+    """
+    LIKE = 1
+    DISLIKE = -1
+    NONE = 0
+    value_choices = [
+        (LIKE, 'Лайк'),
+        (DISLIKE, 'Дизлайк'),
+        (NONE, 'Голос снят'),
+    ]
+
+    visitor = models.CharField(max_length=32)
+    quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='votes')
+    value = models.SmallIntegerField(choices=value_choices)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['visitor', 'quote'], name='unique_vote_per_visitor'),
+        ]
+        indexes = [
+            # Покрывает подсчет голосов по цитате при сверке счетчиков
+            models.Index(fields=['quote', 'value'], name='vote_quote_value_idx'),
+        ]
 
     def __str__(self):
-        return f'"{self.text[:50]}..." from {self.source}'
\ No newline at end of file
+        return f'{self.visitor}: {self.get_value_display()} → {self.quote_id}'
@@ -0,0 +1,58 @@
+"""Кэш отрендеренного HTML.
+
+Полные страницы кэшируются только если в них нет ничего, что зависит от
+посетителя; фрагменты (карточки цитат) кэшируются тегом {% cache %} в
+шаблонах, а счетчики голосов и состояние кнопок рендерятся вне
+фрагмента. Ключи включают версии из quotes/versions.py, поэтому голос
+или правка каталога сразу делают старые страницы недостижимыми, а
+карточки зависят только от версии каталога.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .versions import versions
+
+
+class PageCache:
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'QUOTES_PAGE_CACHE', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'QUOTES_PAGE_CACHE_TIMEOUT', 60)
+
+    @property
+    def fragment_timeout(self):
+        return getattr(settings, 'QUOTES_FRAGMENT_CACHE_TIMEOUT', 600)
+
+    @staticmethod
+    def key(name, current):
+        return 'quotes:page:{}:{}:{}'.format(name, current['catalog'], current['counters'])
+
+    def get_or_render(self, name, render):
+        """HTML страницы name; render() вызывается только при промахе"""
+        key = self.key(name, versions.current())
+        html = self.cache.get(key)
+        if html is None:
+            html = render()
+            self.cache.set(key, html, self.timeout)
+        return html
+
+    async def aget_or_render(self, name, arender):
+        key = self.key(name, await versions.acurrent())
+        html = await self.cache.aget(key)
+        if html is None:
+            html = await arender()
+            await self.cache.aset(key, html, self.timeout)
+        return html
+
+    def fragment_context(self):
+        """Переменные для {% cache %} в шаблонах карточек"""
+        return {'versions': versions.current(), 'fragment_timeout': self.fragment_timeout}
+
+    async def afragment_context(self):
+        return {'versions': await versions.acurrent(), 'fragment_timeout': self.fragment_timeout}
+
+
+page_cache = PageCache()
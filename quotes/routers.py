@@ -0,0 +1,86 @@
+"""Чтение с реплики, запись на основную базу.
+
+Реплика включается, если в DATABASES есть псевдоним из
+QUOTES_REPLICA_DATABASE (по умолчанию 'replica'). На реплику уходят
+только чтения внутри представлений, помеченных @reads_from_replica;
+все остальное, включая любые записи, идет в 'default'.
+
+Реплика отстает от основной базы. Поэтому после голосования посетитель
+получает короткоживущую cookie, и пока она действует, его запросы
+читают с основной базы и видят собственный голос.
+"""
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'quotes_primary'
+
+_use_replica = ContextVar('quotes_use_replica', default=False)
+
+
+def replica_alias():
+    """Псевдоним реплики или None, если она не настроена"""
+    alias = getattr(settings, 'QUOTES_REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return replica_alias() or PRIMARY
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Обе базы содержат одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит вместе с данными (репликация или sync_replica)
+        return db == PRIMARY
+
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+def pin_to_primary(response):
+    """После записи посетитель несколько секунд читает с основной базы"""
+    if replica_alias():
+        response.set_cookie(
+            PIN_COOKIE, '1',
+            max_age=getattr(settings, 'QUOTES_REPLICA_PIN_SECONDS', 5),
+            httponly=True, samesite='Lax',
+        )
+    return response
+
+
+def reads_from_replica(view):
+    """Декоратор представления: его чтения идут на реплику"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if is_pinned(request):
+                return await view(request, *args, **kwargs)
+            token = _use_replica.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if is_pinned(request):
+            return view(request, *args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
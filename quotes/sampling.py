@@ -0,0 +1,463 @@
+import random
+import threading
+from array import array
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+from django.db import router
+
+from .models import Quote
+from .routers import PRIMARY
+from .versions import CATALOG, FULL, versions
+
+# Сколько раз пробуем заново, если выбранный id уже удален из базы
+MAX_ATTEMPTS = 3
+
+# Порог, после которого удаленные записи вычищаются из индекса
+COMPACT_MIN_SIZE = 64
+
+# Сколько id перечитывать одним запросом при догоне журнала
+REFRESH_BATCH_SIZE = 500
+
+
+class FenwickSampler:
+    """Взвешенная выборка id по дереву Фенвика.
+
+    Хранит отсортированные id, их веса и дерево частичных сумм в компактных
+    массивах. Выбор и изменение веса работают за O(log n), добавление
+    нового (самого большого) id — тоже за O(log n).
+    """
+
+    def __init__(self, pairs=()):
+        self._lock = threading.RLock()
+        # Увеличивается при каждом изменении, чтобы производные таблицы
+        # (например, AliasSampler) знали, когда их пора пересобрать
+        self.version = 0
+        self.load(pairs)
+
+    def load(self, pairs):
+        """Полностью перестраивает индекс из пар (id, вес), отсортированных по id"""
+        ids = array('q')
+        weights = array('q')
+        for pk, weight in pairs:
+            ids.append(pk)
+            weights.append(max(weight or 0, 0))
+
+        tree = array('q', [0]) * (len(ids) + 1)
+        for i, weight in enumerate(weights, start=1):
+            tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= len(ids):
+                tree[parent] += tree[i]
+
+        with self._lock:
+            self._ids = ids
+            self._weights = weights
+            self._tree = tree
+            self._total = sum(weights)
+            self._live = len(ids)
+            self.version += 1
+
+    def __len__(self):
+        return self._live
+
+    def __contains__(self, pk):
+        return self._position(pk) is not None
+
+    @property
+    def total(self):
+        return self._total
+
+    def weight(self, pk):
+        idx = self._position(pk)
+        return self._weights[idx] if idx is not None else None
+
+    def set(self, pk, weight):
+        """Добавляет id или меняет его вес"""
+        weight = max(weight or 0, 0)
+        with self._lock:
+            idx = bisect_left(self._ids, pk)
+            if idx < len(self._ids) and self._ids[idx] == pk:
+                old = self._weights[idx]
+                if old < 0:
+                    self._live += 1
+                    old = 0
+                self._weights[idx] = weight
+                self._add(idx + 1, weight - old)
+                self.version += 1
+            elif idx == len(self._ids):
+                self._append(pk, weight)
+                self.version += 1
+            else:
+                # Вставка в середину бывает редко (id выдаются по возрастанию),
+                # поэтому просто перестраиваем индекс
+                pairs = self.items()
+                pairs.insert(bisect_left([p for p, _ in pairs], pk), (pk, weight))
+                self.load(pairs)
+
+    def discard(self, pk):
+        """Убирает id из выборки (оставляет «надгробие» до уплотнения)"""
+        with self._lock:
+            idx = self._position(pk)
+            if idx is None:
+                return
+            self._add(idx + 1, -self._weights[idx])
+            self._weights[idx] = -1
+            self._live -= 1
+            self.version += 1
+            dead = len(self._ids) - self._live
+            if len(self._ids) >= COMPACT_MIN_SIZE and dead > self._live:
+                self.load(self.items())
+
+    def sample(self, exclude=None, rng=random):
+        """Возвращает случайный id пропорционально весу или None"""
+        with self._lock:
+            ex_idx = self._position(exclude) if exclude is not None else None
+            ex_weight = self._weights[ex_idx] if ex_idx is not None else 0
+            live = self._live - (1 if ex_idx is not None else 0)
+            if live <= 0:
+                return None
+
+            available = self._total - ex_weight
+            if available <= 0:
+                # Все веса нулевые — выбираем равновероятно, как раньше
+                while True:
+                    idx = rng.randrange(len(self._ids))
+                    if self._weights[idx] >= 0 and idx != ex_idx:
+                        return self._ids[idx]
+
+            r = rng.randrange(available)
+            if ex_idx is not None and r >= self._prefix(ex_idx):
+                # Перескакиваем через отрезок исключенной цитаты
+                r += ex_weight
+            return self._ids[self._find(r)]
+
+    def _position(self, pk):
+        if pk is None:
+            return None
+        idx = bisect_left(self._ids, pk)
+        if idx < len(self._ids) and self._ids[idx] == pk and self._weights[idx] >= 0:
+            return idx
+        return None
+
+    def items(self):
+        """Живые пары (id, вес) в порядке возрастания id"""
+        return [(pk, w) for pk, w in zip(self._ids, self._weights) if w >= 0]
+
+    def _append(self, pk, weight):
+        i = len(self._ids) + 1
+        node = weight + self._prefix(i - 1) - self._prefix(i - (i & -i))
+        self._ids.append(pk)
+        self._weights.append(weight)
+        self._tree.append(node)
+        self._total += weight
+        self._live += 1
+
+    def _add(self, i, delta):
+        if not delta:
+            return
+        self._total += delta
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i):
+        """Сумма весов первых i элементов"""
+        result = 0
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+    def _find(self, r):
+        """Индекс первого элемента, на котором префиксная сумма превышает r"""
+        pos = 0
+        step = 1 << (len(self._ids).bit_length())
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= r:
+                pos = nxt
+                r -= self._tree[nxt]
+            step >>= 1
+        return pos
+
+
+class AliasSampler:
+    """Таблица псевдонимов Уолкера–Воуза для пакетной взвешенной выборки.
+
+    Построение за O(n), каждая выборка за O(1), так что K цитат вытягиваются
+    за O(K). Таблица хранится в трех плоских массивах (id, вероятность,
+    индекс псевдонима), а не в списке моделей.
+    """
+
+    def __init__(self, pairs=()):
+        ids = array('q')
+        weights = []
+        for pk, weight in pairs:
+            ids.append(pk)
+            weights.append(max(weight or 0, 0))
+
+        n = len(ids)
+        total = sum(weights)
+        prob = array('d', [1.0]) * n
+        alias = array('q', range(n))
+
+        if n and total > 0:
+            scaled = [w * n / total for w in weights]
+            small = [i for i, p in enumerate(scaled) if p < 1.0]
+            large = [i for i, p in enumerate(scaled) if p >= 1.0]
+            while small and large:
+                less = small.pop()
+                more = large.pop()
+                prob[less] = scaled[less]
+                alias[less] = more
+                scaled[more] = scaled[more] + scaled[less] - 1.0
+                if scaled[more] < 1.0:
+                    small.append(more)
+                else:
+                    large.append(more)
+            # Остатки из-за погрешности округления считаются «полными» ячейками
+            for i in small + large:
+                prob[i] = 1.0
+
+        self._ids = ids
+        self._prob = prob
+        self._alias = alias
+
+    def __len__(self):
+        return len(self._ids)
+
+    def sample(self, rng=random):
+        if not self._ids:
+            return None
+        i = rng.randrange(len(self._ids))
+        if rng.random() < self._prob[i]:
+            return self._ids[i]
+        return self._ids[self._alias[i]]
+
+    def sample_many(self, k, rng=random):
+        """Возвращает k id (с повторениями) за O(k)"""
+        if not self._ids:
+            return []
+        n = len(self._ids)
+        ids, prob, alias = self._ids, self._prob, self._alias
+        result = []
+        for _ in range(k):
+            i = rng.randrange(n)
+            result.append(ids[i] if rng.random() < prob[i] else ids[alias[i]])
+        return result
+
+
+class QuoteSampler:
+    """Ленивый индекс весов цитат, общий для процесса.
+
+    Строится одним запросом values_list('id', 'weight') при первом обращении
+    и дальше поддерживается сигналами post_save/post_delete модели Quote.
+    Изменения из других процессов (воркеров, import_quotes) приходят через
+    версию catalog: перед выборкой индекс сверяет ее одним чтением кэша и
+    перечитывает веса цитат из журнала версий, а если журнал неполон —
+    строится заново. Индекс общий для всех запросов, поэтому меняется он только по данным
+    основной базы: сами цитаты могут читаться с отстающей реплики, и
+    промах там означает лишь, что строка до нее еще не дошла.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._seen = None
+        self._alias = None
+        self._alias_version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def weights_queryset():
+        return Quote.objects.using(PRIMARY).order_by('id').values_list('id', 'weight')
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    # Версия читается до данных: изменения во время
+                    # построения будут догнаны по журналу
+                    seen = versions.current([CATALOG])[CATALOG]
+                    pairs = self.weights_queryset().iterator(chunk_size=2000)
+                    self._index = FenwickSampler(pairs)
+                    self._seen = seen
+        return self._index
+
+    @property
+    def alias(self):
+        """Таблица псевдонимов, пересобираемая только после изменений индекса"""
+        index = self.index
+        if self._alias is None or self._alias_version != index.version:
+            with self._lock:
+                version = index.version
+                self._alias = AliasSampler(index.items())
+                self._alias_version = version
+        return self._alias
+
+    def reset(self):
+        """Сбрасывает индекс; он будет перестроен при следующем обращении"""
+        self._index = None
+        self._alias = None
+
+    def sync(self, current=None):
+        """Догоняет изменения каталога, сделанные другими процессами"""
+        if current is None:
+            current = versions.current([CATALOG])[CATALOG]
+        if self._index is None or current == self._seen:
+            return
+        with self._lock:
+            index, seen = self._index, self._seen
+            if index is None or current == seen:
+                return
+            entries = versions.changes(CATALOG, seen, current)
+            if entries is None or FULL in entries:
+                # Журнал неполон или изменение сделано в обход сигналов
+                self._index = None
+                self._alias = None
+                return
+            quote_ids = list({pk for kind, pk in entries if kind == 'quote'})
+            weights = {}
+            for start in range(0, len(quote_ids), REFRESH_BATCH_SIZE):
+                batch = quote_ids[start:start + REFRESH_BATCH_SIZE]
+                weights.update(self.weights_queryset().filter(pk__in=batch))
+            for quote_id in quote_ids:
+                if quote_id in weights:
+                    index.set(quote_id, weights[quote_id])
+                else:
+                    index.discard(quote_id)
+            self._seen = current
+
+    async def async_sync(self):
+        current = (await versions.acurrent([CATALOG]))[CATALOG]
+        if self._index is not None and current != self._seen:
+            await sync_to_async(self.sync)(current)
+
+    def update(self, quote):
+        if self._index is not None:
+            self._index.set(quote.pk, quote.weight)
+
+    def discard(self, quote_id):
+        if self._index is not None:
+            self._index.discard(quote_id)
+
+    @staticmethod
+    def _present_on_primary(quote_ids):
+        """Запрос id из quote_ids, которые есть на основной базе; None — и так читали с нее"""
+        if router.db_for_read(Quote) == PRIMARY:
+            return None
+        return Quote.objects.using(PRIMARY).filter(pk__in=quote_ids).values_list('id', flat=True)
+
+    def _forget_missing(self, quote_ids):
+        """Убирает из индекса удаленные цитаты; возвращает их id"""
+        missing = set(quote_ids)
+        present = self._present_on_primary(missing) if missing else None
+        if present is not None:
+            missing -= set(present)
+        for quote_id in missing:
+            self.discard(quote_id)
+        return missing
+
+    async def _aforget_missing(self, quote_ids):
+        missing = set(quote_ids)
+        present = self._present_on_primary(missing) if missing else None
+        if present is not None:
+            missing -= {quote_id async for quote_id in present}
+        for quote_id in missing:
+            self.discard(quote_id)
+        return missing
+
+    def _sync_weight(self, quote):
+        # Вес, прочитанный с реплики, может быть старым — его не переносим
+        if quote._state.db == PRIMARY and self.index.weight(quote.pk) != max(quote.weight, 0):
+            self.update(quote)
+
+    def sample_id(self, exclude_id=None):
+        if exclude_id is not None:
+            exclude_id = int(exclude_id)
+        return self.index.sample(exclude=exclude_id)
+
+    def choice(self, exclude_id=None):
+        """Возвращает случайную цитату, загружая из базы одну строку по id"""
+        self.sync()
+        stale = False
+        for attempt in range(MAX_ATTEMPTS + 1):
+            if attempt == MAX_ATTEMPTS and stale:
+                # Индекс сильно разошелся с базой (например, после bulk-операций)
+                self.reset()
+            quote_id = self.sample_id(exclude_id)
+            if quote_id is None:
+                return None
+            quote = Quote.objects.select_related('source').filter(pk=quote_id).first()
+            if quote is not None:
+                self._sync_weight(quote)
+                return quote
+            stale = bool(self._forget_missing({quote_id})) or stale
+        return None
+
+    async def achoice(self, exclude_id=None):
+        """Асинхронный вариант choice() для ASGI-представлений"""
+        await self.async_sync()
+        if self._index is None:
+            # Построение индекса — редкая синхронная операция
+            await sync_to_async(lambda: self.index)()
+        stale = False
+        for attempt in range(MAX_ATTEMPTS + 1):
+            if attempt == MAX_ATTEMPTS and stale:
+                self.reset()
+                await sync_to_async(lambda: self.index)()
+            quote_id = self.sample_id(exclude_id)
+            if quote_id is None:
+                return None
+            quote = await Quote.objects.select_related('source').filter(pk=quote_id).afirst()
+            if quote is not None:
+                self._sync_weight(quote)
+                return quote
+            stale = bool(await self._aforget_missing({quote_id})) or stale
+        return None
+
+    def choices(self, k):
+        """Возвращает k случайных цитат (с повторениями) одним запросом к базе"""
+        self.sync()
+        quote_ids = self.alias.sample_many(k)
+        quotes = Quote.objects.select_related('source').in_bulk(set(quote_ids))
+        self._forget_missing(set(quote_ids) - quotes.keys())
+        return [quotes[quote_id] for quote_id in quote_ids if quote_id in quotes]
+
+    def distinct_choices(self, k, exclude_ids=()):
+        """Возвращает до k разных случайных цитат, пропуская exclude_ids.
+
+        Вытягивает id из таблицы псевдонимов с запасом и отбрасывает повторы,
+        поэтому порядок цитат соответствует весам, а к базе идет один запрос.
+        """
+        self.sync()
+        exclude_ids = {int(quote_id) for quote_id in exclude_ids}
+        alias = self.alias
+
+        chosen = []
+        seen = set(exclude_ids)
+        for _ in range(MAX_ATTEMPTS * 4):
+            if len(chosen) >= k:
+                break
+            for quote_id in alias.sample_many(2 * (k - len(chosen)) + 1):
+                if quote_id not in seen:
+                    seen.add(quote_id)
+                    chosen.append(quote_id)
+        else:
+            # Каталог почти исчерпан — добираем оставшиеся цитаты из индекса
+            index = self.index
+            for quote_id, weight in index.items():
+                if len(chosen) >= k:
+                    break
+                if quote_id not in seen and (weight > 0 or index.total == 0):
+                    seen.add(quote_id)
+                    chosen.append(quote_id)
+        chosen = chosen[:k]
+
+        quotes = Quote.objects.select_related('source').in_bulk(chosen)
+        self._forget_missing(set(chosen) - quotes.keys())
+        return [quotes[quote_id] for quote_id in chosen if quote_id in quotes]
+
+
+quote_sampler = QuoteSampler()
@@ -0,0 +1,168 @@
+"""Полнотекстовый поиск по цитатам.
+
+Бэкенд выбирается по СУБД: для SQLite — виртуальная таблица FTS5,
+синхронизируемая сигналами модели; для PostgreSQL — tsvector с
+ранжированием через django.contrib.postgres. Свой бэкенд можно указать
+в настройке QUOTES_SEARCH_BACKEND (путь к классу).
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import Quote
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchBackend:
+    """Общий интерфейс: поддержка индекса и ранжированный поиск"""
+
+    def index(self, quotes):
+        """Добавляет или обновляет цитаты в индексе"""
+        self.index_rows([(quote.id, quote.text, quote.source.name) for quote in quotes])
+
+    def index_rows(self, rows):
+        """То же для готовых кортежей (id, текст, имя источника)"""
+
+    def remove(self, quote_ids):
+        """Удаляет цитаты из индекса"""
+
+    def reindex_source(self, source):
+        """Обновляет имя источника у всех его цитат"""
+
+    def rebuild(self):
+        """Полностью перестраивает индекс"""
+
+    def count(self, query):
+        raise NotImplementedError
+
+    def search_ids(self, query, offset, limit):
+        """Возвращает id цитат по убыванию релевантности"""
+        raise NotImplementedError
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    table = 'quotes_quote_fts'
+
+    @staticmethod
+    def match_expression(query):
+        """Превращает пользовательский ввод в безопасный запрос FTS5:
+        каждое слово ищется как префикс, слова объединяются через AND"""
+        tokens = TOKEN_RE.findall(query)
+        return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+    def index_rows(self, rows):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, text, source) VALUES (%s, %s, %s)', rows
+            )
+
+    def remove(self, quote_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in quote_ids])
+
+    def reindex_source(self, source):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {self.table} SET source = %s '
+                f'WHERE rowid IN (SELECT id FROM quotes_quote WHERE source_id = %s)',
+                [source.name, source.id]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, text, source) '
+                f'SELECT q.id, q.text, s.name FROM quotes_quote q '
+                f'JOIN quotes_source s ON s.id = q.source_id'
+            )
+
+    def count(self, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table} WHERE {self.table} MATCH %s', [expression])
+            return cursor.fetchone()[0]
+
+    def search_ids(self, query, offset, limit):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        with connection.cursor() as cursor:
+            # bm25: чем меньше, тем релевантнее; совпадение в тексте весит больше
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, 10.0, 1.0) LIMIT %s OFFSET %s',
+                [expression, limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector-поиск прямо по таблице цитат.
+
+    Для скорости нужен GIN-индекс по выражению
+    to_tsvector(config, text || ' ' || имя источника); отдельная таблица
+    не требуется, поэтому index/remove ничего не делают.
+    """
+
+    @property
+    def config(self):
+        return getattr(settings, 'QUOTES_SEARCH_CONFIG', 'russian')
+
+    def queryset(self, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = SearchVector('text', weight='A', config=self.config) + \
+            SearchVector('source__name', weight='B', config=self.config)
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        return (
+            Quote.objects.annotate(rank=SearchRank(vector, search_query))
+            .filter(rank__gt=0)
+        )
+
+    def count(self, query):
+        return self.queryset(query).count()
+
+    def search_ids(self, query, offset, limit):
+        ids = self.queryset(query).order_by('-rank', 'id').values_list('id', flat=True)
+        return list(ids[offset:offset + limit])
+
+
+def get_backend():
+    path = getattr(settings, 'QUOTES_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return SQLiteFTS5Backend()
+
+
+class SearchResults:
+    """Ленивый список результатов для django.core.paginator.Paginator:
+    считает совпадения и загружает только запрошенную страницу"""
+
+    def __init__(self, query, backend=None):
+        self.query = query
+        self.backend = backend or get_backend()
+
+    def count(self):
+        return self.backend.count(self.query)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        offset = item.start or 0
+        ids = self.backend.search_ids(self.query, offset, item.stop - offset)
+        quotes = Quote.objects.select_related('source').in_bulk(ids)
+        return [quotes[pk] for pk in ids if pk in quotes]
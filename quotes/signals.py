@@ -0,0 +1,67 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .leaderboard import leaderboard
+from .models import Quote, Source
+from .sampling import quote_sampler
+from .search import get_backend
+from .versions import CATALOG, versions
+
+
+@receiver(post_save, sender=Quote)
+def update_sampler_on_save(sender, instance, **kwargs):
+    """Поддерживает индекс весов в актуальном состоянии при сохранении цитаты"""
+    quote_sampler.update(instance)
+
+
+@receiver(post_delete, sender=Quote)
+def update_sampler_on_delete(sender, instance, **kwargs):
+    quote_sampler.discard(instance.pk)
+
+
+@receiver(post_delete, sender=Quote)
+def decrement_source_quote_count(sender, instance, **kwargs):
+    """Освобождает место у источника; при каскадном удалении источника
+    UPDATE просто ничего не найдет"""
+    Source.objects.filter(pk=instance.source_id).update(
+        quote_count=Greatest(F('quote_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_delete, sender=Quote)
+@receiver(post_save, sender=Source)
+@receiver(post_delete, sender=Source)
+def invalidate_leaderboard(sender, **kwargs):
+    """Правка или удаление цитаты/источника может изменить топ популярных"""
+    leaderboard.invalidate()
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_delete, sender=Quote)
+@receiver(post_save, sender=Source)
+@receiver(post_delete, sender=Source)
+def bump_catalog_version(sender, instance, **kwargs):
+    """Кэшированные карточки и страницы перестают совпадать по ключу,
+    снимки каталога перечитывают только измененную цитату или источник"""
+    versions.bump(CATALOG, change=('quote' if sender is Quote else 'source', instance.pk))
+
+
+@receiver(post_save, sender=Quote)
+def index_quote(sender, instance, **kwargs):
+    """Держит полнотекстовый индекс в синхроне с таблицей цитат"""
+    get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Quote)
+def unindex_quote(sender, instance, **kwargs):
+    get_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Source)
+def reindex_source(sender, instance, created, **kwargs):
+    """Имя источника тоже ищется — переписываем его у всех цитат источника"""
+    if not created:
+        get_backend().reindex_source(instance)
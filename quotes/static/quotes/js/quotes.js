@@ -0,0 +1,88 @@
+function rateQuote(action, quoteId) {
+    const likeBtn = document.getElementById('like-btn');
+    const dislikeBtn = document.getElementById('dislike-btn');
+
+    // Сохраняем оригинальный текст
+    const likeText = likeBtn.innerHTML;
+    const dislikeText = dislikeBtn.innerHTML;
+
+    // Показываем загрузку
+    likeBtn.innerHTML = '⏳';
+    dislikeBtn.innerHTML = '⏳';
+    likeBtn.disabled = true;
+    dislikeBtn.disabled = true;
+
+    fetch(`/${action}/${quoteId}/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': getCookie('csrftoken'),
+            'Content-Type': 'application/json'
+        }
+    })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        if (data.success) {
+            // Обновляем счетчики в блоке статистики
+            const likesElement = document.querySelector('.likes-count');
+            const dislikesElement = document.querySelector('.dislikes-count');
+
+            if (likesElement) likesElement.textContent = `👍 ${data.likes}`;
+            if (dislikesElement) dislikesElement.textContent = `👎 ${data.dislikes}`;
+
+            // Обновляем состояние кнопок
+            likeBtn.disabled = data.user_has_liked;
+            dislikeBtn.disabled = data.user_has_disliked;
+
+            // Восстанавливаем текст кнопок
+            likeBtn.innerHTML = '👍 Лайк';
+            dislikeBtn.innerHTML = '👎 Дизлайк';
+
+            // Добавляем/убираем классы для визуальной обратной связи
+            if (data.user_has_liked) {
+                likeBtn.classList.add('rated');
+                dislikeBtn.classList.remove('rated');
+            } else if (data.user_has_disliked) {
+                dislikeBtn.classList.add('rated');
+                likeBtn.classList.remove('rated');
+            } else {
+                likeBtn.classList.remove('rated');
+                dislikeBtn.classList.remove('rated');
+            }
+        } else {
+            alert('Ошибка: ' + (data.message || 'Неизвестная ошибка'));
+            // Восстанавливаем кнопки
+            likeBtn.innerHTML = likeText;
+            dislikeBtn.innerHTML = dislikeText;
+            likeBtn.disabled = false;
+            dislikeBtn.disabled = false;
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('Ошибка сети: ' + error.message);
+        likeBtn.innerHTML = likeText;
+        dislikeBtn.innerHTML = dislikeText;
+        likeBtn.disabled = false;
+        dislikeBtn.disabled = false;
+    });
+}
+
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
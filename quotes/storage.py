@@ -0,0 +1,69 @@
+"""Хранилище статики для продакшена.
+
+collectstatic копирует файлы с хешем содержимого в имени
+(base.3f2a1c.css), а затем рядом кладет их сжатые копии .gz и, если
+установлен пакет brotli, .br. Веб-сервер отдает готовые файлы
+(nginx: gzip_static / brotli_static) и может разрешить кэшировать их
+навсегда — новое содержимое получит новое имя.
+"""
+import gzip
+from pathlib import Path
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml'}
+# Маленькие файлы сжимать бессмысленно: выигрыш меньше заголовков
+MIN_SIZE = 256
+
+
+def compress_file(path):
+    """Пишет path.gz и path.br, если они меньше исходника; возвращает их список"""
+    data = path.read_bytes()
+    if len(data) < MIN_SIZE:
+        return []
+
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            target = path.with_name(path.name + suffix)
+            target.write_bytes(compressed)
+            written.append(target)
+    return written
+
+
+def is_compressed(path):
+    """Сжатая копия уже есть и не старше исходника"""
+    target = path.with_name(path.name + '.gz')
+    return target.exists() and target.stat().st_mtime >= path.stat().st_mtime
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        # Сжимаем только собранные файлы и их версии с хешем в имени, а не
+        # все содержимое STATIC_ROOT; неизменившиеся файлы не пересжимаем
+        root = Path(self.location)
+        names = set()
+        for name in paths:
+            names.add(name)
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            if hashed_name:
+                names.add(hashed_name)
+        for name in sorted(names):
+            path = Path(self.path(name))
+            if path.suffix not in COMPRESSIBLE_EXTENSIONS or not path.is_file() or is_compressed(path):
+                continue
+            for target in compress_file(path):
+                yield name, str(target.relative_to(root)), True
@@ -1,10 +1,83 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
-from django.test import TestCase
-from django.urls import reverse
-from .models import Source, Quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.files.storage import storages
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, router
+from django.http import Http404, HttpResponse
+from django.test import AsyncRequestFactory, Client, TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import async_views
+from .catalog import QuoteRecord, catalog_snapshot
+from .counters import view_counter
+from .db import configure_sqlite
+from .dedup import find_near_duplicates
+from .forms import QuoteForm
+from .leaderboard import leaderboard
+from .management.commands.replay_requests import InProcessSession
+from .metrics import metrics
+from .middleware import MetricsMiddleware
+from .models import Quote, Source, Vote, text_hash
+from .routers import PIN_COOKIE, reads_from_replica
+from .sampling import AliasSampler, FenwickSampler, quote_sampler
+from .search import SearchResults
+from .versions import CATALOG, COUNTERS, versions
+from .views import get_random_quote
+from .visitor_votes import VisitorVotes
+from .votes import apply_vote, ledger_entry, record_votes, vote_transition
+
+# Таймер сброса просмотров писал бы в тестовую базу из своего потока
+_view_timer_off = override_settings(QUOTES_VIEW_FLUSH_TIMER=False)
+
+
+def setUpModule():
+    _view_timer_off.enable()
+
+
+def tearDownModule():
+    # Просмотры тестовых цитат не должны попасть в базу при выходе
+    view_counter.discard()
+    view_counter.stop()
+    _view_timer_off.disable()
+
+
+class QuoteFixtureMixin:
+    """Источник с одной цитатой и чистые кэши процесса перед каждым тестом"""
+    source_name = "Fixture Source"
+    source_type = "BOOK"
+    quote_text = "Fixture quote"
+    quote_fields = {}
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        view_counter.discard()
+        quote_sampler.reset()
+        self.source = Source.objects.create(name=self.source_name, type=self.source_type)
+        self.quote = Quote.objects.create(text=self.quote_text, source=self.source, **self.quote_fields)
 
 class SourceModelTest(TestCase):
     def setUp(self):
@@ -179,8 +252,6 @@ class FormsTest(TestCase):
 
     def test_quote_form_valid_data(self):
         """Test quote form with valid data"""
-        from .forms import QuoteForm
-        
         form_data = {
             'text': 'New test quote',
             'source_name': 'New Movie',
@@ -193,8 +264,6 @@ class FormsTest(TestCase):
 
     def test_quote_form_invalid_data(self):
         """Test quote form with invalid data"""
-        from .forms import QuoteForm
-        
         form_data = {
             'text': '',  # Empty text
             'source_name': 'New Movie',
@@ -230,8 +299,6 @@ class WeightSystemTest(TestCase):
 
     def test_weight_influence(self):
         """Test that higher weight quotes appear more frequently"""
-        from .views import get_random_quote
-        
         # Test multiple times to see distribution
         results = []
         for _ in range(100):
@@ -245,6 +312,53 @@ class WeightSystemTest(TestCase):
         
         self.assertGreater(high_weight_count, low_weight_count)
 
+    def assertMatchesWeights(self, draws, weights, delta=0.02):
+        """Check that observed frequencies match weight / total weight"""
+        total = sum(weights.values())
+        for quote_id, weight in weights.items():
+            self.assertAlmostEqual(
+                draws.count(quote_id) / len(draws), weight / total, delta=delta
+            )
+
+    def test_alias_sampler_distribution(self):
+        """Test that alias draws follow the weights"""
+        weights = {1: 1, 2: 10, 3: 4, 4: 0, 5: 25}
+        sampler = AliasSampler(sorted(weights.items()))
+        draws = sampler.sample_many(40000, rng=random.Random(7))
+
+        self.assertEqual(len(draws), 40000)
+        self.assertNotIn(4, draws)
+        self.assertMatchesWeights(draws, weights)
+
+    def test_alias_sampler_zero_weights_uniform(self):
+        """Test that all-zero weights fall back to a uniform choice"""
+        sampler = AliasSampler([(1, 0), (2, 0)])
+        draws = sampler.sample_many(4000, rng=random.Random(3))
+        self.assertMatchesWeights(draws, {1: 1, 2: 1}, delta=0.03)
+
+    def test_batch_draws_match_get_random_quote(self):
+        """Test that batch draws and get_random_quote share one distribution"""
+        quote_sampler.reset()
+        random.seed(11)
+        weights = {
+            self.low_weight_quote.id: 1,
+            self.high_weight_quote.id: 10,
+        }
+
+        batch = [quote.id for quote in quote_sampler.choices(3000)]
+        single = [get_random_quote().id for _ in range(1000)]
+
+        self.assertMatchesWeights(batch, weights)
+        self.assertMatchesWeights(single, weights, delta=0.04)
+
+    def test_batch_draws_single_query(self):
+        """Test that a batch of quotes is loaded with one query"""
+        quote_sampler.reset()
+        quote_sampler.index
+        with self.assertNumQueries(1):
+            quotes = quote_sampler.choices(50)
+        self.assertEqual(len(quotes), 50)
+
 
 class SessionBehaviorTest(TestCase):
     def setUp(self):
@@ -280,4 +394,1639 @@ class SessionBehaviorTest(TestCase):
         )
         data = response.json()
         self.assertFalse(data['success'])
-        self.assertIn('уже лайкали', data['message'])
\ No newline at end of file
+        self.assertIn('уже лайкали', data['message'])
+
+class WeightedSamplerTest(TestCase):
+    def setUp(self):
+        quote_sampler.reset()
+        self.source = Source.objects.create(
+            name="Sampler Source",
+            type="BOOK"
+        )
+
+    def test_fenwick_distribution(self):
+        """Test that ids are drawn proportionally to their weights"""
+        sampler = FenwickSampler([(1, 1), (2, 0), (5, 3)])
+        rng = random.Random(42)
+        results = [sampler.sample(rng=rng) for _ in range(4000)]
+
+        self.assertNotIn(2, results)
+        self.assertAlmostEqual(results.count(5) / len(results), 0.75, delta=0.03)
+
+    def test_fenwick_exclude(self):
+        """Test that the excluded id is never returned"""
+        sampler = FenwickSampler([(1, 5), (2, 1), (3, 5)])
+        results = {sampler.sample(exclude=1) for _ in range(200)}
+        self.assertEqual(results, {2, 3})
+
+        single = FenwickSampler([(7, 1)])
+        self.assertIsNone(single.sample(exclude=7))
+
+    def test_fenwick_incremental_updates(self):
+        """Test append, weight change and discard keep totals consistent"""
+        sampler = FenwickSampler([(1, 2), (2, 3)])
+        sampler.set(3, 4)
+        sampler.set(1, 10)
+        sampler.discard(2)
+
+        self.assertEqual(sampler.total, 14)
+        self.assertEqual(len(sampler), 2)
+        self.assertNotIn(2, sampler)
+        self.assertEqual(sampler._prefix(3), 14)
+
+    def test_sampler_follows_model_signals(self):
+        """Test that saving and deleting quotes updates the sampler"""
+        first = Quote.objects.create(text="Sampler one", source=self.source, weight=2)
+        self.assertEqual(get_random_quote(), first)
+
+        second = Quote.objects.create(text="Sampler two", source=self.source, weight=3)
+        self.assertEqual(quote_sampler.index.total, 5)
+        self.assertEqual(get_random_quote(exclude_id=first.id), second)
+
+        second.delete()
+        self.assertEqual(quote_sampler.index.total, 2)
+        self.assertIsNone(get_random_quote(exclude_id=first.id))
+
+    def test_replica_miss_keeps_quote_in_index(self):
+        """Test that a quote missing only on a lagging replica is not discarded"""
+        quote = Quote.objects.create(text="Not replicated yet", source=self.source, weight=2)
+        gone = Quote.objects.create(text="Deleted behind signals", source=self.source, weight=3)
+        index = quote_sampler.index
+        Quote.objects.filter(pk=gone.pk).delete()
+
+        lagging = mock.MagicMock()
+        lagging.filter.return_value.first.return_value = None
+        lagging.in_bulk.return_value = {}
+        with mock.patch('quotes.sampling.router.db_for_read', return_value='replica'), \
+                mock.patch.object(Quote.objects, 'select_related', return_value=lagging):
+            quote_sampler.distinct_choices(2)
+            self.assertIn(quote.pk, index)
+            self.assertNotIn(gone.pk, index)
+
+            self.assertIsNone(quote_sampler.choice())
+        self.assertIs(quote_sampler.index, index)
+        self.assertEqual(index.weight(quote.pk), 2)
+
+    def test_replica_reads_do_not_change_weights(self):
+        """Test that a stale weight read from a replica is not copied into the index"""
+        quote = Quote.objects.create(text="Reweighted", source=self.source, weight=2)
+        index = quote_sampler.index
+        stale = Quote.objects.get(pk=quote.pk)
+        stale.weight = 9
+        stale._state.db = 'replica'
+
+        lagging = mock.MagicMock()
+        lagging.filter.return_value.first.return_value = stale
+        with mock.patch.object(Quote.objects, 'select_related', return_value=lagging):
+            self.assertEqual(quote_sampler.choice(), stale)
+        self.assertEqual(index.weight(quote.pk), 2)
+
+    def test_index_follows_other_processes_through_journal(self):
+        """Test that quotes changed without local signals are picked up from the journal"""
+        first = Quote.objects.create(text="Local quote", source=self.source, weight=1)
+        self.assertEqual(get_random_quote(), first)
+
+        # Другой процесс: строка появилась в базе, а в журнал попал ее id
+        heavy = Quote.objects.bulk_create([Quote(text="Remote heavy", source=self.source, weight=1000)])[0]
+        versions.bump(CATALOG, change=('quote', heavy.pk))
+        Quote.objects.filter(pk=first.pk).update(weight=0)
+        versions.bump(CATALOG, change=('quote', first.pk))
+
+        self.assertEqual(get_random_quote(), heavy)
+        self.assertEqual(quote_sampler.index.weight(first.pk), 0)
+        self.assertEqual(quote_sampler.index.total, 1000)
+
+        Quote.objects.filter(pk=heavy.pk)._raw_delete(Quote.objects.db)
+        versions.bump(CATALOG, change=('quote', heavy.pk))
+        self.assertEqual(get_random_quote(), first)
+        self.assertNotIn(heavy.pk, quote_sampler.index)
+
+    def test_unjournaled_change_rebuilds_index(self):
+        """Test that a bare catalog bump (e.g. import_quotes) rebuilds the index"""
+        Quote.objects.create(text="Before import", source=self.source, weight=1)
+        index = quote_sampler.index
+        Quote.objects.bulk_create([Quote(text="Imported", source=self.source, weight=5)])
+        versions.bump(CATALOG)
+
+        get_random_quote()
+        self.assertIsNot(quote_sampler.index, index)
+        self.assertEqual(quote_sampler.index.total, 6)
+
+    def test_index_is_built_from_primary(self):
+        """Test that the shared index never loads weights from the replica"""
+        @reads_from_replica
+        def view(request):
+            return quote_sampler.weights_queryset().db
+
+        replica = {**settings.DATABASES, 'replica': {**settings.DATABASES['default'], 'NAME': 'replica.sqlite3'}}
+        with self.settings(DATABASES=replica):
+            self.assertEqual(view(RequestFactory().get('/')), 'default')
+
+    def test_random_quote_single_query(self):
+        """Test that a warm sampler fetches one row by primary key"""
+        Quote.objects.create(text="Sampler query", source=self.source, weight=1)
+        get_random_quote()
+        with self.assertNumQueries(1):
+            get_random_quote()
+
+
+class AtomicVoteTest(QuoteFixtureMixin, TestCase):
+    source_name, source_type, quote_text = "Vote Source", "SONG", "Vote quote"
+
+    def test_vote_transitions(self):
+        """Test deltas for add, remove and switch"""
+        self.assertEqual(vote_transition('like', None)[:3], ('like', 1, 0))
+        self.assertEqual(vote_transition('like', 'like')[:3], (None, -1, 0))
+        self.assertEqual(vote_transition('like', 'dislike')[:3], ('like', 1, -1))
+        self.assertEqual(vote_transition('dislike', 'like')[:3], ('dislike', -1, 1))
+
+    def test_apply_vote_is_relative(self):
+        """Test that updates are applied on top of the stored counters"""
+        # Другой процесс успел изменить счетчик после загрузки цитаты
+        Quote.objects.filter(pk=self.quote.pk).update(likes=5)
+
+        counters = apply_vote(self.quote.pk, 1, 0)
+        self.assertEqual(counters, {'likes': 6, 'dislikes': 0})
+
+    def test_apply_vote_never_negative(self):
+        """Test that counters do not drop below zero"""
+        counters = apply_vote(self.quote.pk, -1, 1)
+        self.assertEqual(counters, {'likes': 0, 'dislikes': 1})
+
+    def test_apply_vote_missing_quote(self):
+        """Test that a missing quote returns None"""
+        self.assertIsNone(apply_vote(self.quote.pk + 100, 1, 0))
+
+    def test_like_switch_and_remove(self):
+        """Test like, switch to dislike and removal through the views"""
+        like_url = reverse('like_quote', args=[self.quote.id])
+        dislike_url = reverse('dislike_quote', args=[self.quote.id])
+
+        data = self.client.post(like_url).json()
+        self.assertEqual((data['likes'], data['dislikes']), (1, 0))
+        self.assertTrue(data['user_has_liked'])
+
+        data = self.client.post(dislike_url).json()
+        self.assertEqual((data['likes'], data['dislikes']), (0, 1))
+        self.assertTrue(data['user_has_disliked'])
+
+        data = self.client.post(dislike_url).json()
+        self.assertEqual((data['likes'], data['dislikes']), (0, 0))
+        self.assertFalse(data['user_has_disliked'])
+
+    def test_vote_skips_model_validation(self):
+        """Test that a vote does not run the per-source COUNT from clean()"""
+        with CaptureQueriesContext(connection) as context:
+            apply_vote(self.quote.pk, 1, 0)
+
+        statements = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(sum(sql.startswith('UPDATE') for sql in statements), 1)
+        self.assertFalse(any('COUNT(' in sql for sql in statements))
+
+    def test_vote_missing_quote_returns_404(self):
+        """Test that voting for an unknown quote returns 404"""
+        response = self.client.post(reverse('like_quote', args=[self.quote.id + 100]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ViewCounterTest(QuoteFixtureMixin, TestCase):
+    source_name, source_type, quote_text = "Views Source", "MOV", "Views quote"
+
+    def test_views_are_buffered(self):
+        """Test that page hits do not write to the quotes table"""
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=3600):
+            self.client.get(reverse('random_quote'))
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('random_quote'))
+
+        self.assertContains(response, "2 просмотров")
+        self.assertFalse(any(
+            query['sql'].startswith('UPDATE "quotes_quote"')
+            for query in context.captured_queries
+        ))
+        self.quote.refresh_from_db()
+        self.assertEqual(self.quote.views, 0)
+
+    def test_flush_writes_batched_increments(self):
+        """Test that flush adds buffered views with F() updates"""
+        other = Quote.objects.create(text="Other views quote", source=self.source)
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=3600):
+            for _ in range(3):
+                view_counter.record(self.quote.id)
+            view_counter.record(other.id)
+
+        self.assertEqual(view_counter.flush(), 4)
+        self.quote.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.quote.views, other.views), (3, 1))
+        self.assertEqual(view_counter.pending(self.quote.id), 0)
+
+    def test_flush_when_interval_elapsed(self):
+        """Test that recording flushes once the interval has passed"""
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=0):
+            view_counter.record(self.quote.id)
+
+        self.quote.refresh_from_db()
+        self.assertEqual(self.quote.views, 1)
+
+    def test_failed_flush_keeps_views(self):
+        """Test that views go back to the buffer when the UPDATE fails"""
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=3600):
+            view_counter.record(self.quote.id)
+            view_counter.record(self.quote.id)
+        with mock.patch('quotes.counters.Quote.objects.filter', side_effect=OperationalError('locked')):
+            with self.assertRaises(OperationalError):
+                view_counter.flush()
+        self.assertEqual(view_counter.pending(self.quote.id), 2)
+
+        self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(view_counter.flush(), 0)
+        self.quote.refresh_from_db()
+        self.assertEqual(self.quote.views, 2)
+
+    def test_buffer_survives_cache_clear(self):
+        """Test that evicting the cache does not lose buffered views"""
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=3600):
+            view_counter.record(self.quote.id)
+        cache.clear()
+        self.assertEqual(view_counter.flush(), 1)
+
+
+class ViewFlushTimerTest(TransactionTestCase):
+    def test_idle_process_flushes_on_timer(self):
+        """Test that the background timer flushes without further requests"""
+        source = Source.objects.create(name="Timer Source", type="MOV")
+        quote = Quote.objects.create(text="Timer quote", source=source)
+        self.addCleanup(view_counter.stop)
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=0.05, QUOTES_VIEW_FLUSH_TIMER=True):
+            view_counter.flush()
+            view_counter.record(quote.id)
+            view_counter._last_flush = time.monotonic()
+            deadline = time.monotonic() + 5
+            while view_counter.pending(quote.id) and time.monotonic() < deadline:
+                time.sleep(0.02)
+        view_counter.stop()
+
+        quote.refresh_from_db()
+        self.assertEqual(quote.views, 1)
+
+    def test_flush_views_command_signals_worker(self):
+        """Test that flush_views makes a worker write its buffered views"""
+        source = Source.objects.create(name="Signal Source", type="MOV")
+        quote = Quote.objects.create(text="Signal quote", source=source)
+        with self.settings(QUOTES_VIEW_FLUSH_INTERVAL=3600, QUOTES_VIEW_FLUSH_TIMER=False):
+            view_counter.flush()
+            view_counter.record(quote.id)
+            view_counter.record(quote.id)
+            call_command('flush_views', str(os.getpid()), stdout=StringIO())
+            deadline = time.monotonic() + 5
+            while quote.views != 2 and time.monotonic() < deadline:
+                time.sleep(0.02)
+                quote.refresh_from_db()
+
+        self.assertEqual(quote.views, 2)
+        self.assertEqual(view_counter.pending(quote.id), 0)
+
+    def test_flush_views_command_reports_missing_process(self):
+        """Test that signalling an unknown pid fails loudly"""
+        with mock.patch('quotes.management.commands.flush_views.os.kill', side_effect=ProcessLookupError):
+            with self.assertRaises(CommandError):
+                call_command('flush_views', '99999', stdout=StringIO(), stderr=StringIO())
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sources = [
+            Source.objects.create(name=f"Board Source {i}", type="BOOK")
+            for i in range(3)
+        ]
+        self.quotes = [
+            Quote.objects.create(
+                text=f"Board quote {i}",
+                source=self.sources[i % 3],
+                likes=i
+            )
+            for i in range(6)
+        ]
+
+    def ids(self, entries):
+        return [entry['id'] for entry in entries]
+
+    def test_cached_page_skips_quotes_table(self):
+        """Test that a warm leaderboard serves /popular/ without quote queries"""
+        self.client.get(reverse('popular_quotes'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('popular_quotes'))
+
+        self.assertContains(response, "Board quote 5")
+        self.assertFalse(any('quotes_quote' in q['sql'] for q in context.captured_queries))
+
+    def test_vote_invalidates_board_when_it_matters(self):
+        """Test that votes near the top drop the cached board and others keep it"""
+        with self.settings(QUOTES_LEADERBOARD_SIZE=3):
+            self.assertEqual(
+                self.ids(leaderboard.top()),
+                [self.quotes[5].id, self.quotes[4].id, self.quotes[3].id]
+            )
+            self.client.post(reverse('like_quote', args=[self.quotes[0].id]))
+            with self.assertNumQueries(0):
+                leaderboard.top()
+
+            Quote.objects.filter(pk=self.quotes[2].pk).update(likes=10)
+            leaderboard.record_vote(self.quotes[2].id, 10, 0)
+            with self.assertNumQueries(1):
+                top = leaderboard.top()
+            with self.assertNumQueries(0):
+                leaderboard.top()
+        self.assertEqual(
+            self.ids(top),
+            [self.quotes[2].id, self.quotes[5].id, self.quotes[4].id]
+        )
+
+    def test_concurrent_votes_do_not_overwrite_each_other(self):
+        """Test that interleaved votes never leave stale counts in the cache"""
+        with self.settings(QUOTES_LEADERBOARD_SIZE=3):
+            leaderboard.top()
+            # Два процесса голосуют за цитаты топа почти одновременно
+            Quote.objects.filter(pk=self.quotes[5].pk).update(likes=20)
+            Quote.objects.filter(pk=self.quotes[4].pk).update(likes=30)
+            leaderboard.record_vote(self.quotes[4].id, 30, 0)
+            leaderboard.record_vote(self.quotes[5].id, 20, 0)
+            top = leaderboard.top()
+        self.assertEqual([(e['id'], e['likes']) for e in top[:2]], [
+            (self.quotes[4].id, 30), (self.quotes[5].id, 20),
+        ])
+
+    def test_dropping_out_rebuilds(self):
+        """Test that the last entry losing likes triggers a rebuild"""
+        with self.settings(QUOTES_LEADERBOARD_SIZE=2):
+            leaderboard.top()
+            Quote.objects.filter(pk=self.quotes[4].pk).update(likes=0)
+            leaderboard.record_vote(self.quotes[4].id, 0, 0)
+            top = leaderboard.top()
+        self.assertEqual(self.ids(top), [self.quotes[5].id, self.quotes[3].id])
+
+    def test_tiebreak_setting(self):
+        """Test configurable ordering for equal likes"""
+        Quote.objects.update(likes=1)
+        leaderboard.invalidate()
+        with self.settings(QUOTES_LEADERBOARD_SIZE=2, QUOTES_LEADERBOARD_TIEBREAK=('-id',)):
+            top = leaderboard.top()
+        self.assertEqual(self.ids(top), [self.quotes[5].id, self.quotes[4].id])
+
+    def test_quote_save_invalidates(self):
+        """Test that editing a quote drops the cached board"""
+        leaderboard.top()
+        quote = self.quotes[5]
+        quote.text = "Edited board quote"
+        quote.save()
+        self.assertEqual(leaderboard.top()[0]['text'], "Edited board quote")
+
+
+class RandomQuoteApiTest(TestCase):
+    def setUp(self):
+        quote_sampler.reset()
+        self.quotes = []
+        for i in range(6):
+            source = Source.objects.get_or_create(name=f"Api Source {i // 3}", type="MOV")[0]
+            self.quotes.append(Quote.objects.create(
+                text=f"Api quote {i}",
+                source=source,
+                weight=i + 1
+            ))
+
+    def test_single_quote(self):
+        """Test the default response shape"""
+        response = self.client.get(reverse('api_random_quotes'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['quotes']), 1)
+        self.assertIn(data['quotes'][0]['source']['name'], ["Api Source 0", "Api Source 1"])
+        self.assertEqual(data['quotes'][0]['source']['type_display'], "Фильм")
+
+    def test_batch_is_distinct_and_excludes(self):
+        """Test ?n= and ?exclude= together"""
+        excluded = [self.quotes[0].id, self.quotes[5].id]
+        response = self.client.get(
+            reverse('api_random_quotes'),
+            {'n': 10, 'exclude': f'{excluded[0]},{excluded[1]}'}
+        )
+        ids = [quote['id'] for quote in response.json()['quotes']]
+
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(len(set(ids)), 4)
+        self.assertFalse(set(ids) & set(excluded))
+
+    def test_batch_does_not_touch_session(self):
+        """Test that the API does not create sessions"""
+        self.client.get(reverse('api_random_quotes'), {'n': 3})
+        self.assertEqual(Session.objects.count(), 0)
+
+    def test_invalid_parameters(self):
+        """Test validation of n and exclude"""
+        for params in ({'n': 0}, {'n': 1000}, {'n': 'abc'}, {'exclude': 'x'}):
+            response = self.client.get(reverse('api_random_quotes'), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['success'])
+
+
+class AsyncViewsTest(QuoteFixtureMixin, TestCase):
+    source_name, source_type, quote_text = "Async Source", "MOV", "Async quote text"
+
+    def make_request(self, method, path):
+        request = getattr(AsyncRequestFactory(), method)(path)
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        return request
+
+    async def test_random_quote(self):
+        """Test the async random quote page"""
+        response = await async_views.random_quote(self.make_request('get', '/'))
+        self.assertContains(response, "Async quote text")
+        self.assertContains(response, "Async Source")
+
+    async def test_popular_quotes(self):
+        """Test the async popular page"""
+        response = await async_views.popular_quotes(self.make_request('get', '/popular/'))
+        self.assertContains(response, "Async quote text")
+
+    async def test_like_and_switch(self):
+        """Test async voting keeps per-visitor state in the vote cookie"""
+        request = self.make_request('post', '/like/')
+        response = await async_views.like_quote(request, self.quote.id)
+        self.assertEqual(response.status_code, 200)
+
+        second = self.make_request('post', '/dislike/')
+        second.COOKIES[VisitorVotes.cookie_name] = response.cookies[VisitorVotes.cookie_name].value
+        response = await async_views.dislike_quote(second, self.quote.id)
+
+        await self.quote.arefresh_from_db()
+        self.assertEqual((self.quote.likes, self.quote.dislikes), (0, 1))
+        self.assertTrue(json.loads(response.content)['user_has_disliked'])
+
+    async def test_vote_missing_quote(self):
+        """Test that async voting for an unknown quote raises 404"""
+        with self.assertRaises(Http404):
+            await async_views.like_quote(self.make_request('post', '/like/'), self.quote.id + 100)
+
+
+class VisitorVotesTest(QuoteFixtureMixin, TestCase):
+    source_name, source_type, quote_text = "Cookie Source", "MOV", "Cookie quote"
+
+    def test_page_view_does_not_touch_sessions(self):
+        """Test that viewing quotes writes nothing to django_session"""
+        for _ in range(3):
+            self.client.get(reverse('random_quote'))
+        self.assertEqual(Session.objects.count(), 0)
+
+    def test_vote_is_remembered_in_cookie(self):
+        """Test that the vote cookie drives the button state"""
+        self.client.post(reverse('like_quote', args=[self.quote.id]))
+        self.assertIn(VisitorVotes.cookie_name, self.client.cookies)
+        self.assertEqual(Session.objects.count(), 0)
+
+        response = self.client.get(reverse('random_quote'))
+        self.assertTrue(response.context['user_has_liked'])
+
+        data = self.client.post(reverse('like_quote', args=[self.quote.id])).json()
+        self.assertEqual(data['likes'], 0)
+
+    def test_tampered_cookie_is_ignored(self):
+        """Test that an unsigned cookie does not count as a vote"""
+        self.client.cookies[VisitorVotes.cookie_name] = f"forged|{self.quote.id}L"
+        data = self.client.post(reverse('like_quote', args=[self.quote.id])).json()
+        self.assertEqual(data['likes'], 1)
+
+    def test_cookie_is_bounded(self):
+        """Test that only the most recent votes are kept"""
+        votes = VisitorVotes()
+        with self.settings(QUOTES_VOTE_COOKIE_MAX=3):
+            for quote_id in range(1, 6):
+                votes.set(quote_id, 'like')
+        self.assertEqual(list(votes.votes), [3, 4, 5])
+
+        restored = VisitorVotes.loads(votes.dumps())
+        self.assertEqual(restored.visitor_id, votes.visitor_id)
+        self.assertEqual(restored.get(4), 'like')
+        self.assertTrue(restored.evicted)
+
+    def test_evicted_vote_is_not_counted_twice(self):
+        """Test that a vote pushed out of the full cookie is found in the ledger"""
+        other = Quote.objects.create(text="Newer quote", source=self.source)
+        with self.settings(QUOTES_VOTE_COOKIE_MAX=1):
+            self.client.post(reverse('like_quote', args=[self.quote.id]))
+            self.client.post(reverse('like_quote', args=[other.id]))
+            votes = VisitorVotes.loads(self.client.cookies[VisitorVotes.cookie_name].value.rsplit(':', 2)[0])
+            self.assertNotIn(self.quote.id, votes.votes)
+
+            data = self.client.post(reverse('like_quote', args=[self.quote.id])).json()
+        self.assertEqual(data['likes'], 0)
+        self.assertFalse(data['user_has_liked'])
+
+    def test_legacy_session_votes_are_imported(self):
+        """Test that votes stored by the old session scheme still count"""
+        session = self.client.session
+        session['user_votes'] = {str(self.quote.id): 'dislike'}
+        session.save()
+        self.client.cookies['sessionid'] = session.session_key
+
+        data = self.client.post(reverse('dislike_quote', args=[self.quote.id])).json()
+        self.assertEqual(data['message'], 'Дизлайк убран')
+
+
+class VoteLedgerTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(
+            name="Ledger Source",
+            type="BOOK"
+        )
+        self.quotes = [
+            Quote.objects.create(text=f"Ledger quote {i}", source=self.source)
+            for i in range(3)
+        ]
+
+    def test_votes_are_written_to_ledger(self):
+        """Test that voting upserts one ledger row per visitor and quote"""
+        quote = self.quotes[0]
+        self.client.post(reverse('like_quote', args=[quote.id]))
+        self.client.post(reverse('dislike_quote', args=[quote.id]))
+
+        vote = Vote.objects.get()
+        self.assertEqual((vote.quote, vote.value), (quote, Vote.DISLIKE))
+
+        self.client.post(reverse('dislike_quote', args=[quote.id]))
+        self.assertEqual(Vote.objects.get().value, Vote.NONE)
+
+    def test_record_votes_in_bulk(self):
+        """Test bulk upsert of ledger entries"""
+        record_votes([ledger_entry(f"v{i}", self.quotes[0].id, 'like') for i in range(5)])
+        record_votes([ledger_entry("v0", self.quotes[0].id, 'dislike')])
+
+        self.assertEqual(Vote.objects.filter(value=Vote.LIKE).count(), 4)
+        self.assertEqual(Vote.objects.filter(value=Vote.DISLIKE).count(), 1)
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        """Test the reconciliation command"""
+        record_votes([
+            ledger_entry("a", self.quotes[0].id, 'like'),
+            ledger_entry("b", self.quotes[0].id, 'like'),
+            ledger_entry("a", self.quotes[1].id, 'dislike'),
+        ])
+        Quote.objects.filter(pk=self.quotes[0].pk).update(likes=2)
+        Quote.objects.filter(pk=self.quotes[1].pk).update(likes=7)
+
+        out = StringIO()
+        call_command('reconcile_votes', batch_size=2, stdout=out)
+        self.assertIn('Расхождений: 1', out.getvalue())
+        self.quotes[1].refresh_from_db()
+        self.assertEqual(self.quotes[1].likes, 7)
+
+        counters = versions.current([COUNTERS])[COUNTERS]
+        call_command('reconcile_votes', '--fix', batch_size=2, stdout=out)
+        self.assertNotEqual(versions.current([COUNTERS])[COUNTERS], counters)
+        self.quotes[1].refresh_from_db()
+        self.assertEqual((self.quotes[1].likes, self.quotes[1].dislikes), (0, 1))
+        self.quotes[0].refresh_from_db()
+        self.assertEqual(self.quotes[0].likes, 2)
+
+
+class ImportQuotesCommandTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.source = Source.objects.create(name="Existing Import Source", type="BOOK")
+        Quote.objects.create(text="Already imported", source=self.source)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        out = StringIO()
+        call_command('import_quotes', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        """Test CSV import with dedupe, source limit and validation"""
+        rows = [
+            "text,source_name,source_type,weight",
+            "First new,New Book,BOOK,2",
+            "First new,New Book,BOOK,2",
+            "Already imported,New Book,BOOK,1",
+            "Second,Existing Import Source,BOOK,1",
+            "Third,Existing Import Source,BOOK,1",
+            "Fourth,Existing Import Source,BOOK,1",
+            "Bad type,New Book,XYZ,1",
+        ]
+        output = self.run_import(self.write('quotes.csv', "\n".join(rows)), batch_size=2)
+
+        self.assertIn('Добавлено: 3', output)
+        self.assertIn('дублей: 2', output)
+        self.assertIn('сверх лимита источника: 1', output)
+        self.assertIn('с ошибками: 1', output)
+        self.assertEqual(Quote.objects.filter(source=self.source).count(), 3)
+        self.assertEqual(Quote.objects.get(text="First new").weight, 2)
+
+    def test_import_jsonl(self):
+        """Test JSONL import and that new quotes become sampleable"""
+        Quote.objects.all().delete()
+        lines = [
+            json.dumps({"text": "Jsonl quote", "source_name": "Jsonl Song", "source_type": "SONG"}),
+            "not json",
+        ]
+        output = self.run_import(self.write('quotes.jsonl', "\n".join(lines)))
+
+        self.assertIn('Добавлено: 1', output)
+        self.assertIn('с ошибками: 1', output)
+        self.assertEqual(Source.objects.get(name="Jsonl Song").type, "SONG")
+        self.assertEqual(get_random_quote().text, "Jsonl quote")
+
+    def test_batch_query_count_is_constant(self):
+        """Test that a batch costs a fixed number of queries"""
+        rows = ["text,source_name,source_type,weight"]
+        rows += [f"Bulk {i},Bulk Source {i // 3},MOV,1" for i in range(60)]
+        path = self.write('bulk.csv', "\n".join(rows))
+
+        with CaptureQueriesContext(connection) as context:
+            output = self.run_import(path, batch_size=100)
+        self.assertIn('Добавлено: 60', output)
+        self.assertLess(len(context.captured_queries), 15)
+
+
+class ExportQuotesTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Export Source", type="SONG")
+        self.quotes = [
+            Quote.objects.create(text=f"Export, \"quote\" {i}", source=self.source, likes=i)
+            for i in range(3)
+        ]
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_quotes', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_jsonl_export(self):
+        """Test that every quote is exported with source and counters"""
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [q.id for q in self.quotes])
+        self.assertEqual(rows[2]['source_name'], "Export Source")
+        self.assertEqual(rows[2]['likes'], 2)
+
+    def test_csv_export_after_id(self):
+        """Test CSV output and the resume cursor"""
+        output = self.export('--format', 'csv', '--after-id', str(self.quotes[0].id))
+        rows = list(csv.DictReader(StringIO(output)))
+        self.assertEqual([int(row['id']) for row in rows], [q.id for q in self.quotes[1:]])
+        self.assertEqual(rows[0]['text'], self.quotes[1].text)
+
+    def test_gzip_resume(self):
+        """Test that --resume appends after the last exported row"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'quotes.jsonl.gz')
+            self.export('--output', path)
+            Quote.objects.create(text="Export late", source=Source.objects.create(name="Late", type="MOV"))
+            self.export('--output', path, '--resume')
+
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                ids = [json.loads(line)['id'] for line in f]
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(len(set(ids)), 4)
+
+    def test_resume_cuts_truncated_tail(self):
+        """Test that --resume drops a half-written last record before appending"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fmt in ('jsonl', 'csv'):
+                path = os.path.join(tmpdir, f'quotes.{fmt}')
+                self.export('--format', fmt, '--output', path)
+                os.truncate(path, os.path.getsize(path) - 20)
+                self.export('--format', fmt, '--output', path, '--resume')
+
+                with open(path, encoding='utf-8', newline='') as f:
+                    if fmt == 'csv':
+                        ids = [int(row['id']) for row in csv.DictReader(f)]
+                    else:
+                        ids = [json.loads(line)['id'] for line in f]
+                self.assertEqual(ids, [q.id for q in self.quotes])
+
+    def test_resume_refuses_truncated_gzip(self):
+        """Test that a damaged archive is not appended to"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'quotes.jsonl.gz')
+            self.export('--output', path)
+            os.truncate(path, os.path.getsize(path) - 10)
+            size = os.path.getsize(path)
+            with self.assertRaises(CommandError):
+                self.export('--output', path, '--resume')
+            self.assertEqual(os.path.getsize(path), size)
+
+    def test_streaming_endpoint_requires_staff(self):
+        """Test the streaming HTTP export"""
+        response = self.client.get(reverse('export_quotes'))
+        self.assertEqual(response.status_code, 302)
+
+        staff = User.objects.create_user('staff', password='pass', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('export_quotes'), {'format': 'csv', 'gzip': '1'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('filename="quotes.csv.gz"', response['Content-Disposition'])
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertTrue(body.startswith('text,source_name,source_type,weight'))
+        self.assertEqual(len(body.strip().splitlines()), 4)
+
+
+class TextHashTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Hash Source", type="MOV")
+
+    def test_hash_ignores_case_and_whitespace(self):
+        """Test that normalization folds case and whitespace"""
+        self.assertEqual(text_hash("Hello   World "), text_hash("hello world"))
+        self.assertNotEqual(text_hash("Hello world"), text_hash("Hello word"))
+        self.assertEqual(len(text_hash("Hello world")), 32)
+
+    def test_model_rejects_normalized_duplicate(self):
+        """Test that the model validation catches near-exact duplicates"""
+        Quote.objects.create(text="Stay hungry", source=self.source)
+        with self.assertRaises(ValidationError):
+            Quote.objects.create(text="  stay   HUNGRY", source=self.source)
+
+    def legacy_duplicate(self):
+        """Старый дубль, которому миграция 0007 оставила text_hash = NULL"""
+        Quote.objects.create(text="Know thyself", source=self.source)
+        legacy = Quote.objects.create(text="Placeholder", source=self.source)
+        Quote.objects.filter(pk=legacy.pk).update(text="KNOW   thyself", text_hash=None)
+        return legacy
+
+    def test_legacy_duplicate_stays_editable(self):
+        """Test that non-text edits of an unhashed duplicate pass validation"""
+        legacy = Quote.objects.get(pk=self.legacy_duplicate().pk)
+        legacy.weight = 7
+        legacy.full_clean()
+        legacy.save()
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.weight, legacy.text_hash), (7, None))
+
+    def test_legacy_duplicate_text_edit_is_checked(self):
+        """Test that changing the text still runs the duplicate check"""
+        legacy = Quote.objects.get(pk=self.legacy_duplicate().pk)
+        legacy.text = "know thyself "
+        with self.assertRaises(ValidationError):
+            legacy.save()
+
+        legacy.text = "Know thy enemy"
+        legacy.save()
+        legacy.refresh_from_db()
+        self.assertIsNotNone(legacy.text_hash)
+
+    def test_form_uses_hash_probe(self):
+        """Test that the form rejects duplicates with an index probe"""
+        Quote.objects.create(text="Stay foolish", source=self.source)
+        form = QuoteForm(data={
+            'text': 'STAY foolish', 'source_name': 'Other', 'source_type': 'MOV', 'weight': 1
+        })
+        with CaptureQueriesContext(connection) as context:
+            self.assertFalse(form.is_valid())
+        self.assertIn('text', form.errors)
+        self.assertTrue(any('"text_hash" =' in q['sql'] for q in context.captured_queries))
+
+    def test_near_duplicate_detector(self):
+        """Test that MinHash finds quotes differing by a word"""
+        items = [
+            (1, "The only thing we have to fear is fear itself"),
+            (2, "The only thing we have to fear is fear itself!"),
+            (3, "Houston, we have a problem"),
+            (4, "To be or not to be, that is the question"),
+        ]
+        pairs = find_near_duplicates(items, threshold=0.7)
+        self.assertEqual([pair[:2] for pair in pairs], [(1, 2)])
+
+    def test_near_duplicates_command(self):
+        """Test the batch command output"""
+        Quote.objects.create(text="Elementary, my dear Watson", source=self.source)
+        Quote.objects.create(text="Elementary, my dear Watson.", source=self.source)
+        out = StringIO()
+        call_command('find_near_duplicates', '--threshold', '0.7', stdout=out)
+        self.assertIn('Найдено похожих пар: 1', out.getvalue())
+
+
+class SourceQuoteCountTest(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name="Counter Source", type="BOOK")
+        self.other = Source.objects.create(name="Counter Other", type="BOOK")
+
+    def count(self, source):
+        source.refresh_from_db()
+        return source.quote_count
+
+    def test_counter_follows_create_move_and_delete(self):
+        """Test that quote_count tracks the quotes of a source"""
+        quote = Quote.objects.create(text="Counted one", source=self.source)
+        Quote.objects.create(text="Counted two", source=self.source)
+        self.assertEqual(self.count(self.source), 2)
+
+        quote = Quote.objects.get(pk=quote.pk)
+        quote.source = self.other
+        quote.save()
+        self.assertEqual((self.count(self.source), self.count(self.other)), (1, 1))
+
+        quote.delete()
+        self.assertEqual(self.count(self.other), 0)
+
+    def test_deferred_source_is_not_a_move(self):
+        """Test that saving a quote loaded without source_id keeps the counters"""
+        quotes = [Quote.objects.create(text=f"Deferred {i}", source=self.source) for i in range(3)]
+
+        deferred = Quote.objects.only('text').get(pk=quotes[0].pk)
+        deferred.text = "Deferred edited"
+        deferred.save()
+        self.assertEqual(self.count(self.source), 3)
+
+        deferred = Quote.objects.defer('source').get(pk=quotes[1].pk)
+        deferred.source = self.other
+        deferred.save()
+        self.assertEqual((self.count(self.source), self.count(self.other)), (2, 1))
+
+    def test_refresh_from_db_updates_loaded_source(self):
+        """Test that refresh_from_db picks up a source moved by someone else"""
+        quote = Quote.objects.create(text="Refreshed", source=self.source)
+        moved = Quote.objects.get(pk=quote.pk)
+        moved.source = self.other
+        moved.save()
+
+        quote.refresh_from_db(fields=['source'])
+        quote.weight = 5
+        quote.save()
+        self.assertEqual((self.count(self.source), self.count(self.other)), (0, 1))
+
+        quote.refresh_from_db()
+        quote.source = self.source
+        quote.save()
+        self.assertEqual((self.count(self.source), self.count(self.other)), (1, 0))
+
+    def test_limit_enforced_by_conditional_update(self):
+        """Test that a stale clean() cannot push a source over the limit"""
+        for i in range(3):
+            Quote.objects.create(text=f"Limit {i}", source=self.source)
+
+        with mock.patch.object(Quote, 'clean'):
+            with self.assertRaises(ValidationError):
+                Quote.objects.create(text="Limit racing", source=self.source)
+        self.assertEqual(Quote.objects.filter(source=self.source).count(), 3)
+        self.assertEqual(self.count(self.source), 3)
+
+    def test_no_count_queries_on_save_and_validation(self):
+        """Test that saving and validating run no COUNT aggregates"""
+        with CaptureQueriesContext(connection) as context:
+            quote = Quote.objects.create(text="No count", source=self.source)
+            quote.weight = 5
+            quote.save()
+            QuoteForm(data={
+                'text': 'No count form', 'source_name': 'Counter Source',
+                'source_type': 'BOOK', 'weight': 1
+            }).is_valid()
+        self.assertFalse(any('COUNT(' in q['sql'] for q in context.captured_queries))
+
+    def test_import_updates_counters(self):
+        """Test that bulk import keeps quote_count in sync"""
+        Quote.objects.create(text="Before import", source=self.source)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'quotes.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("text,source_name,source_type,weight\n")
+                for i in range(4):
+                    f.write(f"Imported {i},Counter Source,BOOK,1\n")
+            call_command('import_quotes', path, stdout=StringIO())
+        self.assertEqual(self.count(self.source), 3)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.tolstoy = Source.objects.create(name="Лев Толстой", type="BOOK")
+        self.other = Source.objects.create(name="Другой автор", type="BOOK")
+        self.war = Quote.objects.create(text="Все счастливые семьи похожи друг на друга", source=self.tolstoy)
+        self.mention = Quote.objects.create(text="Про семьи и не только", source=self.other)
+
+    def search(self, query, page=1):
+        response = self.client.get(reverse('api_search_quotes'), {'q': query, 'page': page})
+        return response, response.json()
+
+    def test_finds_by_text_prefix_and_source(self):
+        """Test that search matches word prefixes in text and source names"""
+        self.assertEqual([q.id for q in SearchResults("счастлив")[0:10]], [self.war.id])
+        self.assertEqual([q.id for q in SearchResults("толстой")[0:10]], [self.war.id])
+        self.assertEqual(SearchResults("семьи").count(), 2)
+
+    def test_ranking_prefers_text_matches(self):
+        """Test that a match in the text outranks a match in the source name"""
+        Quote.objects.create(text="Семьи бывают разные", source=Source.objects.create(name="Семьи", type="OTHER"))
+        source_only = Quote.objects.create(text="Совсем о другом", source=Source.objects.create(name="Семьин", type="OTHER"))
+        _, data = self.search("семьи")
+        ids = [quote['id'] for quote in data['quotes']]
+        self.assertEqual(ids[-1], source_only.id)
+
+    def test_index_follows_save_delete_and_source_rename(self):
+        """Test that signals keep the index in sync with the tables"""
+        self.war.text = "Все несчастливые семьи несчастливы по-своему"
+        self.war.save()
+        self.assertEqual(self.search("похожи")[1]['count'], 0)
+        self.assertEqual(self.search("несчастливы")[1]['count'], 1)
+
+        self.tolstoy.name = "Л. Н. Толстой"
+        self.tolstoy.save()
+        self.assertEqual(self.search("Л Н Толстой")[1]['count'], 1)
+
+        self.war.delete()
+        self.assertEqual(self.search("несчастливы")[1]['count'], 0)
+
+    def test_pagination(self):
+        """Test that results are split into pages"""
+        for i in range(3):
+            source = Source.objects.create(name=f"Страницы {i}", type="OTHER")
+            for j in range(3):
+                Quote.objects.create(text=f"Листаем страницу {i} {j}", source=source)
+
+        with self.settings(QUOTES_SEARCH_PAGE_SIZE=4):
+            response, data = self.search("листаем", page=3)
+            self.assertEqual((data['count'], data['num_pages'], len(data['quotes'])), (9, 3, 1))
+            self.assertEqual(self.search("листаем", page=4)[0].status_code, 404)
+            html = self.client.get(reverse('search_quotes'), {'q': 'листаем', 'page': 2})
+        self.assertContains(html, "Страница 2 из 3")
+
+    def test_query_syntax_is_escaped(self):
+        """Test that FTS5 operators in user input are treated as plain words"""
+        for query in ['"', 'семьи OR', 'NEAR(семьи)', '*', 'text:семьи', '-семьи']:
+            response, data = self.search(query)
+            self.assertIn(response.status_code, (200, 400))
+        self.assertEqual(self.search("")[0].status_code, 400)
+
+    def test_import_indexes_bulk_created_quotes(self):
+        """Test that bulk import adds quotes to the index"""
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as f:
+            f.write('{"text": "Импортированная мудрость", "source_name": "Импорт"}\n')
+        call_command('import_quotes', f.name, stdout=StringIO())
+        self.assertEqual(self.search("мудрость")[1]['count'], 1)
+
+
+class PageCacheTest(QuoteFixtureMixin, TestCase):
+    source_name, quote_text, quote_fields = "Cached Source", "Cached quote", {'likes': 1}
+
+    def test_popular_page_served_from_cache_until_vote(self):
+        """Test that /popular/ is rendered once and re-rendered after a vote"""
+        self.client.get(reverse('popular_quotes'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('popular_quotes'))
+        self.assertContains(response, "👍 1")
+
+        self.client.post(reverse('like_quote', args=[self.quote.id]))
+        self.assertContains(self.client.get(reverse('popular_quotes')), "👍 2")
+
+    def test_popular_page_follows_catalog_edits(self):
+        """Test that editing a quote invalidates the cached page"""
+        self.client.get(reverse('popular_quotes'))
+        self.quote.text = "Edited cached quote"
+        self.quote.save()
+        self.assertContains(self.client.get(reverse('popular_quotes')), "Edited cached quote")
+
+    def test_card_fragment_is_shared_but_vote_state_is_not(self):
+        """Test that the cached card does not leak another visitor's buttons"""
+        liker = Client()
+        liker.post(reverse('like_quote', args=[self.quote.id]))
+        current = versions.current()
+
+        response = liker.get(reverse('random_quote'))
+        self.assertContains(response, "👍 2")
+        self.assertRegex(response.content.decode(), r'id="like-btn"[^>]*disabled')
+
+        response = self.client.get(reverse('random_quote'))
+        self.assertContains(response, "👍 2")
+        self.assertNotRegex(response.content.decode(), r'id="like-btn"[^>]*disabled')
+        self.assertEqual(versions.current(), current)
+
+    def test_card_fragment_survives_votes(self):
+        """Test that a vote updates the counters without re-rendering the card"""
+        self.client.get(reverse('random_quote'))
+        Quote.objects.filter(pk=self.quote.pk).update(text="Changed behind the cache")
+
+        self.client.post(reverse('like_quote', args=[self.quote.id]))
+        response = self.client.get(reverse('random_quote'))
+        self.assertContains(response, "Cached quote")
+        self.assertContains(response, "👍 2")
+
+    def test_card_fragment_reused_for_same_versions(self):
+        """Test that the card is served from cache while versions are unchanged"""
+        self.client.get(reverse('random_quote'))
+        # Прямое изменение в обход сигналов не меняет версию — видна закэшированная карточка
+        Quote.objects.filter(pk=self.quote.pk).update(text="Changed behind the cache")
+        self.assertContains(self.client.get(reverse('random_quote')), "Cached quote")
+
+        versions.bump(CATALOG)
+        self.assertContains(self.client.get(reverse('random_quote')), "Changed behind the cache")
+
+
+class ConditionalResponseTest(QuoteFixtureMixin, TestCase):
+    source_name, quote_text = "Etag Source", "Etag quote"
+
+    def test_popular_answers_304_without_queries(self):
+        """Test that a matching If-None-Match skips the view and the database"""
+        response = self.client.get(reverse('popular_quotes'))
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('public', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('popular_quotes'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_vote_and_edit_change_etag(self):
+        """Test that votes and catalog edits produce a new validator"""
+        url = reverse('api_quote', args=[self.quote.id])
+        first = self.client.get(url)['ETag']
+
+        self.client.post(reverse('like_quote', args=[self.quote.id]))
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['quote']['likes'], 1)
+
+        self.quote.text = "Etag quote edited"
+        self.quote.save()
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third['ETag'], second['ETag'])
+
+    def test_etag_depends_on_url_arguments_and_query(self):
+        """Test that different quotes and search queries get different ETags"""
+        other = Quote.objects.create(text="Etag other", source=self.source)
+        etags = {
+            self.client.get(reverse('api_quote', args=[self.quote.id]))['ETag'],
+            self.client.get(reverse('api_quote', args=[other.id]))['ETag'],
+            self.client.get(reverse('api_search_quotes'), {'q': 'etag'})['ETag'],
+            self.client.get(reverse('api_search_quotes'), {'q': 'other'})['ETag'],
+        }
+        self.assertEqual(len(etags), 4)
+
+    def test_missing_quote(self):
+        """Test that the per-quote endpoint answers 404 for unknown ids"""
+        response = self.client.get(reverse('api_quote', args=[self.quote.id + 100]))
+        self.assertEqual(response.status_code, 404)
+
+
+class CompressedStaticStorageTest(TestCase):
+    def setUp(self):
+        self.static_dir = Path(tempfile.mkdtemp())
+        self.static_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.static_dir)
+        self.addCleanup(shutil.rmtree, self.static_root)
+        (self.static_dir / 'app.css').write_text('body { color: black; }\n' * 40)
+        (self.static_dir / 'tiny.js').write_text('var x = 1;')
+        # Посторонний файл в STATIC_ROOT не из собранной статики
+        (self.static_root / 'stray.css').write_text('p { margin: 0; }\n' * 40)
+
+    def collectstatic(self):
+        with override_settings(
+            STATIC_ROOT=self.static_root,
+            STATICFILES_DIRS=[self.static_dir],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'quotes.storage.CompressedManifestStaticFilesStorage'},
+            },
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            return storages['staticfiles'].stored_name('app.css')
+
+    def test_collected_files_are_compressed(self):
+        """Test that collectstatic writes .gz copies of original and hashed files"""
+        hashed_name = self.collectstatic()
+        self.assertNotEqual(hashed_name, 'app.css')
+
+        original = (self.static_dir / 'app.css').read_bytes()
+        for name in ('app.css', hashed_name):
+            compressed = self.static_root / (name + '.gz')
+            self.assertEqual(gzip.decompress(compressed.read_bytes()), original)
+        # Маленькие и посторонние файлы не сжимаются
+        self.assertFalse((self.static_root / 'tiny.js.gz').exists())
+        self.assertFalse((self.static_root / 'stray.css.gz').exists())
+
+    def test_unchanged_files_are_not_recompressed(self):
+        """Test that a second collectstatic keeps existing compressed copies"""
+        hashed_name = self.collectstatic()
+        compressed = self.static_root / (hashed_name + '.gz')
+        os.utime(compressed, (0, os.stat(self.static_root / hashed_name).st_mtime + 60))
+        mtime = compressed.stat().st_mtime
+
+        self.collectstatic()
+        self.assertEqual(compressed.stat().st_mtime, mtime)
+
+
+class SQLiteProfileTest(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        """Test that the connection_created hook applies the SQLite profile"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_rejects_malformed_pragmas(self):
+        """Test that PRAGMA settings cannot smuggle in extra SQL"""
+        with self.settings(QUOTES_SQLITE_PRAGMAS={'journal_mode': 'WAL; DROP TABLE quotes_quote'}):
+            with self.assertRaises(ValueError):
+                configure_sqlite(None, connection)
+
+
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.replica_settings = self.settings(DATABASES={
+            **settings.DATABASES,
+            'replica': {**settings.DATABASES['default'], 'NAME': 'replica.sqlite3'},
+        })
+
+    def routed_view(self):
+        @reads_from_replica
+        def view(request):
+            return Quote.objects.all().db
+        return view
+
+    def test_reads_inside_marked_views_go_to_replica(self):
+        """Test that only marked views read from the replica"""
+        with self.replica_settings:
+            self.assertEqual(self.routed_view()(self.factory.get('/')), 'replica')
+            self.assertEqual(Quote.objects.all().db, 'default')
+            self.assertEqual(Quote.objects.db_manager().db, 'default')
+
+    def test_writes_always_go_to_primary(self):
+        """Test that writes are routed to the primary even inside marked views"""
+        @reads_from_replica
+        def view(request):
+            return router.db_for_write(Quote)
+
+        with self.replica_settings:
+            self.assertEqual(view(self.factory.get('/')), 'default')
+
+    def test_visitor_pinned_to_primary_after_vote(self):
+        """Test that a vote sets a short-lived cookie that bypasses the replica"""
+        source = Source.objects.create(name="Replica Source", type="BOOK")
+        quote = Quote.objects.create(text="Replica quote", source=source)
+        with self.replica_settings:
+            response = self.client.post(reverse('like_quote', args=[quote.id]))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        with self.replica_settings:
+            self.assertEqual(self.routed_view()(request), 'default')
+
+    def test_without_replica_everything_uses_primary(self):
+        """Test that an unconfigured replica leaves routing unchanged"""
+        self.assertEqual(self.routed_view()(self.factory.get('/')), 'default')
+        source = Source.objects.create(name="No Replica Source", type="BOOK")
+        quote = Quote.objects.create(text="No replica quote", source=source)
+
+        response = self.client.post(reverse('like_quote', args=[quote.id]))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class QueryPlanTest(TestCase):
+    """EXPLAIN QUERY PLAN для горячих запросов: полный проход по таблице
+    или сортировка во временном B-дереве считаются регрессией"""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Планы проверяются на SQLite')
+        self.source = Source.objects.create(name="Plan Source", type="BOOK")
+        for i in range(3):
+            Quote.objects.create(text=f"Plan quote {i}", source=self.source, likes=i)
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[3] for row in cursor.fetchall()]
+
+    def assertUsesIndexes(self, queryset):
+        plan = self.plan(queryset)
+        for step in plan:
+            if (step.startswith('SCAN') and 'INDEX' not in step) or 'TEMP B-TREE' in step:
+                self.fail(f'Запрос без индекса: {step}\n{queryset.query}\n{plan}')
+
+    def changelist_queryset(self, params=None):
+        request = RequestFactory().get('/admin/quotes/quote/', params or {})
+        request.user, _ = User.objects.get_or_create(
+            username='plan-admin', defaults={'is_staff': True, 'is_superuser': True}
+        )
+        changelist = admin.site._registry[Quote].get_changelist_instance(request)
+        return changelist.get_queryset(request)
+
+    def test_popular_quotes_reads_likes_index(self):
+        """Test that the leaderboard query walks the likes index"""
+        self.assertUsesIndexes(leaderboard.queryset())
+        self.assertIn('quote_likes_idx', ' '.join(self.plan(leaderboard.queryset())))
+
+    def test_sampler_weights_use_covering_index(self):
+        """Test that loading weights never reads quote texts"""
+        self.assertIn('COVERING INDEX', ' '.join(self.plan(quote_sampler.weights_queryset())))
+
+    def test_random_quote_lookups(self):
+        """Test that fetching drawn quotes goes by primary key"""
+        quotes = Quote.objects.select_related('source')
+        self.assertUsesIndexes(quotes.filter(pk=1))
+        self.assertUsesIndexes(quotes.filter(pk__in=[1, 2, 3]))
+
+    def test_form_lookups(self):
+        """Test that duplicate and source lookups in QuoteForm are indexed"""
+        self.assertUsesIndexes(Quote.objects.filter(text_hash=text_hash("Plan quote 1")))
+        self.assertUsesIndexes(Source.objects.filter(name="Plan Source"))
+
+    def test_admin_changelist_queries(self):
+        """Test that the admin list, its source filter and date filter are indexed"""
+        today = timezone.now().date()
+        for params in [
+            {},
+            {'source__id__exact': self.source.id},
+            {'created_at__gte': str(today), 'created_at__lt': str(today + timedelta(days=1))},
+        ]:
+            with self.subTest(params=params):
+                self.assertUsesIndexes(self.changelist_queryset(params))
+
+
+class AdminQueryBudgetTest(TestCase):
+    """Число запросов страницы списка в админке не зависит от числа строк"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('budget-admin', 'budget@example.com', 'x')
+        self.client.force_login(self.admin)
+
+    def make_catalog(self, sources):
+        start = Source.objects.count()
+        for i in range(start, start + sources):
+            source = Source.objects.create(name=f"Budget Source {i}", type="BOOK")
+            quote = Quote.objects.create(text=f"Budget quote {i}", source=source)
+            record_votes([ledger_entry(f"visitor{i}", quote.id, 'like')])
+
+    def page_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelists_have_fixed_query_budget(self):
+        """Test that Quote, Source and Vote changelists stay within a fixed budget"""
+        urls = [
+            reverse('admin:quotes_quote_changelist'),
+            reverse('admin:quotes_source_changelist'),
+            reverse('admin:quotes_vote_changelist'),
+        ]
+        self.make_catalog(3)
+        small = [self.page_queries(url) for url in urls]
+        self.make_catalog(40)
+        large = [self.page_queries(url) for url in urls]
+
+        self.assertEqual(small, large)
+        for url, queries in zip(urls, large):
+            self.assertLessEqual(queries, 8, url)
+
+    def test_source_filter_lists_limited_sources(self):
+        """Test that the sidebar filter does not load every source"""
+        self.make_catalog(30)
+        with self.settings(QUOTES_ADMIN_SOURCE_FILTER_SIZE=5):
+            response = self.client.get(reverse('admin:quotes_quote_changelist'))
+            choices = [c for c in response.context['cl'].filter_specs[0].choices(response.context['cl'])]
+            self.assertEqual(len(choices), 6)  # «Все» + 5 источников
+
+            oldest = Source.objects.order_by('id').first()
+            response = self.client.get(
+                reverse('admin:quotes_quote_changelist'), {'source__id__exact': oldest.id}
+            )
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertContains(response, oldest.name)
+
+    def test_estimated_count_for_large_tables(self):
+        """Test that unfiltered lists above the limit use an estimate, not COUNT(*)"""
+        self.make_catalog(5)
+        with self.settings(QUOTES_ADMIN_EXACT_COUNT_LIMIT=2):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('admin:quotes_quote_changelist'))
+        self.assertGreaterEqual(response.context['cl'].result_count, 5)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in context.captured_queries))
+
+
+class MetricsTest(QuoteFixtureMixin, TestCase):
+    source_name, quote_text = "Metrics Source", "Metrics quote"
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def scrape(self):
+        with self.settings(QUOTES_METRICS_TOKEN='scraper'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_sampled_requests_fill_histograms(self):
+        """Test that queries, DB time, render time and latency are recorded per view"""
+        with self.settings(QUOTES_METRICS_SAMPLE_RATE=1.0):
+            self.client.get(reverse('random_quote'))
+            self.client.get(reverse('random_quote'))
+
+        histogram = metrics.histograms['quotes_request_queries']['random_quote']
+        self.assertEqual(histogram.count, 2)
+        self.assertGreater(histogram.sum, 0)
+        self.assertGreater(metrics.histograms['quotes_request_template_seconds']['random_quote'].sum, 0)
+
+        text = self.scrape()
+        self.assertIn('quotes_requests_total{view="random_quote"} 2', text)
+        self.assertIn('quotes_request_latency_seconds_count{view="random_quote"} 2', text)
+        self.assertIn('quotes_request_queries_bucket{view="random_quote",le="+Inf"} 2', text)
+        self.assertIn('# TYPE quotes_request_db_seconds histogram', text)
+
+    def test_unsampled_requests_are_only_counted(self):
+        """Test that requests outside the sample skip timing"""
+        with self.settings(QUOTES_METRICS_SAMPLE_RATE=0):
+            self.client.get(reverse('popular_quotes'))
+        self.assertEqual(metrics.requests['popular_quotes'], 1)
+        self.assertNotIn('popular_quotes', metrics.histograms['quotes_request_latency_seconds'])
+
+    def test_endpoint_hidden_by_default(self):
+        """Test that the metrics endpoint is hidden even from localhost by default"""
+        for address in ('203.0.113.5', '127.0.0.1'):
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR=address)
+            self.assertEqual(response.status_code, 404)
+
+    def test_endpoint_accepts_token_staff_and_listed_ips(self):
+        """Test that a bearer token, staff users and listed addresses can scrape"""
+        with self.settings(QUOTES_METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer café')
+            self.assertEqual(response.status_code, 404)
+
+        with self.settings(QUOTES_METRICS_ALLOWED_IPS=['10.0.0.7']):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.7').status_code, 200)
+
+        self.client.force_login(User.objects.create_user('metrics-staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    async def test_async_requests_measure_threaded_queries(self):
+        """Test that ORM calls made through sync_to_async land in the sample"""
+        async def view(request):
+            await sync_to_async(Quote.objects.count)()
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/popular/')
+        request.resolver_match = resolve('/popular/')
+        with self.settings(QUOTES_METRICS_SAMPLE_RATE=1.0):
+            await MetricsMiddleware(view)(request)
+        self.assertEqual(metrics.histograms['quotes_request_queries']['popular_quotes'].sum, 1)
+
+
+class ReplayRequestsCommandTest(QuoteFixtureMixin, TransactionTestCase):
+    # Запросы выполняются в потоках со своими соединениями, поэтому данные
+    # должны быть закоммичены
+    source_name, quote_text = "Replay Source", "Replay quote"
+
+    def replay(self, lines, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as f:
+            for line in lines:
+                f.write((line if isinstance(line, str) else json.dumps(line)) + '\n')
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as result:
+            pass
+        out = StringIO()
+        call_command('replay_requests', f.name, '--concurrency', '1', '--json', result.name, *args, stdout=out)
+        with open(result.name, encoding='utf-8') as stream:
+            return json.load(stream), out.getvalue()
+
+    def test_replays_log_and_groups_latency_by_url_pattern(self):
+        """Test that reads and votes are replayed and reported per route name"""
+        summary, output = self.replay([
+            {'ts': 0, 'method': 'GET', 'path': '/'},
+            {'ts': 0.01, 'method': 'POST', 'path': f'/like/{self.quote.id}/'},
+            {'ts': 0.02, 'path': '/popular/'},
+            {'ts': '1970-01-01T00:00:00.03Z', 'path': '/api/random/?n=1'},
+            {'ts': 0.04, 'path': '/no-such-page/'},
+        ], '--speed', '0')
+
+        self.assertEqual(summary['requests'], 5)
+        patterns = summary['patterns']
+        self.assertEqual(patterns['random_quote']['statuses'], {'200': 1})
+        self.assertEqual(patterns['like_quote']['statuses'], {'200': 1})
+        self.assertEqual(patterns['<404>']['statuses'], {'404': 1})
+        self.assertEqual(patterns['<404>']['client_errors'], 1)
+        self.assertEqual(patterns['api_random_quotes']['errors'], 0)
+        self.assertIn('popular_quotes', output)
+        self.quote.refresh_from_db()
+        self.assertEqual(self.quote.likes, 1)
+
+    def test_inprocess_host_allowed_outside_test_runner(self):
+        """Test that the test client's Host header is accepted with production ALLOWED_HOSTS"""
+        with self.settings(ALLOWED_HOSTS=['quotes.example.com']):
+            summary, output = self.replay([{'path': '/popular/'}], '--speed', '0')
+        row = summary['patterns']['popular_quotes']
+        self.assertEqual(row['statuses'], {'200': 1})
+        self.assertEqual(row['client_errors'], 0)
+
+    def test_form_bodies_and_skipped_lines(self):
+        """Test that dict bodies are posted as forms and non-request lines are skipped"""
+        summary, output = self.replay([
+            {'method': 'POST', 'path': '/add/', 'body': {
+                'text': 'Replayed new quote', 'source_name': 'Replay Source',
+                'source_type': 'BOOK', 'weight': '3',
+            }},
+            {'request_id': 'x', 'title': 'not a request'},
+            'not json',
+        ], '--speed', '0')
+
+        self.assertEqual(summary['patterns']['add_quote']['statuses'], {'302': 1})
+        self.assertEqual(summary['skipped_lines'], 2)
+        self.assertIn('Пропущено строк: 2', output)
+        self.assertTrue(Quote.objects.filter(text='Replayed new quote', weight=3).exists())
+
+    def test_malformed_headers_and_bodies_are_skipped(self):
+        """Test that wrongly typed headers or bodies skip the line instead of aborting"""
+        summary, _ = self.replay([
+            {'path': '/popular/', 'headers': ['X-Test']},
+            {'path': '/popular/', 'body': 5},
+            {'path': '/popular/', 'body': [1, 2]},
+            {'path': '/popular/', 'headers': {'X-Test': 1}},
+        ], '--speed', '0')
+
+        self.assertEqual(summary['skipped_lines'], 3)
+        self.assertEqual(summary['patterns']['popular_quotes']['requests'], 1)
+
+    def test_client_failures_are_counted_as_errors(self):
+        """Test that an exception while sending is recorded and the replay goes on"""
+        lines = [{'path': '/popular/'}] * 6
+        with mock.patch.object(InProcessSession, 'send', side_effect=RuntimeError('boom')):
+            summary, _ = self.replay(lines, '--speed', '0')
+
+        self.assertEqual(summary['patterns']['popular_quotes']['statuses'], {'0': 6})
+        self.assertEqual(summary['patterns']['popular_quotes']['errors'], 6)
+
+    def test_replay_stops_when_all_workers_die(self):
+        """Test that the reader gives up instead of blocking on a queue nobody drains"""
+        lines = [{'path': '/popular/'}] * 10
+        with mock.patch.object(InProcessSession, '__init__', side_effect=RuntimeError('no session')), \
+                mock.patch('threading.excepthook'):
+            with self.assertRaises(CommandError):
+                self.replay(lines, '--speed', '0')
+
+    def test_speed_follows_log_timestamps(self):
+        """Test that --speed scales the gaps between logged timestamps"""
+        lines = [{'ts': 0, 'path': '/popular/'}, {'ts': 0.5, 'path': '/popular/'}]
+        started = time.monotonic()
+        summary, _ = self.replay(lines, '--speed', '5')
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual(summary['patterns']['popular_quotes']['requests'], 2)
+
+
+class CatalogSnapshotTest(QuoteFixtureMixin, TestCase):
+    source_name, quote_text, quote_fields = "Snapshot Source", "Snapshot quote", {'weight': 5}
+
+    def setUp(self):
+        catalog_snapshot.reset()
+        settings_override = self.settings(QUOTES_CATALOG_SNAPSHOT=True, QUOTES_VIEW_FLUSH_INTERVAL=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(catalog_snapshot.reset)
+
+        super().setUp()
+        self.other = Quote.objects.create(text="Another snapshot quote", source=self.source)
+
+    def test_random_quote_pages_are_served_without_sql(self):
+        """Test that random quote page and JSON come from the snapshot"""
+        catalog_snapshot.sync()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('random_quote'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Книга: Snapshot Source")
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api_random_quotes'), {'n': 2})
+        payload = response.json()['quotes']
+        self.assertEqual({q['id'] for q in payload}, {self.quote.id, self.other.id})
+        self.assertEqual(payload[0]['source']['type_display'], 'Книга')
+        self.assertFalse(hasattr(QuoteRecord(1, '', None, 1, 0, 0, 0), '__dict__'))
+
+    def test_catalog_changes_are_caught_up_incrementally(self):
+        """Test that saves and deletes re-read only the changed rows"""
+        catalog_snapshot.sync()
+        new_source = Source.objects.create(name="Fresh Source", type="SONG")
+        added = Quote.objects.create(text="Fresh quote", source=new_source)
+        self.source.name = "Renamed Source"
+        self.source.save()
+        deleted_id = self.other.id
+        self.other.delete()
+
+        self.assertEqual(str(catalog_snapshot.get(added.id).source), "Песня: Fresh Source")
+        self.assertEqual(catalog_snapshot.get(self.quote.id).source.name, "Renamed Source")
+        self.assertIsNone(catalog_snapshot.get(deleted_id))
+        self.assertEqual(len(catalog_snapshot), 2)
+        self.assertEqual(catalog_snapshot.reloads, 1)
+
+    def test_votes_and_view_flushes_need_no_sql(self):
+        """Test that counters arrive through the version journal"""
+        catalog_snapshot.sync()
+        self.client.post(reverse('like_quote', args=[self.quote.id]))
+        view_counter.record(self.quote.id)
+        view_counter.flush()
+
+        with self.assertNumQueries(0):
+            record = catalog_snapshot.get(self.quote.id)
+        self.assertEqual((record.likes, record.views), (1, 1))
+        self.assertEqual(catalog_snapshot.reloads, 1)
+
+    def test_unjournaled_change_reloads_snapshot(self):
+        """Test that a bump without a change entry (e.g. bulk import) reloads everything"""
+        catalog_snapshot.sync()
+        Quote.objects.filter(pk=self.quote.pk).update(text="Bulk edited")
+        versions.bump(CATALOG)
+
+        self.assertEqual(catalog_snapshot.get(self.quote.id).text, "Bulk edited")
+        self.assertEqual(catalog_snapshot.reloads, 2)
+
+    def test_reload_does_not_block_other_threads(self):
+        """Test that while one thread reloads, others serve the old snapshot"""
+        catalog_snapshot.sync()
+        Quote.objects.filter(pk=self.quote.pk).update(text="Reloaded text")
+        versions.bump(CATALOG)
+
+        with catalog_snapshot._load_lock:
+            with self.assertNumQueries(0):
+                self.assertEqual(catalog_snapshot.get(self.quote.id).text, "Snapshot quote")
+        self.assertEqual(catalog_snapshot.get(self.quote.id).text, "Reloaded text")
+        self.assertEqual(catalog_snapshot.reloads, 2)
+
+    def test_distinct_choices_survive_concurrent_delete(self):
+        """Test that a record removed by another thread mid-pick causes no KeyError"""
+        records, sampler = catalog_snapshot.sync()
+        picks = iter([self.other.id, self.quote.id])
+
+        def sample(exclude=None):
+            quote_id = next(picks)
+            if quote_id == self.quote.id:
+                # Параллельное обновление снимка удаляет уже выбранную цитату
+                records.pop(self.other.id)
+            return quote_id
+
+        with mock.patch.object(sampler, 'sample', side_effect=sample):
+            chosen = catalog_snapshot.distinct_choices(2)
+        self.assertEqual([record.id for record in chosen], [self.other.id, self.quote.id])
+
+    def test_load_reads_sources_added_during_load(self):
+        """Test that a quote whose source appeared after the sources were read is loaded"""
+        late_source = Source.objects.create(name="Late Source", type="SONG")
+        late = Quote.objects.create(text="Late quote", source=late_source)
+        real_using = Source.objects.using
+        calls = []
+
+        def using(alias):
+            calls.append(alias)
+            queryset = real_using(alias)
+            # Первое чтение источников еще не видит новый источник
+            return queryset.exclude(pk=late_source.pk) if len(calls) == 1 else queryset
+
+        with mock.patch.object(Source.objects, 'using', side_effect=using):
+            catalog_snapshot.load()
+        self.assertEqual(str(catalog_snapshot.get(late.id).source), "Песня: Late Source")
+        self.assertEqual(len(catalog_snapshot), 3)
+
+    def test_journal_survives_page_cache_pressure(self):
+        """Test that filling the page cache does not evict journal entries"""
+        catalog_snapshot.sync()
+        self.client.post(reverse('like_quote', args=[self.quote.id]))
+        cache.set_many({f'filler:{i}': i for i in range(25000)})
+
+        self.assertEqual(catalog_snapshot.get(self.quote.id).likes, 1)
+        self.assertEqual(catalog_snapshot.reloads, 1)
+
+    def test_journal_is_a_bounded_ring(self):
+        """Test that entries overwritten by the ring are reported as missing"""
+        with self.settings(QUOTES_VERSION_JOURNAL_SIZE=4):
+            start = versions.current([COUNTERS])[COUNTERS]
+            for likes in range(6):
+                versions.bump(COUNTERS, change=(self.quote.id, likes, 0))
+            self.assertEqual(versions.changes(COUNTERS, start + 2, start + 6), [
+                (self.quote.id, likes, 0) for likes in range(2, 6)
+            ])
+            self.assertIsNone(versions.changes(COUNTERS, start + 1, start + 6))
+            self.assertIsNone(versions.changes(COUNTERS, start, start + 3))
+
+    async def test_async_choice_uses_snapshot(self):
+        """Test that the async helper picks from the snapshot"""
+        await sync_to_async(catalog_snapshot.sync)()
+        quote = await async_views.get_random_quote(exclude_id=self.quote.id)
+        self.assertIsInstance(quote, QuoteRecord)
+        self.assertEqual(quote.id, self.other.id)
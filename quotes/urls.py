@@ -1,10 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Под ASGI-сервером чтение и голосование обслуживают асинхронные версии
+read_views = async_views if getattr(settings, 'QUOTES_ASYNC_VIEWS', False) else views
 
 urlpatterns = [
-    path('', views.random_quote, name='random_quote'),
+    path('', read_views.random_quote, name='random_quote'),
     path('add/', views.add_quote, name='add_quote'),
-    path('popular/', views.popular_quotes, name='popular_quotes'),
-    path('like/<int:quote_id>/', views.like_quote, name='like_quote'),
-    path('dislike/<int:quote_id>/', views.dislike_quote, name='dislike_quote'),
-]
\ No newline at end of file
+    path('popular/', read_views.popular_quotes, name='popular_quotes'),
+    path('like/<int:quote_id>/', read_views.like_quote, name='like_quote'),
+    path('dislike/<int:quote_id>/', read_views.dislike_quote, name='dislike_quote'),
+    path('search/', views.search_quotes, name='search_quotes'),
+    path('api/search/', views.api_search_quotes, name='api_search_quotes'),
+    path('api/quotes/<int:quote_id>/', views.api_quote, name='api_quote'),
+    path('api/random/', views.api_random_quotes, name='api_random_quotes'),
+    path('export/', views.export_quotes_view, name='export_quotes'),
+    path('metrics/', views.metrics_view, name='metrics'),
+]
@@ -0,0 +1,137 @@
+"""Версии данных для ключей кэша.
+
+Вместо поиска и удаления всех затронутых записей кэша меняется номер
+версии: ключи фрагментов и страниц включают текущие версии, и старые
+записи просто перестают читаться, пока не истекут.
+
+- catalog — набор цитат и источников (добавление, правка, удаление);
+- counters — лайки и дизлайки (любой голос).
+
+Вместе с версиями хранится время последнего изменения (modified) —
+для заголовка Last-Modified.
+
+Каждое увеличение версии записывает в журнал, что именно изменилось, и
+процессы догоняют изменения других процессов по журналу, не перечитывая
+все из базы: индекс весов (quotes/sampling.py) и снимок каталога
+(QUOTES_CATALOG_SNAPSHOT, quotes/catalog.py). Для снимка же ведется
+версия views — сброс просмотров в базу.
+
+Версии лежат в кэше QUOTES_VERSION_CACHE и видны всем процессам, если
+этот кэш общий (файловый, Redis, Memcached). Журнал — кольцо из
+QUOTES_VERSION_JOURNAL_SIZE ключей на версию: число ключей не растет с
+частотой изменений, и в отдельном кэше их не вытесняют страницы и
+фрагменты.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+CATALOG = 'catalog'
+COUNTERS = 'counters'
+VIEWS = 'views'
+MODIFIED = 'modified'
+NAMES = (CATALOG, COUNTERS)
+
+# Запись журнала, после которой данные нужно перечитать целиком
+FULL = '*'
+# Больше стольких записей журнала проще перечитать данные заново
+MAX_JOURNAL_READ = 1000
+
+
+class Versions:
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'QUOTES_VERSION_CACHE', 'default')]
+
+    @property
+    def journal_timeout(self):
+        """Сколько секунд хранятся записи журнала; None — без срока"""
+        return getattr(settings, 'QUOTES_VERSION_JOURNAL_TIMEOUT', 3600)
+
+    @staticmethod
+    def key(name):
+        return f'quotes:version:{name}'
+
+    @property
+    def journal_size(self):
+        return getattr(settings, 'QUOTES_VERSION_JOURNAL_SIZE', MAX_JOURNAL_READ)
+
+    def change_key(self, name, version):
+        # Номер записи по модулю размера кольца: новые записи занимают место старых
+        return f'quotes:version:{name}:{version % self.journal_size}'
+
+    @staticmethod
+    def initial(name):
+        if name == MODIFIED:
+            return int(time.time())
+        # Если ключ вытеснен из кэша, счет начнется с нового числа, и
+        # записи, сохраненные под старыми номерами, не оживут
+        return time.time_ns() // 1000
+
+    def current(self, names=NAMES + (MODIFIED,)):
+        """Словарь {имя: версия, 'modified': unix-время} одним обращением к кэшу"""
+        keys = {self.key(name): name for name in names}
+        found = self.cache.get_many(list(keys))
+        result = {}
+        for key, name in keys.items():
+            value = found.get(key)
+            if value is None:
+                self.cache.add(key, self.initial(name), None)
+                value = self.cache.get(key)
+            result[name] = value
+        return result
+
+    async def acurrent(self, names=NAMES + (MODIFIED,)):
+        keys = {self.key(name): name for name in names}
+        found = await self.cache.aget_many(list(keys))
+        result = {}
+        for key, name in keys.items():
+            value = found.get(key)
+            if value is None:
+                await self.cache.aadd(key, self.initial(name), None)
+                value = await self.cache.aget(key)
+            result[name] = value
+        return result
+
+    def bump(self, name, change=FULL):
+        """Увеличивает версию; change попадает в журнал под новым номером"""
+        try:
+            version = self.cache.incr(self.key(name))
+        except ValueError:
+            version = self.initial(name)
+            self.cache.set(self.key(name), version, None)
+        self.cache.set(self.change_key(name, version), (version, change), self.journal_timeout)
+        self.cache.set(self.key(MODIFIED), self.initial(MODIFIED), None)
+        return version
+
+    async def abump(self, name, change=FULL):
+        try:
+            version = await self.cache.aincr(self.key(name))
+        except ValueError:
+            version = self.initial(name)
+            await self.cache.aset(self.key(name), version, None)
+        await self.cache.aset(self.change_key(name, version), (version, change), self.journal_timeout)
+        await self.cache.aset(self.key(MODIFIED), self.initial(MODIFIED), None)
+        return version
+
+    def changes(self, name, since, until):
+        """Записи журнала версий (since, until] по порядку.
+
+        None, если записей слишком много или какой-то нет — еще не
+        записана, вытеснена, перезаписана по кругу или журнал не велся.
+        """
+        if not 0 <= until - since <= min(MAX_JOURNAL_READ, self.journal_size):
+            return None
+        keys = {version: self.change_key(name, version) for version in range(since + 1, until + 1)}
+        found = self.cache.get_many(list(keys.values()))
+        entries = []
+        for version, key in keys.items():
+            stored = found.get(key)
+            if stored is None or stored[0] != version:
+                return None
+            entries.append(stored[1])
+        return entries
+
+
+versions = Versions()
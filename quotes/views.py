@@ -1,169 +1,136 @@
-import random
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
-from django.db.models import Sum
+from django.shortcuts import render, redirect
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from .models import Quote, Source
 from .forms import QuoteForm
+from .catalog import catalog_snapshot
+from .conditional import versioned
+from .counters import view_counter
+from .export import encode, export_quotes, render_lines
+from .leaderboard import leaderboard
+from .metrics import metrics
+from .page_cache import page_cache
+from .routers import pin_to_primary, reads_from_replica
+from .sampling import quote_sampler
+from .versions import COUNTERS, versions
+from .search import SearchResults
+from .visitor_votes import VisitorVotes
+from .votes import DISLIKE, LIKE, apply_vote, ledger_entry, vote_transition
 from django.core.exceptions import ValidationError
+import hmac
 import json
 from django.views.decorators.csrf import csrf_exempt
 
 def get_random_quote(exclude_id=None):
     """Вспомогательная функция для получения случайной цитаты"""
-    if not Quote.objects.exists():
-        return None
-
-    quotes_query = Quote.objects.all()
-    if exclude_id:
-        quotes_query = quotes_query.exclude(id=exclude_id)
-
-    if not quotes_query.exists():
-        return None
-
-    total_weight = quotes_query.aggregate(total=Sum('weight'))['total'] or 0
-
-    if total_weight == 0:
-        quotes = list(quotes_query)
-        return random.choice(quotes) if quotes else None
-
-    random_index = random.randint(0, total_weight - 1)
-
-    current = 0
-    for quote in quotes_query:
-        current += quote.weight
-        if current > random_index:
-            return quote
-
-    return None
-
+    if catalog_snapshot.enabled:
+        return catalog_snapshot.choice(exclude_id=exclude_id)
+    return quote_sampler.choice(exclude_id=exclude_id)
+
+def get_random_quotes(count, exclude_ids=()):
+    """Вспомогательная функция для получения нескольких разных случайных цитат"""
+    if count == 1 and len(exclude_ids) <= 1:
+        quote = get_random_quote(exclude_id=next(iter(exclude_ids), None))
+        return [quote] if quote else []
+    if catalog_snapshot.enabled:
+        return catalog_snapshot.distinct_choices(count, exclude_ids=exclude_ids)
+    return quote_sampler.distinct_choices(count, exclude_ids=exclude_ids)
+
+def quote_to_dict(quote):
+    """Сериализует цитату вместе с источником для JSON-ответов"""
+    return {
+        'id': quote.id,
+        'text': quote.text,
+        'source': {
+            'name': quote.source.name,
+            'type': quote.source.type,
+            'type_display': quote.source.get_type_display(),
+        },
+        'weight': quote.weight,
+        'views': quote.views,
+        'likes': quote.likes,
+        'dislikes': quote.dislikes,
+    }
+
+def _parse_ids(values):
+    """Разбирает ?exclude=1,2&exclude=3 в множество id"""
+    ids = set()
+    for value in values:
+        for part in value.split(','):
+            part = part.strip()
+            if part:
+                ids.add(int(part))
+    return ids
+
+@reads_from_replica
 def random_quote(request):
     # Получаем случайную цитату
     quote = get_random_quote()
 
     if quote:
-        # Увеличиваем счетчик просмотров
-        quote.views += 1
-        quote.save()
-
-        # Убедимся, что у пользователя есть сессия
-        if not request.session.session_key:
-            request.session.create()
+        # Увеличиваем счетчик просмотров: запись в базу идет пачками,
+        # а на странице показываем значение с учетом буфера
+        view_counter.record(quote.id)
+        quote.views += view_counter.pending(quote.id)
 
-        # Инициализируем user_votes если их нет
-        if 'user_votes' not in request.session:
-            request.session['user_votes'] = {}
-
-        # Получаем текущий голос пользователя для этой цитаты
-        user_votes = request.session.get('user_votes', {})
-        current_vote = user_votes.get(str(quote.id))
+        # Голос посетителя за эту цитату берем из подписанной cookie,
+        # сессия на обычном просмотре не создается
+        current_vote = VisitorVotes.from_request(request).resolve(quote.id)
 
         return render(request, 'quotes/random_quote.html', {
             'quote': quote,
             'user_has_liked': current_vote == 'like',
-            'user_has_disliked': current_vote == 'dislike'
+            'user_has_disliked': current_vote == 'dislike',
+            **page_cache.fragment_context()
         })
     else:
         return render(request, 'quotes/random_quote.html', {'quote': None})
 
+def _rate_quote(request, quote_id, action):
+    """Общая логика лайка/дизлайка: голос хранится в подписанной cookie,
+    счетчики меняются одним атомарным UPDATE"""
+    visitor_votes = VisitorVotes.from_request(request)
+    if visitor_votes.is_new:
+        visitor_votes.import_session(request)
+
+    # Получаем текущий голос для этой цитаты
+    current_vote = visitor_votes.resolve(quote_id)
+    new_vote, likes_delta, dislikes_delta, message = vote_transition(action, current_vote)
+
+    counters = apply_vote(
+        quote_id, likes_delta, dislikes_delta,
+        ledger=ledger_entry(visitor_votes.visitor_id, quote_id, new_vote)
+    )
+    if counters is None:
+        raise Http404('Цитата не найдена')
+    leaderboard.record_vote(quote_id, counters['likes'], counters['dislikes'])
+    versions.bump(COUNTERS, change=(quote_id, counters['likes'], counters['dislikes']))
+    visitor_votes.set(quote_id, new_vote)
+
+    response = JsonResponse({
+        'success': True,
+        'message': message,
+        'likes': counters['likes'],
+        'dislikes': counters['dislikes'],
+        'user_has_liked': new_vote == LIKE,
+        'user_has_disliked': new_vote == DISLIKE
+    })
+    return pin_to_primary(visitor_votes.save(response))
+
 @csrf_exempt
 def like_quote(request, quote_id):
     if request.method == 'POST':
-        quote = get_object_or_404(Quote, id=quote_id)
-
-        # Убедимся, что у пользователя есть сессия
-        if not request.session.session_key:
-            request.session.create()
-
-        # Инициализируем user_votes если их нет
-        if 'user_votes' not in request.session:
-            request.session['user_votes'] = {}
-
-        user_votes = request.session['user_votes']
-
-        # Получаем текущий голос для этой цитаты
-        current_vote = user_votes.get(str(quote_id))
-
-        if current_vote == 'like':
-            # Убираем лайк
-            quote.likes -= 1
-            del user_votes[str(quote_id)]
-            message = 'Лайк убран'
-        elif current_vote == 'dislike':
-            # Меняем дизлайк на лайк
-            quote.dislikes -= 1
-            quote.likes += 1
-            user_votes[str(quote_id)] = 'like'
-            message = 'Дизлайк изменен на лайк'
-        else:
-            # Новый лайк
-            quote.likes += 1
-            user_votes[str(quote_id)] = 'like'
-            message = 'Лайк добавлен'
-
-        # Сохраняем изменения
-        quote.save()
-        request.session['user_votes'] = user_votes
-        request.session.modified = True
-
-        return JsonResponse({
-            'success': True,
-            'message': message,
-            'likes': quote.likes,
-            'dislikes': quote.dislikes,
-            'user_has_liked': user_votes.get(str(quote_id)) == 'like',
-            'user_has_disliked': user_votes.get(str(quote_id)) == 'dislike'
-        })
+        return _rate_quote(request, quote_id, LIKE)
 
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
 @csrf_exempt
 def dislike_quote(request, quote_id):
     if request.method == 'POST':
-        quote = get_object_or_404(Quote, id=quote_id)
-
-        # Убедимся, что у пользователя есть сессия
-        if not request.session.session_key:
-            request.session.create()
-
-        # Инициализируем user_votes если их нет
-        if 'user_votes' not in request.session:
-            request.session['user_votes'] = {}
-
-        user_votes = request.session['user_votes']
-
-        # Получаем текущий голос для этой цитаты
-        current_vote = user_votes.get(str(quote_id))
-
-        if current_vote == 'dislike':
-            # Убираем дизлайк
-            quote.dislikes -= 1
-            del user_votes[str(quote_id)]
-            message = 'Дизлайк убран'
-        elif current_vote == 'like':
-            # Меняем лайк на дизлайк
-            quote.likes -= 1
-            quote.dislikes += 1
-            user_votes[str(quote_id)] = 'dislike'
-            message = 'Лайк изменен на дизлайк'
-        else:
-            # Новый дизлайк
-            quote.dislikes += 1
-            user_votes[str(quote_id)] = 'dislike'
-            message = 'Дизлайк добавлен'
-
-        # Сохраняем изменения
-        quote.save()
-        request.session['user_votes'] = user_votes
-        request.session.modified = True
-
-        return JsonResponse({
-            'success': True,
-            'message': message,
-            'likes': quote.likes,
-            'dislikes': quote.dislikes,
-            'user_has_liked': user_votes.get(str(quote_id)) == 'like',
-            'user_has_disliked': user_votes.get(str(quote_id)) == 'dislike'
-        })
+        return _rate_quote(request, quote_id, DISLIKE)
 
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
@@ -173,7 +140,7 @@ def add_quote(request):
         if form.is_valid():
             try:
                 form.save()
-                return redirect('random_quote')
+                return pin_to_primary(redirect('random_quote'))
             except ValidationError as e:
                 for error in e:
                     form.add_error(None, error)
@@ -184,6 +151,121 @@ def add_quote(request):
 
     return render(request, 'quotes/add_quote.html', {'form': form})
 
+@versioned('popular')
+@reads_from_replica
 def popular_quotes(request):
-    quotes = Quote.objects.order_by('-likes')[:10]
-    return render(request, 'quotes/popular_quotes.html', {'quotes': quotes})
+    # Страница одинакова для всех посетителей: кэшируем готовый HTML,
+    # голоса и правки каталога меняют версию в ключе
+    html = page_cache.get_or_render('popular', lambda: render_to_string(
+        'quotes/popular_quotes.html', {'quotes': leaderboard.top()}
+    ))
+    return HttpResponse(html)
+
+def _search_paginator(request):
+    """Запрос из ?q= и пагинатор по ранжированным результатам"""
+    query = request.GET.get('q', '').strip()[:200]
+    if not query:
+        return query, None
+    per_page = getattr(settings, 'QUOTES_SEARCH_PAGE_SIZE', 20)
+    return query, Paginator(SearchResults(query), per_page)
+
+def search_quotes(request):
+    query, paginator = _search_paginator(request)
+    page = paginator.get_page(request.GET.get('page')) if paginator else None
+    return render(request, 'quotes/search.html', {'query': query, 'page': page})
+
+@versioned('search')
+def api_search_quotes(request):
+    """JSON с результатами поиска: ?q= — запрос, ?page= — номер страницы"""
+    query, paginator = _search_paginator(request)
+    if paginator is None:
+        return JsonResponse({'success': False, 'message': 'Пустой поисковый запрос'}, status=400)
+    try:
+        page = paginator.page(request.GET.get('page') or 1)
+    except InvalidPage:
+        return JsonResponse({'success': False, 'message': 'Нет такой страницы'}, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'query': query,
+        'page': page.number,
+        'num_pages': paginator.num_pages,
+        'count': paginator.count,
+        'quotes': [quote_to_dict(quote) for quote in page],
+    })
+
+@versioned('quote')
+@reads_from_replica
+def api_quote(request, quote_id):
+    """JSON одной цитаты; клиенты и CDN перепроверяют ее по ETag"""
+    quote = Quote.objects.select_related('source').filter(pk=quote_id).first()
+    if quote is None:
+        return JsonResponse({'success': False, 'message': 'Цитата не найдена'}, status=404)
+    quote.views += view_counter.pending(quote.id)
+    return JsonResponse({'success': True, 'quote': quote_to_dict(quote)})
+
+@reads_from_replica
+def api_random_quotes(request):
+    """JSON со случайными цитатами: ?n= — размер пачки, ?exclude= — id для пропуска"""
+    max_batch = getattr(settings, 'QUOTES_API_MAX_BATCH', 50)
+    try:
+        count = int(request.GET.get('n', 1))
+        exclude_ids = _parse_ids(request.GET.getlist('exclude'))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Некорректные параметры n или exclude'}, status=400)
+
+    if not 1 <= count <= max_batch:
+        return JsonResponse(
+            {'success': False, 'message': f'Параметр n должен быть от 1 до {max_batch}'},
+            status=400
+        )
+
+    quotes = get_random_quotes(count, exclude_ids)
+    payload = []
+    for quote in quotes:
+        view_counter.record(quote.id)
+        quote.views += view_counter.pending(quote.id)
+        payload.append(quote_to_dict(quote))
+
+    return JsonResponse({'success': True, 'quotes': payload})
+
+@staff_member_required
+def export_quotes_view(request):
+    """Потоковая выгрузка каталога: ?format=csv|jsonl, ?after_id=, ?gzip=1"""
+    fmt = 'csv' if request.GET.get('format') == 'csv' else 'jsonl'
+    compress = request.GET.get('gzip') == '1'
+    try:
+        after_id = int(request.GET.get('after_id') or 0)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Некорректный after_id'}, status=400)
+
+    rows = export_quotes(after_id=after_id)
+    if compress:
+        # Сам файл .gz, а не сжатие при передаче: без Content-Encoding
+        # браузер и curl --compressed сохранят его как есть
+        content_type = 'application/gzip'
+    else:
+        content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson; charset=utf-8'
+    response = StreamingHttpResponse(
+        encode(render_lines(rows, fmt, header=not after_id), compress=compress),
+        content_type=content_type,
+    )
+    filename = f'quotes.{fmt}' + ('.gz' if compress else '')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def can_read_metrics(request):
+    """Персонал, сборщик с токеном QUOTES_METRICS_TOKEN или адрес из списка"""
+    if request.user.is_staff:
+        return True
+    token = getattr(settings, 'QUOTES_METRICS_TOKEN', '')
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'QUOTES_METRICS_ALLOWED_IPS', [])
+
+def metrics_view(request):
+    """Метрики процесса в текстовом формате Prometheus"""
+    if not can_read_metrics(request):
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,136 @@
+import secrets
+
+from django.conf import settings
+
+from .models import Vote
+from .routers import PRIMARY
+from .votes import DISLIKE, LIKE, arecord_votes, ledger_entry, record_votes
+
+# Однобуквенные коды голосов в cookie
+CODES = {LIKE: 'L', DISLIKE: 'D'}
+VOTES = {code: vote for vote, code in CODES.items()}
+# Голос из журнала Vote
+LEDGER_VOTES = {Vote.LIKE: LIKE, Vote.DISLIKE: DISLIKE}
+# Метка в начале списка: часть голосов вытеснена из cookie
+EVICTED = '~'
+
+
+class VisitorVotes:
+    """Голоса посетителя в подписанной cookie вместо сессии в базе.
+
+    Формат значения: «<токен посетителя>|12L,15D,...». Хранятся только
+    последние QUOTES_VOTE_COOKIE_MAX голосов, чтобы cookie оставалась
+    меньше 4 КБ; более старые вытесняются, а в cookie ставится метка «~».
+    С меткой голос, которого нет в cookie, ищется в журнале Vote по токену
+    посетителя (resolve), иначе повторный голос посчитался бы дважды.
+    """
+
+    cookie_name = 'quote_votes'
+    salt = 'quotes.visitor_votes'
+
+    def __init__(self, visitor_id=None, votes=None, evicted=False):
+        self.visitor_id = visitor_id or secrets.token_urlsafe(12)
+        self.votes = dict(votes or {})
+        self.evicted = evicted
+        self.is_new = visitor_id is None
+        self.changed = self.is_new
+
+    @property
+    def max_votes(self):
+        return getattr(settings, 'QUOTES_VOTE_COOKIE_MAX', 300)
+
+    @classmethod
+    def from_request(cls, request):
+        raw = request.get_signed_cookie(cls.cookie_name, default=None, salt=cls.salt)
+        if not raw:
+            return cls()
+        try:
+            return cls.loads(raw)
+        except (KeyError, ValueError):
+            return cls()
+
+    @classmethod
+    def loads(cls, raw):
+        visitor_id, _, payload = raw.partition('|')
+        if not visitor_id:
+            raise ValueError('Нет токена посетителя')
+        evicted = payload.startswith(EVICTED)
+        votes = {}
+        for item in filter(None, payload.removeprefix(EVICTED).split(',')):
+            votes[int(item[:-1])] = VOTES[item[-1]]
+        return cls(visitor_id, votes, evicted)
+
+    def dumps(self):
+        payload = ','.join(f'{quote_id}{CODES[vote]}' for quote_id, vote in self.votes.items())
+        return f'{self.visitor_id}|{EVICTED if self.evicted else ""}{payload}'
+
+    def get(self, quote_id):
+        """Голос из cookie, без обращения к базе"""
+        return self.votes.get(int(quote_id))
+
+    def _ledger(self, quote_id):
+        return Vote.objects.using(PRIMARY).filter(
+            visitor=self.visitor_id, quote_id=quote_id
+        ).values_list('value', flat=True)
+
+    def resolve(self, quote_id):
+        """Голос с учетом вытесненных: если cookie переполнялась, голоса,
+        которого в ней нет, ищем в журнале"""
+        quote_id = int(quote_id)
+        if quote_id in self.votes or not self.evicted:
+            return self.votes.get(quote_id)
+        return LEDGER_VOTES.get(self._ledger(quote_id).first())
+
+    async def aresolve(self, quote_id):
+        quote_id = int(quote_id)
+        if quote_id in self.votes or not self.evicted:
+            return self.votes.get(quote_id)
+        return LEDGER_VOTES.get(await self._ledger(quote_id).afirst())
+
+    def set(self, quote_id, vote):
+        """Запоминает голос (None — снять голос); свежие голоса идут в конец"""
+        quote_id = int(quote_id)
+        self.votes.pop(quote_id, None)
+        if vote:
+            self.votes[quote_id] = vote
+            while len(self.votes) > self.max_votes:
+                del self.votes[next(iter(self.votes))]
+                self.evicted = True
+        self.changed = True
+
+    def _import(self, legacy):
+        """Голоса из сессии попадают и в журнал: вытесненные из cookie
+        потом найдутся только там"""
+        imported = {}
+        for quote_id, vote in (legacy or {}).items():
+            if vote in CODES and int(quote_id) not in self.votes:
+                self.set(quote_id, vote)
+                imported[int(quote_id)] = vote
+        return [ledger_entry(self.visitor_id, quote_id, vote) for quote_id, vote in imported.items()]
+
+    def import_session(self, request):
+        """Переносит голоса из старой сессионной схемы (user_votes в сессии)"""
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return
+        entries = self._import(request.session.pop('user_votes', None))
+        if entries:
+            record_votes(entries)
+
+    async def aimport_session(self, request):
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return
+        entries = self._import(await request.session.apop('user_votes', None))
+        if entries:
+            await arecord_votes(entries)
+
+    def save(self, response):
+        if self.changed:
+            response.set_signed_cookie(
+                self.cookie_name,
+                self.dumps(),
+                salt=self.salt,
+                max_age=getattr(settings, 'QUOTES_VOTE_COOKIE_AGE', 60 * 60 * 24 * 365),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,115 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Quote, Vote
+
+LIKE = 'like'
+DISLIKE = 'dislike'
+
+# Значение голоса в журнале Vote
+LEDGER_VALUES = {LIKE: Vote.LIKE, DISLIKE: Vote.DISLIKE, None: Vote.NONE}
+
+# Сообщения для каждого перехода (действие, текущий голос)
+MESSAGES = {
+    (LIKE, LIKE): 'Лайк убран',
+    (LIKE, DISLIKE): 'Дизлайк изменен на лайк',
+    (LIKE, None): 'Лайк добавлен',
+    (DISLIKE, DISLIKE): 'Дизлайк убран',
+    (DISLIKE, LIKE): 'Лайк изменен на дизлайк',
+    (DISLIKE, None): 'Дизлайк добавлен',
+}
+
+
+def vote_transition(action, current_vote):
+    """Вычисляет новый голос и изменения счетчиков для нажатия кнопки.
+
+    Повторное нажатие снимает голос, нажатие противоположной кнопки
+    переключает его. Возвращает (новый голос, Δlikes, Δdislikes, сообщение).
+    """
+    if current_vote not in (LIKE, DISLIKE):
+        current_vote = None
+
+    deltas = {LIKE: 0, DISLIKE: 0}
+    if current_vote == action:
+        new_vote = None
+        deltas[action] -= 1
+    else:
+        new_vote = action
+        deltas[action] += 1
+        if current_vote:
+            deltas[current_vote] -= 1
+
+    return new_vote, deltas[LIKE], deltas[DISLIKE], MESSAGES[(action, current_vote)]
+
+
+def _vote_changes(likes_delta, dislikes_delta):
+    changes = {}
+    for field, delta in (('likes', likes_delta), ('dislikes', dislikes_delta)):
+        if delta > 0:
+            changes[field] = F(field) + delta
+        elif delta < 0:
+            changes[field] = Greatest(F(field) + delta, 0)
+    return changes
+
+
+def ledger_entry(visitor, quote_id, vote):
+    return Vote(visitor=visitor, quote_id=quote_id, value=LEDGER_VALUES[vote])
+
+
+def record_votes(entries, batch_size=500):
+    """Пишет пачку голосов в журнал одним INSERT ... ON CONFLICT DO UPDATE"""
+    return Vote.objects.bulk_create(
+        entries,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['visitor', 'quote'],
+        update_fields=['value', 'updated_at'],
+    )
+
+
+async def arecord_votes(entries, batch_size=500):
+    return await Vote.objects.abulk_create(
+        entries,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['visitor', 'quote'],
+        update_fields=['value', 'updated_at'],
+    )
+
+
+def apply_vote(quote_id, likes_delta, dislikes_delta, ledger=None):
+    """Атомарно меняет счетчики одним UPDATE с F()-выражениями.
+
+    Не вызывает Quote.save()/clean() и не теряет голоса при параллельных
+    запросах. Счетчики не опускаются ниже нуля. Если передана запись
+    журнала (ledger_entry), она пишется в той же транзакции. Возвращает
+    словарь со свежими значениями likes/dislikes или None, если цитаты нет.
+    """
+    changes = _vote_changes(likes_delta, dislikes_delta)
+    quotes = Quote.objects.filter(pk=quote_id)
+    with transaction.atomic():
+        if changes and not quotes.update(**changes):
+            return None
+        for counters in quotes.values('likes', 'dislikes'):
+            if ledger is not None:
+                record_votes([ledger])
+            return counters
+    return None
+
+
+async def aapply_vote(quote_id, likes_delta, dislikes_delta, ledger=None):
+    """Асинхронный вариант apply_vote() на aupdate()/async-итерации.
+
+    Без общей транзакции: прочитанные счетчики могут уже включать
+    параллельные голоса, но сами изменения по-прежнему атомарны.
+    """
+    changes = _vote_changes(likes_delta, dislikes_delta)
+    quotes = Quote.objects.filter(pk=quote_id)
+    if changes and not await quotes.aupdate(**changes):
+        return None
+    async for counters in quotes.values('likes', 'dislikes'):
+        if ledger is not None:
+            await arecord_votes([ledger])
+        return counters
+    return None